@@ -0,0 +1,430 @@
+import argparse
+from dataclasses import replace
+from engine import GameEngine
+from globals import GRID_DIMS
+import json
+import platform
+from statistics import median
+import subprocess
+from time import perf_counter, strftime
+
+# Microbenchmarks of the engine and renderer hot paths, on fixed seeds and fixed boards so results are comparable between commits
+# e.g. python bench.py run -o before.json, (change something), python bench.py run -o after.json, python bench.py compare before.json after.json
+
+# Seed of every benchmarked game
+SEED = 0
+
+# Boards the benchmarks are run on, top row first, '.' is empty and any other character is the type of piece in that tile
+BOARDS = {
+    'empty': [],
+    # A mid-game stack with overhangs, holes and a well
+    'stack': [
+        '.....T....',
+        '....TTT...',
+        'JJ.....SS.',
+        'J...ZZSS..',
+        'J.O.OZZIII',
+        'LLLOO.TTTI',
+        'LIIIIJJT.I',
+        '.ZZSSJ.OOI',
+        'OO.ZZJ.OOI',
+        'OOLLLTTT.I',
+    ],
+    # Four rows that are full except the rightmost column, cleared by a vertical I piece
+    'tetris': [
+        '..........',
+        'JJ........',
+        'JLLL.SS...',
+        'JLOOSSZZ..',
+        'IIIIOOTZZ.',
+        'SSJJJTTTZ.',
+        'LSSOOJJTZ.',
+        'LLLOOJJTT.',
+    ],
+    # A T-Spin double, cleared by a T piece pointing down into the gap
+    'tspin': [
+        'OO........',
+        'III..ZZJJJ',
+        'SS...JJJLJ',
+        'SSS.LLLTZZ',
+    ],
+}
+
+
+# Replaces the board of a game with one of BOARDS (the heights, holes and grid are all updated)
+def load_board(game: GameEngine, board: list[str]):
+    for row in range(GRID_DIMS[1]):
+        line = board[len(board) - row - 1] if row < len(board) else '.' * GRID_DIMS[0]
+        game.grid[row] = tuple('' if tile == '.' else tile for tile in line)
+        game.rows[row] = sum(1 << column for column, tile in enumerate(line) if tile != '.')
+    # update_heights() only checks rows below the highest column
+    game.heights[0] = GRID_DIMS[1]
+    game.update_heights()
+    game.full_redraw = True
+
+
+# A game with a fixed seed on one of BOARDS, with the active piece spawned as the given type
+def create_game(board: str, type: str) -> GameEngine:
+    game = GameEngine(seed=SEED)
+    game.setup()
+    load_board(game, BOARDS[board])
+    spawn(game, type)
+    return game
+
+
+# Spawns the given type of piece as the active piece
+def spawn(game: GameEngine, type: str):
+    game.randomizer.queue.appendleft(type)
+    game.spawn_piece(False)
+
+
+# State changed by placing a piece, see place_fixture()
+def snapshot(game: GameEngine) -> tuple:
+    return (list(game.rows), list(game.grid), list(game.heights), list(game.holes), replace(game.stats),
+            game.combo, game.back_to_back_bonus)
+
+
+def restore(game: GameEngine, state: tuple):
+    rows, grid, heights, holes, stats, game.combo, game.back_to_back_bonus = state
+    game.rows[:] = rows
+    game.grid[:] = grid
+    game.heights[:] = heights
+    game.holes[:] = holes
+    game.stats = replace(stats, clears=list(stats.clears), t_spin=list(stats.t_spin), mini_t_spin=list(stats.mini_t_spin))
+
+
+# Benchmarks return (run, prepare), run does the measured operation (which may call ops methods, see BENCHMARKS),
+# prepare is called before every run without being timed, or is None if run can be repeated without resetting anything
+
+def bench_is_valid_pos():
+    game = create_game('stack', 'T')
+    tiles = game.active_piece.tiles
+    return lambda: game.is_valid_pos(tiles), None
+
+
+# Moves the piece left and back, the piece never locks because the engine isn't ticked
+def bench_move_tiles():
+    game = create_game('stack', 'T')
+
+    def run():
+        game.move_tiles(-1, 0)
+        game.move_tiles(1, 0)
+    return run, None
+
+
+# Rotates counter-clockwise and back with the T piece in a gap of the stack, both rotations need a wall kick
+def bench_rotate_active():
+    game = create_game('stack', 'T')
+    game.set_position(2, 6, 0)
+
+    def run():
+        game.rotate_active(-1)
+        game.rotate_active(1)
+    return run, None
+
+
+def bench_rotate_flip():
+    game = create_game('stack', 'T')
+
+    def run():
+        game.press('rotate_flip')
+        game.press('rotate_flip')
+
+    # press() records every input, clear them so the recording doesn't grow for the whole benchmark
+    def prepare():
+        game.recording.inputs.clear()
+    return run, prepare
+
+
+# The piece is moved to a column between each update so the ghost lands somewhere else on the stack
+def bench_update_ghost():
+    game = create_game('stack', 'L')
+    columns = [x for x in range(GRID_DIMS[0]) if game.shape_fits(game.active_piece.shape, x, game.active_piece.y)]
+    game.set_position(columns[0], game.active_piece.y, 0)
+
+    def run():
+        for x in columns:
+            game.active_piece.x = x
+            game.update_ghost()
+    return run, None
+
+
+# Line clear, scoring and removing the cleared rows after the piece was added to the board (i.e. the end of place_piece())
+def place_fixture(board: str, type: str, x: int, y: int, rotation: int, rotation_point: int):
+    game = create_game(board, type)
+    game.set_position(x, y, rotation)
+    game.active_piece.rotation_point = rotation_point
+    game.update_ghost()
+    ghost = game.ghost
+    for dy, mask in ghost.shape.masks[ghost.x]:
+        row = ghost.y + dy
+        game.grid[row] = tuple(type if mask >> column & 1 else tile for column, tile in enumerate(game.grid[row]))
+        game.rows[row] |= mask
+    rows = [ghost.y + dy for dy, mask in ghost.shape.masks[ghost.x]]
+    state = snapshot(game)
+
+    def run():
+        game.iterate(rows)
+        game.score()
+        game.eliminate()
+    return run, lambda: restore(game, state)
+
+
+def bench_clear_tetris():
+    return place_fixture('tetris', 'I', 9, 5, 1, -1)
+
+
+def bench_clear_tspin():
+    return place_fixture('tspin', 'T', 3, 1, 2, 0)
+
+
+# Spawning the next piece, which also updates the preview (what happens after every piece is placed)
+# The randomizer keeps generating pieces, so this includes the cost of the randomizer
+def bench_spawn_piece():
+    game = create_game('stack', 'T')
+    return lambda: game.spawn_piece(False), None
+
+
+# Errors that mean the renderer can't run here: no display or monitors were found, or no OpenGL context could be created
+# These are matched by name, the classes depend on the platform and the pyglet version (and importing arcade can raise them)
+DISPLAY_ERRORS = ('NoSuchDisplayException', 'ScreenInfoError', 'NoSuchConfigException', 'ContextException')
+
+
+# The renderer's benchmarks use a hidden window (arcade is imported here so the engine benchmarks work without it or a display)
+# Set PYGLET_HEADLESS=1 to render without a display server
+def render_window():
+    import main
+
+    window = main.MyGame(visible=False)
+    # Don't probe the monitors in the background on the first frame
+    window.cached_window_size = None
+    window.on_resize(*window.get_size())
+    window.setup()
+    # The benchmarks don't play a game, so nothing is saved
+    window.replay_writer.discard()
+    load_board(window.engine, BOARDS['stack'])
+    spawn(window.engine, 'T')
+    window.redraw_grid()
+    return window
+
+
+# Recolors every tile (e.g. after a restart or a resize)
+def bench_redraw_grid_full():
+    window = render_window()
+
+    def run():
+        window.redraw_all = True
+        window.redraw_grid()
+    return run, None
+
+
+# Recolors the tiles that changed after moving the piece, the usual case
+def bench_redraw_grid_move():
+    window = render_window()
+    game = window.engine
+    direction = [1]
+
+    def run():
+        if not game.move_tiles(direction[0], 0):
+            direction[0] = -direction[0]
+            game.move_tiles(direction[0], 0)
+        game.update_ghost()
+        window.redraw_grid()
+    return run, None
+
+
+# A whole frame (on_draw()) where nothing changed, waits for the GPU to finish so the time includes drawing, not only submitting it
+def bench_draw_frame():
+    window = render_window()
+    # The first frame creates the GPU buffers and lays out the text
+    window.on_draw()
+
+    def run():
+        window.on_draw()
+        window.ctx.finish()
+    return run, None
+
+
+# A whole frame where the score changed (e.g. every frame while soft dropping), so the score text is laid out again
+def bench_draw_frame_score():
+    window = render_window()
+    stats = window.engine.stats
+    window.on_draw()
+
+    def run():
+        stats.score += 1
+        window.on_draw()
+        window.ctx.finish()
+    return run, None
+
+
+# The score and Hold labels (the hold is empty) on a frame where nothing changed, the usual case
+def bench_draw_labels():
+    window = render_window()
+    window.draw_labels()
+
+    def run():
+        window.draw_labels()
+        window.ctx.finish()
+    return run, None
+
+
+# The labels on a frame where the score changed, so the score is laid out again
+def bench_draw_labels_score():
+    window = render_window()
+    stats = window.engine.stats
+    window.draw_labels()
+
+    def run():
+        stats.score += 1
+        window.draw_labels()
+        window.ctx.finish()
+    return run, None
+
+
+# name: (function, number of times the operation is done by each run, so results are per operation)
+BENCHMARKS = {
+    'is_valid_pos': (bench_is_valid_pos, 1),
+    'move_tiles': (bench_move_tiles, 2),
+    'rotate_active': (bench_rotate_active, 2),
+    'rotate_flip': (bench_rotate_flip, 2),
+    'update_ghost': (bench_update_ghost, 7),
+    'clear_tetris': (bench_clear_tetris, 1),
+    'clear_tspin': (bench_clear_tspin, 1),
+    'spawn_piece': (bench_spawn_piece, 1),
+    'redraw_grid_full': (bench_redraw_grid_full, 1),
+    'redraw_grid_move': (bench_redraw_grid_move, 1),
+    'draw_frame': (bench_draw_frame, 1),
+    'draw_frame_score': (bench_draw_frame_score, 1),
+    'draw_labels': (bench_draw_labels, 1),
+    'draw_labels_score': (bench_draw_labels_score, 1),
+}
+
+
+# Times run() (like timeit), the number of runs per repeat is doubled until a repeat takes at least min_time
+# Returns the time of each repeat divided by the number of runs
+def measure(run, prepare, repeat: int, min_time: float) -> tuple[list[float], int]:
+    def timed(loops: int) -> float:
+        if prepare is None:
+            start = perf_counter()
+            for i in range(loops):
+                run()
+            return perf_counter() - start
+
+        total = 0.0
+        for i in range(loops):
+            prepare()
+            start = perf_counter()
+            run()
+            total += perf_counter() - start
+        return total
+
+    loops = 1
+    while timed(loops) < min_time:
+        loops *= 2
+    return [timed(loops) / loops for i in range(repeat)], loops
+
+
+# Short hash of the checked out commit, if this is a git repository
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names: list[str], repeat: int, min_time: float) -> dict:
+    results = {
+        'date': strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': {},
+        'skipped': {},
+    }
+    for name in names:
+        function, ops = BENCHMARKS[name]
+        try:
+            run, prepare = function()
+        # The render benchmarks can't run without arcade or a display, any other error is a bug in the benchmark
+        except Exception as ex:
+            if not isinstance(ex, ImportError) and type(ex).__name__ not in DISPLAY_ERRORS:
+                raise
+            results['skipped'][name] = f'{type(ex).__name__}: {ex}'
+            print(f'{name:<18}skipped ({results["skipped"][name]})')
+            continue
+
+        times, loops = measure(run, prepare, repeat, min_time)
+        times = [time / ops for time in times]
+        results['benchmarks'][name] = {'min': min(times), 'median': median(times), 'max': max(times), 'loops': loops, 'repeat': repeat}
+        print(f'{name:<18}{min(times) * 1e6:10.3f} us  (median {median(times) * 1e6:.3f} us, {loops} loops x {repeat})', flush=True)
+    return results
+
+
+# Prints the change of each benchmark between two result files, returns the names of the ones that got slower by more than threshold
+# and the ones missing from the new results (e.g. skipped, a benchmark that can't run can't show it isn't slower)
+def compare(old: dict, new: dict, threshold: float, statistic: str) -> list[str]:
+    print(f'{old.get("commit") or "old"} -> {new.get("commit") or "new"} ({statistic}, threshold {threshold:.0%})')
+    regressions = []
+    for name, result in new['benchmarks'].items():
+        if name not in old['benchmarks']:
+            print(f'{name:<18}{result[statistic] * 1e6:10.3f} us  (new)')
+            continue
+        before, after = old['benchmarks'][name][statistic], result[statistic]
+        change = after / before - 1
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = 'faster'
+        else:
+            flag = ''
+        print(f'{name:<18}{before * 1e6:10.3f} -> {after * 1e6:10.3f} us  {change:+7.1%}  {flag}')
+    for name in old['benchmarks']:
+        if name not in new['benchmarks']:
+            reason = new.get('skipped', {}).get(name)
+            print(f'{name:<18}MISSING from the new results' + (f' (skipped: {reason})' if reason else ''))
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Pytris engine and renderer and compare results between versions')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('names', nargs='*', help=f'benchmarks to run (default: all): {", ".join(BENCHMARKS)}')
+    run_parser.add_argument('-o', '--output', help='save the results to this file as JSON')
+    run_parser.add_argument('-r', '--repeat', type=int, default=7, help='number of times each benchmark is timed')
+    run_parser.add_argument('--min-time', type=float, default=0.05, help='minimum seconds per repeat')
+
+    compare_parser = commands.add_parser('compare', help='compare two result files, exits with 1 if any benchmark is slower by more than the threshold or missing from the new results')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('-t', '--threshold', type=float, default=0.1, help='relative slowdown that counts as a regression (default: 0.1)')
+    compare_parser.add_argument('--statistic', choices=['min', 'median'], default='min')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        for name in args.names:
+            if name not in BENCHMARKS:
+                parser.error(f'unknown benchmark: {name}')
+        results = run_benchmarks(args.names or list(BENCHMARKS), args.repeat, args.min_time)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(results, file, indent=2)
+            print(f'Results saved to {args.output}')
+
+    else:
+        with open(args.old, 'r') as file:
+            old = json.load(file)
+        with open(args.new, 'r') as file:
+            new = json.load(file)
+        regressions = compare(old, new, args.threshold, args.statistic)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) or missing benchmark(s): {", ".join(regressions)}')
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1021 @@
+from bisect import bisect_right
+from collections import deque
+from globals import (ActivePiece, ATTACK_DATA, BoardDelta, CENTER_SPAWN, Changes, EMPTY_ROW, EngineState, FULL_ROW, game_statistics, GamePhase,
+                     GARBAGE_TILE, GhostPiece, GRID_DIMS, Handling, HANDLING_SETTINGS, INFO_CENTER_SPAWN, INFO_GRID_DIMS, LOCK_DELAY, MAX_LEVEL, MAX_LOCK_RESET, MAX_UPDATE_TIME,
+                     Placement, PREVIEW_COUNT, Recording, RENDERED_GRID_HEIGHT, REWIND_TIME, SCORE_DATA, Snapshot, SPAWN_POSITIONS,
+                     TICK_RATE)
+from dataclasses import asdict
+from random import randrange
+from randomizer import DEFAULT_RANDOMIZER, RANDOMIZERS
+from search import find_placements
+from srs import ROTATIONS, SHAPES
+
+
+# Game rules without any rendering, MyGame (main.py) draws the state stored here
+# This module must not import arcade/pyglet so that games can be simulated without a display
+class GameEngine:
+    def __init__(self, settings=None, game_over_callback=None, seed: int = None, tick_rate: int = TICK_RATE,
+                 randomizer: str = DEFAULT_RANDOMIZER, practice: bool = False):
+        # Only the handling settings (delayed_auto_shift, auto_repeat_rate, drop_auto_repeat_rate) are used by the engine
+        self.settings = settings if settings is not None else Handling()
+
+        # Called with the reason when the game ends (e.g. to print and save scores)
+        self.game_over_callback = game_over_callback
+
+        # Seed for the piece order, if None, every game (including restarts) gets a new random seed
+        self.seed = seed
+        # Name of the randomizer that decides the piece order (see randomizer.RANDOMIZERS)
+        self.randomizer_name = randomizer
+        # Practice mode allows undo, redo and rewind (see undo())
+        self.practice = practice
+
+        # The game advances in fixed steps of 1 / tick_rate seconds (see update() and tick())
+        self.tick_rate = tick_rate
+        self.tick_time = 1 / tick_rate
+
+        # Create the main grid (stores the type of piece in each tile, used for colors)
+        # Rows are tuples, a row that changes is replaced, so snapshots (see take_snapshot()) share every row that didn't change
+        self.grid = [EMPTY_ROW] * GRID_DIMS[1]
+
+        # Occupancy of the main grid, one bitmask per row (bit x is set when column x is occupied)
+        # This is what collision and line clear checks use, self.grid is only needed for colors
+        self.rows = [0] * GRID_DIMS[1]
+
+        # Index of the row above the highest occupied tile in each column (0 if the column is empty)
+        self.heights = [0] * GRID_DIMS[0]
+        # Number of empty tiles below the height of each column (i.e. tiles covered by an overhang)
+        self.holes = [0] * GRID_DIMS[0]
+
+        # The next PREVIEW_COUNT pieces (see update_preview())
+        self.preview = ()
+
+        # Create the hold grid
+        self.hold_grid = self.create_grid(INFO_GRID_DIMS, 'background')
+
+        # Create object to store ghost tiles (indicates where a piece will be dropped on a hard drop)
+        # The shape is set when the first piece spawns
+        self.ghost = GhostPiece(0, 0, None)
+
+        self.game_phase = GamePhase
+        self.fall_while_locking = False
+
+        # Actions that are currently held down (e.g. 'move_left'), used for ARR, DAS and drop_ARR
+        self.held_actions = set()
+
+        # (timestamp, action, True if pressed or False if released) of inputs that have not been applied yet (see queue_input())
+        self.input_queue = deque()
+        # If this is set to a list (or deque), the time between each queued input and the update that applied it is appended to it
+        self.input_latencies = None
+
+        # If this is set, it is called with a BoardDelta after each piece is placed (used to send the board to opponents in versus mode)
+        self.placement_callback = None
+        # Restarting (or unpausing after the game ended, which restarts) is disabled during versus matches, the server's copy of the
+        # board would no longer match the game (see main.py)
+        self.allow_restart = True
+
+        # Tracks what has changed since collect_changes() was last called, so the renderer only updates those tiles
+        # Rows of the main grid where placed tiles changed
+        self.dirty_rows = set()
+        self.preview_changed = False
+        self.hold_changed = False
+        self.full_redraw = True
+        # (type, x, y, shape) of the active piece and ghost when collect_changes() was last called
+        self.drawn_piece = None
+        self.drawn_ghost = None
+
+    def create_grid(self, size: list[int], default_value) -> list[list[int]]:
+        # Create a grid of strings that represent the type of piece occupying a tile (for determining the color), empty strings represent an empty tile
+        grid = []
+        for row in range(size[1]):
+            grid.append([])
+            for column in range(size[0]):
+                grid[row].append(default_value)
+        return grid
+
+    # Called at the beginning and when the restart action is used
+    def setup(self):
+
+        self.game_phase = GamePhase.GENERATION
+
+        # Each game has its own randomizer (with its own random number generator) so that it can be reproduced from its seed
+        self.game_seed = self.seed if self.seed is not None else randrange(2 ** 32)
+        self.randomizer = RANDOMIZERS[self.randomizer_name](self.game_seed)
+        # Only practice games go back to earlier pieces (see restore_snapshot())
+        self.randomizer.keep_history = self.practice
+
+        # Records the inputs of this game and the tick they happened on so it can be replayed (see recording.py)
+        self.recording = Recording(
+            self.game_seed,
+            {key: getattr(self.settings, key) for key in HANDLING_SETTINGS},
+            self.tick_rate, sorted(self.held_actions), [], randomizer=self.randomizer_name, practice=self.practice)
+        # Time (in ticks) that has passed but has not been simulated yet
+        self.accumulator = 0.0
+
+        # Determines if the player can swap the active piece with their hold
+        self.hold_ready = True
+        self.active_piece = ActivePiece('', 0, 0, 0, None, GRID_DIMS[1], 0, -1)
+
+        self.fall_interval = 1
+        self.cur_time = 0
+        self.hold = ''
+        self.back_to_back_bonus = False
+        # Stores the most recent move_left or move_right action (determines which direction the piece should move if both are held)
+        # Value is the direction the block would move in
+        self.last_horizontal_key = 0
+
+        # Clear main grid
+        for i in range(GRID_DIMS[1]):
+            self.grid[i] = EMPTY_ROW
+            self.rows[i] = 0
+        for i in range(GRID_DIMS[0]):
+            self.heights[i] = 0
+            self.holes[i] = 0
+
+        # Clear Hold grid
+        for i in range(INFO_GRID_DIMS[1]):
+            for j in range(INFO_GRID_DIMS[0]):
+                self.hold_grid[i][j] = 'background'
+
+        self.timers = {
+            # Time until the active piece will move down automatically
+            'fall': self.fall_interval,
+            # Time until the active piece will move down while the down key is pressed
+            'drop_ARR': 0.0,
+            # Auto Repeat Rate
+            'ARR': 0.0,
+            # Delayed Auto Shift
+            'DAS': 0.0
+        }
+        self.paused = False
+        self.game_ended = False
+        self.game_over_reason = ''
+        self.stats = game_statistics(0, [0, 0, 0, 0], 0, 1, [0, 0, 0, 0], [0, 0])
+        self.combo = 0
+        self.pieces_placed = 0
+
+        # Versus mode (see versus.py), [lines, hole column] of each garbage received that hasn't been added yet
+        self.pending_garbage = deque()
+        # '', 't_spin' or 'mini_t_spin' for the last placed piece (set by score())
+        self.spin = ''
+        # Combo and back-to-back used for attacks (see attack()), these are separate from the scoring ones so they don't affect scores
+        self.attack_combo = 0
+        self.attack_back_to_back = False
+        self.full_redraw = True
+
+        # Practice mode, a Snapshot of the game before each piece spawned (the last one is the active piece's), and the ones undo() went back from
+        self.undo_stack = []
+        self.redo_stack = []
+        if self.practice:
+            self.take_snapshot()
+
+        # Spawn the first piece (this also fills the preview)
+        self.spawn_piece(False)
+
+    # Replaces the settings during a game (e.g. when the config is reloaded), changes to the handling settings are recorded
+    # so the game can still be replayed exactly
+    def set_settings(self, settings):
+        handling = {key: getattr(settings, key) for key in HANDLING_SETTINGS}
+        if handling != {key: getattr(self.settings, key) for key in HANDLING_SETTINGS}:
+            self.recording.handling_changes.append((self.recording.ticks, handling))
+        self.settings = settings
+
+    # A copy of the game's state that load_state() can continue from (see globals.EngineState), queued inputs are not included
+    def save_state(self) -> EngineState:
+        piece, stats = self.active_piece, self.stats
+        return EngineState(
+            tuple(self.grid),
+            (piece.type, piece.x, piece.y, piece.rotation, piece.lowest_line, piece.lock_counter, piece.rotation_point),
+            (self.ghost.x, self.ghost.y), self.hold, self.hold_ready, self.randomizer.getstate(),
+            game_statistics(stats.score, stats.clears[:], stats.total_clears, stats.level, stats.t_spin[:], stats.mini_t_spin[:]),
+            self.combo, self.back_to_back_bonus, self.attack_combo, self.attack_back_to_back, self.spin,
+            tuple((lines, hole) for lines, hole in self.pending_garbage), self.fall_interval, self.cur_time, dict(self.timers),
+            self.game_phase, self.fall_while_locking, frozenset(self.held_actions), self.last_horizontal_key, self.paused,
+            self.pieces_placed, self.recording.ticks)
+
+    # Continues a game from a state returned by save_state(), the game must have been set up (see setup()) with the same seed and randomizer
+    # Inputs after the state are recorded, but the recording doesn't have the inputs before it
+    def load_state(self, state: EngineState):
+        self.grid = list(state.grid)
+        self.rows = [sum(1 << column for column, tile in enumerate(row) if tile) for row in state.grid]
+        # update_heights() only checks rows below the highest column
+        self.heights = [GRID_DIMS[1]] * GRID_DIMS[0]
+        self.update_heights()
+
+        type, x, y, rotation, lowest_line, lock_counter, rotation_point = state.piece
+        shape = SHAPES[type][rotation] if type else None
+        self.active_piece = ActivePiece(type, x, y, rotation, shape, lowest_line, lock_counter, rotation_point)
+        self.ghost = GhostPiece(state.ghost[0], state.ghost[1], shape)
+
+        self.hold = state.hold
+        self.hold_ready = state.hold_ready
+        self.update_hold()
+        self.randomizer = RANDOMIZERS[self.randomizer_name](self.game_seed)
+        self.randomizer.keep_history = self.practice
+        self.randomizer.setstate(state.randomizer)
+        self.update_preview()
+
+        stats = state.stats
+        self.stats = game_statistics(stats.score, stats.clears[:], stats.total_clears, stats.level, stats.t_spin[:], stats.mini_t_spin[:])
+        self.combo = state.combo
+        self.back_to_back_bonus = state.back_to_back_bonus
+        self.attack_combo = state.attack_combo
+        self.attack_back_to_back = state.attack_back_to_back
+        self.spin = state.spin
+        self.pending_garbage = deque([lines, hole] for lines, hole in state.pending_garbage)
+        self.fall_interval = state.fall_interval
+        self.cur_time = state.cur_time
+        self.timers = dict(state.timers)
+        self.game_phase = state.game_phase
+        self.fall_while_locking = state.fall_while_locking
+        self.held_actions = set(state.held_actions)
+        self.last_horizontal_key = state.last_horizontal_key
+        self.paused = state.paused
+        self.pieces_placed = state.pieces_placed
+        self.recording.ticks = state.ticks
+
+        self.input_queue.clear()
+        self.accumulator = 0.0
+        self.full_redraw = True
+        # Pieces before the state can't be undone
+        self.undo_stack = []
+        self.redo_stack = []
+
+    # Applies an input action (the names match the keybinds in Settings, e.g. 'move_left')
+    def press(self, action: str):
+        # Ignored inputs aren't recorded, so replays don't restart either
+        if not self.allow_restart and (action == 'restart' or action == 'pause' and self.paused and self.game_ended):
+            return
+        self.held_actions.add(action)
+        self.recording.inputs.append((self.recording.ticks, action, True))
+
+        if action == 'pause':
+            self.pause(not self.paused)
+        elif action == 'restart':
+            self.setup()
+
+        # Don't check movement actions if the game is paused
+        elif self.paused:
+            return
+
+        elif action == 'move_left':
+            self.move_tiles(-1, 0)
+            self.reset_lock_timer()
+            # The first automatic shift happens when DAS expires
+            self.timers['DAS'] = self.settings.delayed_auto_shift
+            self.timers['ARR'] = self.settings.delayed_auto_shift
+            self.last_horizontal_key = -1
+
+        elif action == 'move_right':
+            self.move_tiles(1, 0)
+            self.reset_lock_timer()
+            self.timers['DAS'] = self.settings.delayed_auto_shift
+            self.timers['ARR'] = self.settings.delayed_auto_shift
+            self.last_horizontal_key = 1
+
+        # The piece moves down on the next tick
+        elif action == 'move_down':
+            self.timers['drop_ARR'] = 0.0
+            return
+
+        elif action == 'hold' and self.hold_ready:
+            self.spawn_piece(True)
+            self.hold_ready = False
+
+        elif action == 'rotate_clockwise':
+            self.rotate_active(1)
+            # Checked here rather than in rotate_active() to prevent the lowest_line from changing when a flip rotate fails
+            self.check_lowest_pos()
+            self.reset_lock_timer()
+
+        elif action == 'rotate_counter_clockwise':
+            self.rotate_active(-1)
+            self.check_lowest_pos()
+            self.reset_lock_timer()
+
+        # Tries to rotate the piece twice, if it fails, revert to original position
+        elif action == 'rotate_flip':
+            x, y = self.active_piece.x, self.active_piece.y
+            rotation, rotation_point = self.active_piece.rotation, self.active_piece.rotation_point
+
+            if not (self.rotate_active(1) and self.rotate_active(1)):
+                self.set_position(x, y, rotation)
+                self.active_piece.rotation_point = rotation_point
+
+            else:
+                self.check_lowest_pos()
+
+        elif action == 'hard_drop':
+            self.place_piece()
+            return
+
+        elif action == 'undo' and self.practice:
+            self.undo()
+        elif action == 'redo' and self.practice:
+            self.redo()
+        elif action == 'rewind' and self.practice:
+            self.rewind(self.cur_time - REWIND_TIME)
+        else:
+            return
+
+        self.update_ghost()
+
+    # Stops applying ARR, DAS or drop_ARR for a released action
+    def release(self, action: str):
+        self.held_actions.discard(action)
+        self.recording.inputs.append((self.recording.ticks, action, False))
+
+    # Applies ARR, DAS and drop_ARR
+    def held_keys(self):
+        # drop ARR
+        if 'move_down' in self.held_actions:
+            # If drop_ARR is 0, move the active piece down until it hits an object
+            if self.settings.drop_auto_repeat_rate == 0:
+                distance = self.drop_distance(self.active_piece.shape, self.active_piece.x, self.active_piece.y)
+                if distance:
+                    # Soft drop score is applied before score() to show the score increasing as the piece is falling
+                    # Only lines below the lowest line the piece has reached are scored if it is in the lock phase
+                    if self.game_phase == GamePhase.FALLING:
+                        scored_lines = distance
+                    else:
+                        scored_lines = max(0, distance - (self.active_piece.y + self.active_piece.shape.bottom - self.active_piece.lowest_line))
+                    self.move_tiles(0, -distance)
+                    self.stats.score += scored_lines * SCORE_DATA['soft_drop_mp']
+            # Moves once for every drop_ARR that has passed, which can be more than once per tick
+            # Once the piece lands the timer starts over, the remaining moves would fail anyway (a tiny drop_ARR would try thousands)
+            elif self.timers['drop_ARR'] <= 0:
+                while self.timers['drop_ARR'] <= 0:
+                    self.timers['drop_ARR'] += self.settings.drop_auto_repeat_rate
+                    if not self.move_tiles(0, -1):
+                        self.timers['drop_ARR'] = self.settings.drop_auto_repeat_rate
+                        break
+                    if self.game_phase == GamePhase.FALLING:
+                        self.stats.score += 1 * SCORE_DATA['soft_drop_mp']
+                # Reset the fall timer when the piece is manually moved down, this make it more predictable
+                self.timers['fall'] = self.fall_interval
+
+        # If both horizontal movement actions are held, use self.last_horizontal_key to determine direction
+        if 'move_left' in self.held_actions and 'move_right' in self.held_actions:
+            direction = self.last_horizontal_key
+        elif 'move_left' in self.held_actions:
+            direction = -1
+        elif 'move_right' in self.held_actions:
+            direction = 1
+        else:
+            return
+
+        # DAS and ARR
+        if self.timers['DAS'] <= 0:
+            # If ARR is 0, move the active piece in the corresponding direction until it hits an object
+            if self.settings.auto_repeat_rate == 0:
+                while True:
+                    if not self.move_tiles(direction, 0):
+                        self.update_ghost()
+                        break
+            # Moves once for every ARR that has passed since DAS expired, which can be more than once per tick
+            # Once the piece is blocked the timer starts over, like drop_ARR
+            elif self.timers['ARR'] <= 0:
+                while self.timers['ARR'] <= 0:
+                    if not self.move_tiles(direction, 0):
+                        self.timers['ARR'] = self.settings.auto_repeat_rate
+                        break
+                    self.timers['ARR'] += self.settings.auto_repeat_rate
+                self.update_ghost()
+
+    # Advances the game by delta_time seconds, this runs as many ticks as have passed,
+    # so the game behaves the same regardless of how often this is called (i.e. the frame rate)
+    # now is the current time on the clock used for queue_input() timestamps, queued inputs are applied before the tick they happened in
+    # (if now is None, they are all applied before the first tick)
+    def update(self, delta_time: float, now: float = None):
+        if not self.paused:
+            # Time after a long pause in updates (e.g. while the window is being dragged) is skipped instead of simulated all at once
+            self.accumulator += min(delta_time, MAX_UPDATE_TIME) * self.tick_rate
+            while self.accumulator >= 1 and not self.paused:
+                self.accumulator -= 1
+                # The end of this tick on the input clock
+                self.apply_inputs(None if now is None else now - self.accumulator * self.tick_time, now)
+                # An input can pause the game
+                if self.paused:
+                    break
+                self.tick()
+
+        # Inputs while paused (e.g. unpausing) don't have to wait for a tick, inputs after the last tick are kept for the next update
+        if self.paused or now is None:
+            self.apply_inputs(None, now)
+
+    # Adds an input to be applied by update(), timestamp is when it happened (e.g. time.perf_counter() when the key was pressed)
+    # This lets inputs between updates be applied at the tick they happened on instead of at the next update
+    def queue_input(self, action: str, pressed: bool, timestamp: float):
+        self.input_queue.append((timestamp, action, pressed))
+
+    # Applies queued inputs that happened at or before until (all of them if until is None)
+    def apply_inputs(self, until: float, now: float):
+        queue = self.input_queue
+        while queue and (until is None or queue[0][0] <= until):
+            timestamp, action, pressed = queue.popleft()
+            if self.input_latencies is not None and now is not None:
+                self.input_latencies.append(now - timestamp)
+            if pressed:
+                self.press(action)
+            else:
+                self.release(action)
+
+    # Advances the game by one tick (1 / tick_rate seconds)
+    def tick(self):
+        self.recording.ticks += 1
+        self.cur_time += self.tick_time
+
+        # Decrease all timers by the length of a tick
+        for key in self.timers.keys():
+            self.timers[key] -= self.tick_time
+
+        # Execute appropriate functions for the current game phase
+        if self.game_phase == GamePhase.FALLING:
+            self.falling()
+
+        elif self.game_phase == GamePhase.LOCK:
+            self.locking()
+
+        self.held_keys()
+
+    # Generation Phase
+    def spawn_piece(self, from_hold: bool):
+        # Used for scoring T-Spins, see rotate_active for better description
+        self.active_piece.rotation_point = -1
+        if from_hold:
+            # If hold is empty (first use of the current game), get a new piece from the randomizer instead of the hold
+            if self.hold == '':
+                self.hold = self.active_piece.type
+                self.active_piece.type = self.randomizer.next()
+                self.update_preview()
+
+            # Swap active piece and hold
+            else:
+                self.active_piece.type, self.hold = self.hold, self.active_piece.type
+            self.update_hold()
+        else:
+            # Take the next piece from the randomizer
+            self.active_piece.type = self.randomizer.next()
+            self.update_preview()
+
+        # Sets the rotational center of the piece to be at the spawn point
+        self.set_position(CENTER_SPAWN[0], CENTER_SPAWN[1], 0)
+
+        # If the new piece does not have room to spawn, the game is over
+        if not self.shape_fits(self.active_piece.shape, self.active_piece.x, self.active_piece.y):
+            self.game_over('Block Out')
+            return
+
+        # Piece spawns partially outside of the visible grid, but tries to move down immediately; the lock phase is not started until it fails to move down naturally,
+        # this gives additional time equal to fall_interval to move instead of the usual 0.5 when a piece cannot fall
+        self.move_tiles(0, -1)
+        self.timers['fall'] = self.fall_interval
+
+        # Resets the lowest line to be used for tracking lock timer resets and switching from the lock to falling phase
+        self.active_piece.lowest_line = GRID_DIMS[1]
+        self.check_lowest_pos()
+
+        self.game_phase = GamePhase.FALLING
+
+        # Updates the ghost tiles to match the new piece
+        self.update_ghost()
+
+    # Falling Phase
+    def falling(self):
+        # If the fall timer has expired, try to move the active piece
+        # At high levels fall_interval can be shorter than a tick, so the piece may fall more than one line per tick
+        while self.timers['fall'] <= 0:
+            # If the active piece cannot be moved, enter the locking phase
+            if not self.move_tiles(0, -1):
+                self.game_phase = GamePhase.LOCK
+                self.timers['lock'] = LOCK_DELAY
+                break
+
+            # Reset the fall timer, time past the end of the previous interval counts towards the next one
+            self.timers['fall'] += self.fall_interval
+
+    # Locking Phase
+    def locking(self):
+        # Pieces can fall during the locking phase if the lowest y position of any tile is greater than or equal to the lowest position any tile was previously (for the active piece)
+        # If the piece falls below that threshold, check_lowest_pos() will switch back to the falling phase
+        if self.fall_while_locking:
+            if self.timers['fall'] <= 0:
+                if not self.move_tiles(0, -1):
+                    self.fall_while_locking = False
+                    # Check but don't increment the lock counter
+                    if self.active_piece.lock_counter < MAX_LOCK_RESET:
+                        self.timers['lock'] = LOCK_DELAY
+
+                self.timers['fall'] = self.fall_interval
+
+        # If the active piece can move down, reset the fall timer and allow it to fall during the lock phase
+        elif self.active_piece.y != self.ghost.y:
+            self.timers['fall'] = self.fall_interval
+            self.fall_while_locking = True
+
+        # If the lock timer has expired, place the active piece
+        else:
+            if self.timers['lock'] <= 0:
+                self.place_piece()
+
+    # Resets the lock timer and increments the lock counter if in the locking phase and the lock counter has not exceeded the max
+    def reset_lock_timer(self):
+        if self.game_phase == GamePhase.LOCK and self.active_piece.lock_counter < MAX_LOCK_RESET:
+            self.active_piece.lock_counter += 1
+            self.timers['lock'] = LOCK_DELAY
+
+    # Places the active piece at the position of the ghost piece
+    def place_piece(self):
+        ghost = self.ghost
+        # End the game if the placed piece is completely outside the visible grid
+        if ghost.y + ghost.shape.bottom >= RENDERED_GRID_HEIGHT:
+            self.paused = False
+            self.game_over('Lock Out')
+            return
+
+        # Add the position of the ghost tiles to the main grid
+        # (the ghost tiles are always the position a piece will be placed)
+        type = self.active_piece.type
+        for dy, mask in ghost.shape.masks[ghost.x]:
+            row = ghost.y + dy
+            self.grid[row] = tuple(type if mask >> column & 1 else tile for column, tile in enumerate(self.grid[row]))
+            self.rows[row] |= mask
+            self.dirty_rows.add(row)
+
+        for dx, dy in ghost.shape.tiles:
+            # Update the column heights, the tiles between the old height and a tile placed above it are now covered
+            # (if a tile is placed below the height of its column, it fills a hole)
+            column, row = ghost.x + dx, ghost.y + dy
+            if row >= self.heights[column]:
+                self.holes[column] += row - self.heights[column]
+                self.heights[column] = row + 1
+            else:
+                self.holes[column] -= 1
+
+        # Clear any full rows (only checks rows which the piece was placed in)
+        self.iterate([ghost.y + dy for dy, mask in ghost.shape.masks[ghost.x]])
+
+        # Calculate score
+        self.score()
+
+        # Eliminate any lines marked for clearing in the iterate phase
+        cleared = tuple(self.clears)
+        self.eliminate()
+
+        # Round the score to an int (although the score never has a decimal value other than 0 aside from floating point imprecision)
+        self.stats.score = round(self.stats.score)
+        self.pieces_placed += 1
+
+        # Garbage sent by this placement cancels incoming garbage first, incoming garbage that is left is added if no lines were cleared
+        attack = self.attack()
+        while attack and self.pending_garbage:
+            cancelled = min(attack, self.pending_garbage[0][0])
+            attack -= cancelled
+            self.pending_garbage[0][0] -= cancelled
+            if not self.pending_garbage[0][0]:
+                self.pending_garbage.popleft()
+        garbage = []
+        if not self.cleared_lines:
+            while self.pending_garbage and not self.game_ended:
+                lines, hole = self.pending_garbage.popleft()
+                self.add_garbage(lines, hole)
+                if not self.game_ended:
+                    garbage.append((lines, hole))
+        if self.placement_callback:
+            self.placement_callback(BoardDelta(self.active_piece.type, self.active_piece.rotation, ghost.x, ghost.y, cleared, attack,
+                                               tuple(garbage)))
+        # Garbage can push the stack out of the grid
+        if self.game_ended:
+            return
+
+        self.hold_ready = True
+        if self.practice:
+            self.take_snapshot()
+        self.spawn_piece(False)
+
+    # Iterate/Pattern/Eliminate Phase
+    def iterate(self, rows: list[int]):
+        self.game_phase = GamePhase.ITERATE
+        self.clears = []
+        # If every tile in a row is occupied, add it to the list of lines to be cleared
+        for i in rows:
+            if self.rows[i] == FULL_ROW:
+                self.clears.append(i)
+
+        self.cleared_lines = len(self.clears)
+        self.stats.total_clears += self.cleared_lines
+        # If a new level has been reached and does not exceed the maximum
+
+    # Calculate scores
+    def score(self):
+        # Indicates if score has been applied to prevent T-Spins getting extra points from clearing lines
+        scored = False
+        self.spin = ''
+        # increment combo
+        if self.cleared_lines > 0:
+            self.combo += 1
+        self.game_phase = GamePhase.COMPLETION
+        # Hard drop score, active piece is not moved on a hard drop, so the difference between it and the ghost is the number of lines dropped
+        self.stats.score += (self.active_piece.y - self.ghost.y) * SCORE_DATA['hard_drop_mp']
+
+        # Sets the effective multiplier for the back-to-back bonus
+        if self.back_to_back_bonus:
+            eff_back_to_back_mp = SCORE_DATA['back_to_back_mp']
+        else:
+            eff_back_to_back_mp = 1
+
+        # If the active piece is a 'T' and the last movement was a rotation, check for a T-Spin
+        if self.active_piece.type == 'T' and self.active_piece.rotation_point != -1:
+            # A T-Spin/Mini T-Spin is when a 'T' piece is placed in a position where at least 3
+            # of the 4 corners diagonally adjacent to its center are occupied or out of bounds, or rotation point 5 is used
+            # A rotation must be the last successful movement to count
+
+            # the indices of corners[] (after rotation is applied) correspond with the numbers in the diagram below
+            # Hashes represent the piece, underscore represents a blank tile, if rotated, the corner indices rotate as well
+            # 0#1
+            # ###
+            # 3_2
+            corners = [[-1, 1], [1, 1], [1, -1], [-1, -1]]
+            # Align corners with the active piece's rotation
+            for i in range(self.active_piece.rotation):
+                corners.insert(0, corners.pop())
+
+            # Convert corners into an array of booleans that indicate if a corner (relative to the active piece's center) is occupied/out of bounds
+            for i, corner in enumerate([[self.active_piece.x + corners[j][0], self.active_piece.y + corners[j][1]] for j in range(4)]):
+                if 0 <= corner[0] < GRID_DIMS[0] and 0 <= corner[1] < GRID_DIMS[1]:
+                    corners[i] = bool(self.rows[corner[1]] >> corner[0] & 1)
+                # Out of bounds
+                else:
+                    corners[i] = True
+
+            # Normal T-Spin
+            # If corners 0 and 1 are occupied or the final rotation used rotation point 4 (guideline says rotation point 5, but this is 0-indexed)
+            if (corners[0] and corners[1] and (corners[2] or corners[3])) or self.active_piece.rotation_point == 4:
+                self.stats.score += SCORE_DATA['t_spin'][self.cleared_lines] * eff_back_to_back_mp * self.stats.level
+                self.stats.t_spin[self.cleared_lines] += 1
+                self.spin = 't_spin'
+                # A T-Spin without any clears does not reset the back-to-back bonus, but does not start it either
+                if self.cleared_lines > 0:
+                    self.back_to_back_bonus = True
+                scored = True
+
+            # Mini T-Spin
+            # If at least 3 of the corners are occupied/out of bounds and the last movement was a rotation
+            elif sum(corners) >= 3:
+                self.stats.score += SCORE_DATA['t_spin'][self.cleared_lines] * self.stats.level
+                self.stats.mini_t_spin[self.cleared_lines] += 1
+                self.spin = 'mini_t_spin'
+                if self.cleared_lines > 0:
+                    self.back_to_back_bonus = True
+                scored = True
+
+        # If T-Spin points were already awarded, don't add points for normal clears
+        if not scored:
+            # Reset the back-to-back multiplier if the placement was not a tetris (i.e. 4 line clears)
+            if self.cleared_lines != 4:
+                eff_back_to_back_mp = 1
+            if self.cleared_lines > 0:
+                self.stats.score += SCORE_DATA['normal_clear'][self.cleared_lines - 1] * eff_back_to_back_mp * self.stats.level
+                self.stats.clears[self.cleared_lines - 1] += 1
+
+            if self.cleared_lines == 4:
+                self.back_to_back_bonus = True
+            else:
+                self.back_to_back_bonus = False
+
+        # Add combo score
+        if self.combo:
+            self.stats.score += (self.combo - 1) * SCORE_DATA['combo_mp'] * self.stats.level
+
+    def eliminate(self):
+        # Eliminate Phase
+        # Remove rows starting from the highest to prevent row numbers being offset
+        self.clears.sort()
+        for row in reversed(self.clears):
+            del self.rows[row]
+            del self.grid[row]
+        # Add new rows at the top to replace the old rows (This avoids moving every tile down)
+        if self.clears:
+            # Every row from the lowest cleared row to the top of the highest column has moved
+            self.dirty_rows.update(range(self.clears[0], max(self.heights)))
+            self.rows.extend([0] * self.cleared_lines)
+            self.grid.extend([EMPTY_ROW] * self.cleared_lines)
+            self.update_heights()
+        if self.stats.total_clears // 10 > self.stats.level and self.stats.level < MAX_LEVEL:
+            self.stats.level += 1
+            # Calculate and apply new fall interval
+            self.fall_interval = pow((0.8 - ((self.stats.level - 1) * 0.007)), self.stats.level)
+
+    # Lines of garbage the last placed piece sends to opponents in versus mode (see ATTACK_DATA), called by place_piece() after eliminate()
+    def attack(self) -> int:
+        lines = self.cleared_lines
+        if not lines:
+            self.attack_combo = 0
+            return 0
+
+        if self.spin:
+            attack = ATTACK_DATA[self.spin][lines]
+        else:
+            attack = ATTACK_DATA['normal_clear'][lines - 1]
+
+        # Tetrises and T-Spins are 'difficult' clears, a difficult clear after another one (with only non-clearing placements between) gets a bonus
+        difficult = lines == 4 or bool(self.spin)
+        if difficult and self.attack_back_to_back:
+            attack += ATTACK_DATA['back_to_back']
+        self.attack_back_to_back = difficult
+
+        attack += ATTACK_DATA['combo'][min(self.attack_combo, len(ATTACK_DATA['combo']) - 1)]
+        self.attack_combo += 1
+
+        if not any(self.rows):
+            attack = ATTACK_DATA['perfect_clear']
+        return attack
+
+    # Versus mode, adds garbage received from an opponent (it is added to the grid when a piece is placed without clearing lines)
+    # This is recorded, so games with garbage can still be replayed
+    def receive_garbage(self, lines: int, hole: int):
+        self.recording.garbage.append((self.recording.ticks, len(self.recording.inputs), lines, hole))
+        self.pending_garbage.append([lines, hole])
+
+    # Adds lines of garbage to the bottom of the grid (full rows except for the hole column), everything above moves up
+    # This is only called by place_piece() between placing a piece and spawning the next one, so the active piece doesn't have to be moved
+    def add_garbage(self, lines: int, hole: int):
+        # Tiles would be pushed out of the grid
+        if max(self.heights) + lines > GRID_DIMS[1]:
+            self.game_over('Top Out')
+            return
+
+        del self.rows[GRID_DIMS[1] - lines:]
+        del self.grid[GRID_DIMS[1] - lines:]
+        self.rows[0:0] = [FULL_ROW & ~(1 << hole)] * lines
+        self.grid[0:0] = [tuple(GARBAGE_TILE if column != hole else '' for column in range(GRID_DIMS[0]))] * lines
+
+        for column in range(GRID_DIMS[0]):
+            if column != hole:
+                self.heights[column] += lines
+            # The hole is covered if there is anything above it
+            elif self.heights[column]:
+                self.heights[column] += lines
+                self.holes[column] += lines
+        self.dirty_rows.update(range(max(self.heights)))
+
+    # Update the preview, it is a view of the randomizer's queue (the renderer draws it from this, see MyGame.redraw_grid())
+    def update_preview(self):
+        self.preview = self.randomizer.peek(PREVIEW_COUNT)
+        self.preview_changed = True
+
+    # Update the hold grid
+    def update_hold(self):
+        for i in range(INFO_GRID_DIMS[1]):
+            for j in range(INFO_GRID_DIMS[0]):
+                self.hold_grid[i][j] = 'background'
+
+        # The hold is empty after undoing the first hold
+        if self.hold:
+            for tile in SPAWN_POSITIONS[self.hold]:
+                self.hold_grid[INFO_CENTER_SPAWN[1] + tile[1]][INFO_CENTER_SPAWN[0] + tile[0]] = self.hold
+        self.hold_changed = True
+
+    def rotate_active(self, steps: int) -> bool:
+        # The 'Super Rotation System' is rather unintuitive,
+        # I won't bother trying to fully explain it here, but these sources do a good job
+        # https://tetris.wiki/Super_Rotation_System
+        # https://www.youtube.com/watch?v=yIpk5TJ_uaI
+
+        # The rotated shape and the wall kicks to test are precomputed in srs.py
+        rotation, shape, kicks = ROTATIONS[self.active_piece.type][self.active_piece.rotation][steps]
+        x, y = self.active_piece.x, self.active_piece.y
+
+        test = self.find_kick(shape, kicks, x, y)
+        if test == -1:
+            return False
+
+        self.set_position(x + kicks[test][0], y + kicks[test][1], rotation)
+        # Stores the index of the successful test,
+        # if the piece is a 'T', this will be used in score() to identify what type of T-Spin (if any) was preformed
+        self.active_piece.rotation_point = test
+        return True
+
+    # Returns the index of the first kick (see srs.ROTATIONS) that moves a shape centered at (x, y) to a valid position, or -1 if none do
+    def find_kick(self, shape, kicks: tuple, x: int, y: int) -> int:
+        # Attempt each of the translations (5 for most pieces, 1 for an 'O' piece)
+        for test, kick in enumerate(kicks):
+            # Check if the tile positions after the translation are occupied
+            if self.shape_fits(shape, x + kick[0], y + kick[1]):
+                return test
+        return -1
+
+    # Moves the active piece's center to (x, y) with the given rotation
+    def set_position(self, x: int, y: int, rotation: int):
+        self.active_piece.x = x
+        self.active_piece.y = y
+        self.active_piece.rotation = rotation
+        self.active_piece.shape = SHAPES[self.active_piece.type][rotation]
+
+    # Translates the active piece by the given value, returns false if it fails
+    def move_tiles(self, x: int, y: int) -> bool:
+        piece = self.active_piece
+        if self.shape_fits(piece.shape, piece.x + x, piece.y + y):
+            piece.x += x
+            piece.y += y
+            self.check_lowest_pos()
+            piece.rotation_point = -1
+            return True
+        return False
+
+    # Checks if a list of tiles overlaps any placed tiles or is out of bounds
+    def is_valid_pos(self, tiles: list[list[int]]) -> bool:
+        rows = self.rows
+        for x, y in tiles:
+            if not (0 <= x < GRID_DIMS[0] and 0 <= y < GRID_DIMS[1]):
+                return False
+
+            elif rows[y] & (1 << x):
+                return False
+
+        return True
+
+    # Checks if a shape (see srs.Shape) centered at (x, y) overlaps any placed tiles or is out of bounds
+    # This is is_valid_pos() for pieces, it uses the shape's precomputed row masks so it doesn't allocate anything
+    def shape_fits(self, shape, x: int, y: int) -> bool:
+        masks = shape.masks.get(x)
+        if masks is None or y + shape.bottom < 0 or y + shape.top >= GRID_DIMS[1]:
+            return False
+
+        rows = self.rows
+        for dy, mask in masks:
+            if rows[y + dy] & mask:
+                return False
+
+        return True
+
+    # Recalculates the column heights and holes from self.rows (used after rows are removed, placing a piece updates them directly)
+    def update_heights(self):
+        # Nothing can be above the previous highest column
+        top = max(self.heights)
+        for column in range(GRID_DIMS[0]):
+            bit = 1 << column
+            height, filled = 0, 0
+            for row in range(top):
+                if self.rows[row] & bit:
+                    height = row + 1
+                    filled += 1
+            self.heights[column] = height
+            self.holes[column] = height - filled
+
+    # The number of lines a shape centered at (x, y) can move down before it hits an object
+    def drop_distance(self, shape, x: int, y: int) -> int:
+        # If every column of the shape is above the height of that column, it lands on whichever column is reached first
+        distance = GRID_DIMS[1]
+        for dx, bottom in shape.columns:
+            gap = y + bottom - self.heights[x + dx]
+            # The shape is below the top of a column (under an overhang), there may be more overhangs below it,
+            # so check each line on the way down instead
+            if gap < 0:
+                distance = 0
+                while self.shape_fits(shape, x, y - distance - 1):
+                    distance += 1
+                return distance
+            if gap < distance:
+                distance = gap
+        return distance
+
+    # Updates the current position of the ghost tiles
+    def update_ghost(self):
+        piece = self.active_piece
+        if not self.shape_fits(piece.shape, piece.x, piece.y):
+            return
+
+        self.ghost.x = piece.x
+        self.ghost.y = piece.y - self.drop_distance(piece.shape, piece.x, piece.y)
+        self.ghost.shape = piece.shape
+
+    # When the active piece moves or rotates, if the lowest y position is less than the previous lowest for the piece, reset the lock_counter
+    def check_lowest_pos(self):
+        piece = self.active_piece
+        if piece.y + piece.shape.bottom < piece.lowest_line:
+            piece.lowest_line = piece.y + piece.shape.bottom
+            piece.lock_counter = 0
+            self.game_phase = GamePhase.FALLING
+
+    # Practice mode, saves the game right before a piece spawns so undo() can go back to it
+    # Nothing is copied, the rows are already immutable (see self.grid), so this costs a few tuples of references
+    def take_snapshot(self):
+        stats = self.stats
+        self.undo_stack.append(Snapshot(
+            tuple(self.grid), tuple(self.rows), tuple(self.heights), tuple(self.holes), self.hold, self.randomizer.position(),
+            (stats.score, tuple(stats.clears), stats.total_clears, stats.level, tuple(stats.t_spin), tuple(stats.mini_t_spin)),
+            self.combo, self.back_to_back_bonus, self.attack_combo, self.attack_back_to_back,
+            tuple((lines, hole) for lines, hole in self.pending_garbage), self.fall_interval, self.cur_time, self.pieces_placed))
+        # A new piece replaces the ones that were undone
+        self.redo_stack.clear()
+
+    # Goes back to a snapshot and spawns the piece that spawned after it again, only rows that differ from the snapshot are replaced
+    def restore_snapshot(self, snapshot: Snapshot):
+        grid = self.grid
+        for row, tiles in enumerate(snapshot.grid):
+            if grid[row] is not tiles:
+                grid[row] = tiles
+                self.dirty_rows.add(row)
+        self.rows[:] = snapshot.rows
+        self.heights[:] = snapshot.heights
+        self.holes[:] = snapshot.holes
+
+        self.hold = snapshot.hold
+        self.hold_ready = True
+        self.update_hold()
+        score, clears, total_clears, level, t_spin, mini_t_spin = snapshot.stats
+        self.stats = game_statistics(score, list(clears), total_clears, level, list(t_spin), list(mini_t_spin))
+        self.combo = snapshot.combo
+        self.back_to_back_bonus = snapshot.back_to_back_bonus
+        self.attack_combo = snapshot.attack_combo
+        self.attack_back_to_back = snapshot.attack_back_to_back
+        self.pending_garbage = deque([lines, hole] for lines, hole in snapshot.pending_garbage)
+        self.fall_interval = snapshot.fall_interval
+        self.cur_time = snapshot.cur_time
+        self.pieces_placed = snapshot.pieces_placed
+        self.fall_while_locking = False
+        self.spin = ''
+
+        # The same piece spawns again
+        self.randomizer.rewind(snapshot.randomizer)
+        self.spawn_piece(False)
+
+    # Practice mode, goes back to when the active piece's previous piece spawned (the last placed piece is the active piece again)
+    # Inputs are recorded as usual, so games with undos can still be replayed
+    def undo(self):
+        if len(self.undo_stack) > 1:
+            self.redo_stack.append(self.undo_stack.pop())
+            self.restore_snapshot(self.undo_stack[-1])
+
+    # Goes forward again to a piece undo() or rewind() went back from (until another piece is placed)
+    def redo(self):
+        if self.redo_stack:
+            self.undo_stack.append(self.redo_stack.pop())
+            self.restore_snapshot(self.undo_stack[-1])
+
+    # Goes back to the last piece that spawned at or before time (in seconds of game time, see cur_time), the pieces after it can be redone
+    def rewind(self, time: float):
+        stack = self.undo_stack
+        if not stack:
+            return
+        index = max(bisect_right(stack, time, key=lambda snapshot: snapshot.cur_time) - 1, 0)
+        self.redo_stack.extend(reversed(stack[index + 1:]))
+        del stack[index + 1:]
+        self.restore_snapshot(stack[index])
+
+    # Every position the active piece can be locked in from where it is now (see search.py)
+    def placements(self) -> tuple[Placement]:
+        piece = self.active_piece
+        return find_placements(tuple(self.rows), piece.type, piece.x, piece.y, piece.rotation)
+
+    # Moves the active piece straight to a placement from placements() and places it, without applying the inputs in its path
+    # This is not recorded (see Recording) and no hard/soft drop score is given, press the path's actions instead if either matters
+    def apply_placement(self, placement: Placement):
+        self.set_position(placement.x, placement.y, placement.rotation)
+        self.active_piece.rotation_point = placement.rotation_point
+        self.update_ghost()
+        self.place_piece()
+
+    # Returns everything that needs to be redrawn since the last call (the renderer calls this once per frame)
+    def collect_changes(self) -> Changes:
+        piece = (self.active_piece.type, self.active_piece.x, self.active_piece.y, self.active_piece.shape)
+        ghost = None if self.game_ended else (self.active_piece.type, self.ghost.x, self.ghost.y, self.ghost.shape)
+
+        if self.full_redraw:
+            changes = Changes(set(), True, True, True)
+        else:
+            cells = set()
+            for row in self.dirty_rows:
+                cells.update((column, row) for column in range(GRID_DIMS[0]))
+
+            # Tiles the active piece and ghost were drawn on before and are on now
+            for new, old in ((piece, self.drawn_piece), (ghost, self.drawn_ghost)):
+                if new != old:
+                    for drawn in (new, old):
+                        if drawn:
+                            cells.update((drawn[1] + dx, drawn[2] + dy) for dx, dy in drawn[3].tiles)
+            changes = Changes(cells, self.preview_changed, self.hold_changed, False)
+
+        self.drawn_piece, self.drawn_ghost = piece, ghost
+        self.dirty_rows.clear()
+        self.preview_changed, self.hold_changed, self.full_redraw = False, False, False
+        return changes
+
+    # Pause or unpause the game
+    def pause(self, new_pause_state: bool):
+        # If unpaused after the game has ended, reset the game
+        if self.paused and self.game_ended:
+            self.setup()
+        else:
+            self.paused = new_pause_state
+
+    def game_over(self, reason: str):
+        self.game_over_reason = reason
+        self.game_ended = True
+        self.recording.stats = asdict(self.stats)
+        self.recording.game_over_reason = reason
+        # The ghost is not drawn after the game ends
+        self.full_redraw = True
+        if self.game_over_callback:
+            self.game_over_callback(reason)
+        self.pause(True)
@@ -0,0 +1,265 @@
+from engine import GameEngine
+from globals import (ACTIONS, CENTER_SPAWN, FULL_ROW, GRID_DIMS, MAX_LEVEL, PREVIEW_COUNT, RENDERED_GRID_HEIGHT, SCORE_DATA,
+                     SPAWN_POSITIONS)
+import numpy as np
+from randomizer import DEFAULT_RANDOMIZER
+from srs import SHAPES
+
+# Reset/step environments for training agents
+# PytrisEnv wraps one GameEngine, VectorPytrisEnv plays N games at once with every game stored in shared NumPy arrays
+#
+# Observations are dicts of arrays:
+#     'board': bool array of shape (GRID_DIMS[1], GRID_DIMS[0]), indexed [row, column] like GameEngine.grid
+#     'active', 'hold': index of the piece type in PIECE_TYPES (hold is -1 when empty)
+#     'preview': the next PREVIEW_COUNT piece types
+# VectorPytrisEnv adds a leading dimension of size N to each of them
+#
+# Placement actions are (hold * 4 + rotation) * GRID_DIMS[0] + x, the piece is held first if hold is 1, then rotated and moved
+# to column x (clamped to the columns the rotated piece fits in) and dropped straight down from above the stack
+# (so positions under overhangs can't be chosen)
+# Input actions (PytrisEnv only) are a bitmask of the INPUT_ACTIONS that are held down during the next frame
+
+PIECE_TYPES = tuple(SPAWN_POSITIONS)
+PLACEMENT_ACTIONS = 2 * 4 * GRID_DIMS[0]
+# Pause and restart are left out so an agent can't stop the game
+INPUT_ACTIONS = [action for action in ACTIONS if action not in ('pause', 'restart', 'undo', 'redo', 'rewind')]
+
+# Piece tables indexed [type, rotation], see srs.Shape
+# Position of each tile relative to the center
+TILE_DX = np.array([[[dx for dx, dy in shape.tiles] for shape in SHAPES[type]] for type in PIECE_TYPES])
+TILE_DY = np.array([[[dy for dx, dy in shape.tiles] for shape in SHAPES[type]] for type in PIECE_TYPES])
+# (dx, lowest dy) of each column the shape covers, padded to 4 columns by repeating the first one
+COLUMN_DX = np.array([[[shape.columns[min(i, len(shape.columns) - 1)][0] for i in range(4)] for shape in SHAPES[type]] for type in PIECE_TYPES])
+COLUMN_BOTTOM = np.array([[[shape.columns[min(i, len(shape.columns) - 1)][1] for i in range(4)] for shape in SHAPES[type]] for type in PIECE_TYPES])
+BOTTOM = np.array([[shape.bottom for shape in SHAPES[type]] for type in PIECE_TYPES])
+# The range of centers where the whole shape is inside the grid
+MIN_X = np.array([[min(shape.masks) for shape in SHAPES[type]] for type in PIECE_TYPES])
+MAX_X = np.array([[max(shape.masks) for shape in SHAPES[type]] for type in PIECE_TYPES])
+
+COLUMN_BITS = 1 << np.arange(GRID_DIMS[0])
+ROW_INDEX = np.arange(GRID_DIMS[1])
+BAG = np.arange(len(PIECE_TYPES))
+
+
+# Converts row bitmasks (see GameEngine.rows) with shape (..., GRID_DIMS[1]) to bool boards with shape (..., GRID_DIMS[1], GRID_DIMS[0])
+def unpack_rows(rows: np.ndarray) -> np.ndarray:
+    return (rows[..., None] & COLUMN_BITS) != 0
+
+
+# The center y a shape lands on when dropped straight down from above the stack, x is clamped to the range the shape fits in
+def landing_position(heights: np.ndarray, types: np.ndarray, rotations: np.ndarray, x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    x = np.clip(x, MIN_X[types, rotations], MAX_X[types, rotations])
+    columns = x[:, None] + COLUMN_DX[types, rotations]
+    y = (np.take_along_axis(heights, columns, axis=1) - COLUMN_BOTTOM[types, rotations]).max(axis=1)
+    return x, y
+
+
+# Plays one game through the engine, either with placement actions or raw inputs (mode 'placements' or 'inputs')
+# step() returns (observation, reward, done, info), the reward is the score gained by the step
+# randomizer is the name of the engine's randomizer (see randomizer.RANDOMIZERS), VectorPytrisEnv always uses the 7-bag
+class PytrisEnv:
+    def __init__(self, mode: str = 'placements', seed: int = None, frame_time: float = 1 / 60, randomizer: str = DEFAULT_RANDOMIZER):
+        if mode not in ('placements', 'inputs'):
+            raise ValueError(f'Unknown mode "{mode}", expected "placements" or "inputs"')
+        self.mode = mode
+        # Time each input step advances the game by
+        self.frame_time = frame_time
+        self.game = GameEngine(seed=seed, randomizer=randomizer)
+        self.action_count = PLACEMENT_ACTIONS if mode == 'placements' else 2 ** len(INPUT_ACTIONS)
+
+    def reset(self, seed: int = None) -> dict:
+        if seed is not None:
+            self.game.seed = seed
+        self.game.held_actions.clear()
+        self.game.setup()
+        return self.observation()
+
+    def observation(self) -> dict:
+        game = self.game
+        return {
+            'board': unpack_rows(np.array(game.rows, dtype=np.int64)),
+            'active': PIECE_TYPES.index(game.active_piece.type),
+            'hold': PIECE_TYPES.index(game.hold) if game.hold else -1,
+            'preview': np.array([PIECE_TYPES.index(type) for type in game.preview])
+        }
+
+    def step(self, action: int) -> tuple[dict, float, bool, dict]:
+        game = self.game
+        score = game.stats.score
+
+        if self.mode == 'placements':
+            hold, rotation, x = action // (4 * GRID_DIMS[0]), action // GRID_DIMS[0] % 4, action % GRID_DIMS[0]
+            if hold:
+                game.press('hold')
+                game.release('hold')
+            if not game.game_ended:
+                self.place(rotation, x)
+
+        else:
+            for i, action_name in enumerate(INPUT_ACTIONS):
+                held = bool(action >> i & 1)
+                if held and action_name not in game.held_actions:
+                    game.press(action_name)
+                elif not held and action_name in game.held_actions:
+                    game.release(action_name)
+            game.update(self.frame_time)
+
+        return self.observation(), game.stats.score - score, game.game_ended, {'stats': game.stats}
+
+    # Drops the active piece straight down in the given rotation and column (the same way VectorPytrisEnv does)
+    # The hard drop score is the distance from where the piece was, like a hard drop after rotating and moving it there
+    def place(self, rotation: int, x: int):
+        game = self.game
+        piece = game.active_piece
+        type = PIECE_TYPES.index(piece.type)
+        x, y = landing_position(np.array([game.heights]), np.array([type]), np.array([rotation]), np.array([x]))
+        x, y = int(x[0]), int(y[0])
+        start_y = max(piece.y, y)
+
+        # The piece is completely above the grid, it can't be placed
+        if start_y + SHAPES[piece.type][rotation].top >= GRID_DIMS[1]:
+            game.game_over('Lock Out')
+            return
+        game.set_position(x, start_y, rotation)
+        game.active_piece.rotation_point = -1
+        game.update_ghost()
+        game.place_piece()
+
+
+# Plays count games at once with placement actions, every game is advanced by one piece in each step()
+# step() takes an array of count actions and returns (observations, rewards, dones, info) as arrays,
+# games that end are reset immediately (their final score and number of pieces are in info)
+class VectorPytrisEnv:
+    def __init__(self, count: int, seed: int = None):
+        self.count = count
+        self.action_count = PLACEMENT_ACTIONS
+        self.random = np.random.default_rng(seed)
+
+        # Row bitmasks and column heights of each game (see GameEngine.rows and GameEngine.heights)
+        self.rows = np.zeros((count, GRID_DIMS[1]), dtype=np.int64)
+        self.heights = np.zeros((count, GRID_DIMS[0]), dtype=np.int64)
+        # The current and next bag of each game, position is the index of the active piece
+        # When the active piece is in the second bag, the first one is dropped and a new bag is added
+        self.queue = np.zeros((count, 2 * len(PIECE_TYPES)), dtype=np.int64)
+        self.position = np.zeros(count, dtype=np.int64)
+        self.hold = np.zeros(count, dtype=np.int64)
+
+        # The same statistics score() uses
+        self.score = np.zeros(count)
+        self.total_clears = np.zeros(count, dtype=np.int64)
+        self.level = np.zeros(count, dtype=np.int64)
+        self.combo = np.zeros(count, dtype=np.int64)
+        self.back_to_back_bonus = np.zeros(count, dtype=bool)
+        self.pieces = np.zeros(count, dtype=np.int64)
+
+    # Resets every game, or only the games where games is True
+    def reset(self, games: np.ndarray = None) -> dict:
+        if games is None:
+            games = np.ones(self.count, dtype=bool)
+        count = int(games.sum())
+        self.rows[games] = 0
+        self.heights[games] = 0
+        self.queue[games] = np.concatenate((self.new_bags(count), self.new_bags(count)), axis=1)
+        self.position[games] = 0
+        self.hold[games] = -1
+        self.score[games] = 0
+        self.total_clears[games] = 0
+        self.level[games] = 1
+        self.combo[games] = 0
+        self.back_to_back_bonus[games] = False
+        self.pieces[games] = 0
+        return self.observation()
+
+    def new_bags(self, count: int) -> np.ndarray:
+        return self.random.permuted(np.tile(BAG, (count, 1)), axis=1)
+
+    def observation(self) -> dict:
+        games = np.arange(self.count)
+        return {
+            'board': unpack_rows(self.rows),
+            'active': self.queue[games, self.position],
+            'hold': self.hold.copy(),
+            'preview': np.take_along_axis(self.queue, self.position[:, None] + np.arange(1, PREVIEW_COUNT + 1), axis=1)
+        }
+
+    # Removes the active piece of each game where games is True from the queue
+    def next_piece(self, games: np.ndarray):
+        self.position += games
+        refill = self.position >= len(PIECE_TYPES)
+        if refill.any():
+            self.queue[refill, :len(PIECE_TYPES)] = self.queue[refill, len(PIECE_TYPES):]
+            self.queue[refill, len(PIECE_TYPES):] = self.new_bags(int(refill.sum()))
+            self.position[refill] -= len(PIECE_TYPES)
+
+    # True for each game where the active piece doesn't fit at the spawn point, or the given number of lines below it
+    # (see GameEngine.spawn_piece())
+    def blocked(self, lines: int = 0) -> np.ndarray:
+        types = self.queue[np.arange(self.count), self.position]
+        rows = CENTER_SPAWN[1] - lines + TILE_DY[types, 0]
+        bits = 1 << (CENTER_SPAWN[0] + TILE_DX[types, 0])
+        return (np.take_along_axis(self.rows, rows, axis=1) & bits).any(axis=1)
+
+    def step(self, actions: np.ndarray) -> tuple[dict, np.ndarray, np.ndarray, dict]:
+        actions = np.asarray(actions, dtype=np.int64)
+        games = np.arange(self.count)
+        score = self.score.copy()
+
+        # Hold (the first hold of a game takes the next piece from the queue)
+        hold = actions >= 4 * GRID_DIMS[0]
+        active = self.queue[games, self.position]
+        from_queue = hold & (self.hold == -1)
+        swapped = hold & ~from_queue
+        self.queue[swapped, self.position[swapped]] = self.hold[swapped]
+        self.hold[hold] = active[hold]
+        self.next_piece(from_queue)
+        block_out = hold & self.blocked()
+
+        # Drop the active pieces
+        types = self.queue[games, self.position]
+        rotations = actions // GRID_DIMS[0] % 4
+        x, y = landing_position(self.heights, types, rotations, actions % GRID_DIMS[0])
+        # The piece is completely outside the visible grid (see GameEngine.place_piece())
+        lock_out = ~block_out & (y + BOTTOM[types, rotations] >= RENDERED_GRID_HEIGHT)
+        placed = ~(block_out | lock_out)
+
+        # Hard drop score (spawn_piece() moves pieces down one line after spawning them if they fit there)
+        spawn_y = np.where(self.blocked(1), CENTER_SPAWN[1], CENTER_SPAWN[1] - 1)
+        self.score += placed * np.maximum(0, spawn_y - y) * SCORE_DATA['hard_drop_mp']
+
+        tile_rows = np.where(placed[:, None], y[:, None] + TILE_DY[types, rotations], 0)
+        tile_bits = np.where(placed[:, None], 1 << (x[:, None] + TILE_DX[types, rotations]), 0)
+        np.bitwise_or.at(self.rows, (games[:, None], tile_rows), tile_bits)
+
+        # Line clears, a stable sort moves the full rows to the top while keeping the order of the others
+        full = self.rows == FULL_ROW
+        lines = full.sum(axis=1)
+        cleared = lines > 0
+        if cleared.any():
+            order = np.argsort(full[cleared], axis=1, kind='stable')
+            rows = np.take_along_axis(self.rows[cleared], order, axis=1)
+            rows[ROW_INDEX >= GRID_DIMS[1] - lines[cleared, None]] = 0
+            self.rows[cleared] = rows
+        board = unpack_rows(self.rows)
+        self.heights = np.where(board.any(axis=1), GRID_DIMS[1] - np.argmax(board[:, ::-1], axis=1), 0)
+
+        # Same as score() for placements without a T-Spin
+        self.combo += cleared
+        back_to_back = np.where(self.back_to_back_bonus & (lines == 4), SCORE_DATA['back_to_back_mp'], 1)
+        clear_score = np.concatenate(([0], SCORE_DATA['normal_clear']))[lines]
+        self.score += clear_score * back_to_back * self.level
+        self.back_to_back_bonus = np.where(placed, lines == 4, self.back_to_back_bonus)
+        self.score += placed * np.maximum(0, self.combo - 1) * SCORE_DATA['combo_mp'] * self.level
+        self.score = np.round(self.score)
+        self.total_clears += lines
+        # Same as eliminate()
+        self.level += placed & (self.total_clears // 10 > self.level) & (self.level < MAX_LEVEL)
+
+        self.pieces += placed
+        self.next_piece(placed)
+        done = block_out | lock_out | (placed & self.blocked())
+
+        rewards = self.score - score
+        info = {'score': self.score.copy(), 'pieces': self.pieces.copy()}
+        if done.any():
+            self.reset(done)
+        return self.observation(), rewards, done, info
@@ -0,0 +1,102 @@
+from globals import GRID_DIMS, Placement
+import numpy as np
+from srs import SHAPES
+
+# Scores many boards at once by stacking them into one NumPy array, used by AutoPlayer to choose where to place each piece
+# Boards are bool arrays of shape (number of boards, GRID_DIMS[1], GRID_DIMS[0]), indexed [board, row, column] like GameEngine.grid
+
+# The order of the columns returned by features()
+FEATURES = ('height', 'lines', 'holes', 'bumpiness', 'row_transitions', 'column_transitions', 'wells')
+
+# Weight of each feature, height, lines, holes and bumpiness are from
+# https://codemyroad.wordpress.com/2013/04/14/tetris-ai-the-near-perfect-player/
+DEFAULT_WEIGHTS = (-0.510066, 0.760666, -0.35663, -0.184483, -0.1, -0.1, -0.05)
+
+ROW_INDEX = np.arange(GRID_DIMS[1])[None, :, None]
+COLUMN_BITS = 1 << np.arange(GRID_DIMS[0])
+
+
+# Converts row bitmasks (see GameEngine.rows) to boards, rows can be one list of rows or a list of them (i.e. shape (n, GRID_DIMS[1]))
+def unpack_rows(rows) -> np.ndarray:
+    rows = np.asarray(rows, dtype=np.int64)
+    if rows.ndim == 1:
+        rows = rows[None]
+    return (rows[:, :, None] & COLUMN_BITS) != 0
+
+
+# The row bitmasks after placing each placement on the same rows, shape (number of placements, GRID_DIMS[1])
+def place_rows(rows: list[int], placements: list[Placement]) -> np.ndarray:
+    placed = np.tile(np.asarray(rows, dtype=np.int64), (len(placements), 1))
+    for i, placement in enumerate(placements):
+        for dy, mask in SHAPES[placement.type][placement.rotation].masks[placement.x]:
+            placed[i, placement.y + dy] |= mask
+    return placed
+
+
+# Removes full rows from each board (rows above move down), returns the new boards and the number of lines cleared on each
+def clear_lines(boards: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    full = boards.all(axis=2)
+    lines = full.sum(axis=1)
+    # A stable sort puts the rows that aren't full first, in their original order
+    order = np.argsort(full, axis=1, kind='stable')
+    boards = np.take_along_axis(boards, order[:, :, None], axis=1)
+    # The full rows are now at the top, empty them
+    boards[ROW_INDEX[:, :, 0] >= GRID_DIMS[1] - lines[:, None]] = False
+    return boards, lines
+
+
+# Returns an array of shape (number of boards, len(FEATURES)), lines cleared are removed before the other features are calculated
+def features(boards: np.ndarray) -> np.ndarray:
+    boards, lines = clear_lines(boards)
+
+    # Index of the row above the highest tile in each column (like GameEngine.heights)
+    filled = boards.any(axis=1)
+    heights = np.where(filled, GRID_DIMS[1] - np.argmax(boards[:, ::-1, :], axis=1), 0)
+
+    # Empty tiles below the height of their column
+    holes = (~boards & (ROW_INDEX < heights[:, None, :])).sum(axis=(1, 2))
+    bumpiness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+
+    # Changes between filled and empty tiles along each row (the walls count as filled), only rows below the highest column count
+    walls = np.ones((len(boards), GRID_DIMS[1], 1), dtype=bool)
+    rows = np.concatenate((walls, boards, walls), axis=2)
+    row_transitions = ((rows[:, :, 1:] != rows[:, :, :-1]).sum(axis=2) * (ROW_INDEX[:, :, 0] < heights.max(axis=1)[:, None])).sum(axis=1)
+    # Changes along each column (the floor counts as filled)
+    floor = np.ones((len(boards), 1, GRID_DIMS[0]), dtype=bool)
+    columns = np.concatenate((floor, boards), axis=1)
+    column_transitions = (columns[:, 1:] != columns[:, :-1]).sum(axis=(1, 2))
+
+    # Depth of each column that is lower than both of its neighbours (the walls are as high as the grid)
+    sides = np.pad(heights, ((0, 0), (1, 1)), constant_values=GRID_DIMS[1])
+    wells = np.maximum(0, np.minimum(sides[:, :-2], sides[:, 2:]) - heights).sum(axis=1)
+
+    return np.stack((heights.sum(axis=1), lines, holes, bumpiness, row_transitions, column_transitions, wells), axis=1)
+
+
+# Weighted sum of the features of each board, higher is better
+def evaluate(boards: np.ndarray, weights=DEFAULT_WEIGHTS) -> np.ndarray:
+    return features(boards) @ np.asarray(weights, dtype=float)
+
+
+# Places each piece at the placement (see GameEngine.placements()) whose board scores the best
+# Can be used as a policy in simulate.py, or to play a game directly with play()
+class AutoPlayer:
+    def __init__(self, weights=DEFAULT_WEIGHTS):
+        self.weights = np.asarray(weights, dtype=float)
+
+    def choose(self, game) -> Placement:
+        placements = game.placements()
+        scores = evaluate(unpack_rows(place_rows(game.rows, placements)), self.weights)
+        return placements[int(np.argmax(scores))]
+
+    # Policy interface (see policies.py), returns the inputs that move the piece to the chosen placement
+    def __call__(self, game) -> list[str]:
+        return list(self.choose(game).path) + ['hard_drop']
+
+    # Plays until the game ends or max_pieces have been placed, skipping the inputs (see GameEngine.apply_placement())
+    def play(self, game, max_pieces: int = None) -> int:
+        pieces = 0
+        while not game.game_ended and (max_pieces is None or pieces < max_pieces):
+            game.apply_placement(self.choose(game))
+            pieces += 1
+        return pieces
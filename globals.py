@@ -1,20 +1,46 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from os.path import dirname, realpath
 
 # Constants
 CONFIG_FILE = f'{dirname(realpath(__file__))}/pytris.cfg'
+# The validated config is cached here, so it is only validated again when pytris.cfg changes (see pytris_cfg.py)
+CONFIG_CACHE = f'{dirname(realpath(__file__))}/pytris.cfg.cache'
+# Seconds between checks for changes to pytris.cfg while the game is running
+CONFIG_CHECK_INTERVAL = 0.5
+# The default window size (based on the primary monitor's resolution) is cached here, so monitors aren't probed on every launch (see main.py)
+WINDOW_CACHE = f'{dirname(realpath(__file__))}/pytris.window.cache'
+# Scores used to be saved here, it is imported into SCORE_DB (see scores.py) if it exists
 SCORE_FILE = f'{dirname(realpath(__file__))}/pytris_scores.txt'
+SCORE_DB = f'{dirname(realpath(__file__))}/pytris_scores.db'
+# Recordings of finished games are saved here (see recording.py)
+REPLAY_DIR = f'{dirname(realpath(__file__))}/replays'
+# Binary replays (see replayfile.py), the index of each is saved next to it with REPLAY_INDEX_EXTENSION added
+REPLAY_EXTENSION = '.ptr'
+REPLAY_INDEX_EXTENSION = '.idx'
 
 MAX_SAVED_SCORES = 5
 SCREEN_TITLE = 'Pytris'
 
-# Length of each side of a tile
+# Length of each side of the white texture shared by every tile sprite (sprites are scaled to the tile size)
+TILE_TEXTURE_SIZE = 16
+
+# Seconds between updates of the timing HUD text (see MyGame.draw_timing_hud())
+TIMING_HUD_REFRESH = 0.25
+# Size of the timing HUD's frame time graph in pixels, and pixels per second of frame time
+TIMING_GRAPH_SIZE = [240, 100]
+TIMING_GRAPH_SCALE = 3000
+
 # Size of the grid in tiles, the actual grid taller than the visible grid, this allows for manipulating pieces that are partially above the 'skyline'
 GRID_DIMS = [10, 26]
 
 RENDERED_GRID_HEIGHT = GRID_DIMS[1] - 6
 
+# Bitmask of a row where every tile is occupied (bit x of a row is set when column x is occupied)
+FULL_ROW = (1 << GRID_DIMS[0]) - 1
+# A row of GameEngine.grid without any tiles
+EMPTY_ROW = ('',) * GRID_DIMS[0]
+
 # The location the center of a new piece spawns at (spawned pieces immediately move down if possible, so only part of it appears to spawn outside the grid)
 CENTER_SPAWN = [4, 20]
 
@@ -29,6 +55,18 @@ INFO_GRID_DIMS = [4, 2]
 
 # Scales the preview size based on the dimension that restricts space more, each preview is a 4x2 grid
 PREVIEW_GRID_DIMS = [4, 2 * PREVIEW_COUNT]
+
+# Names of the inputs the game accepts, these match the keybinds in Settings and are passed to GameEngine.press()/release()
+# undo, redo and rewind only do anything in practice mode (see GameEngine.undo())
+ACTIONS = ['move_left', 'move_right', 'move_down', 'hard_drop', 'hold', 'rotate_clockwise', 'rotate_counter_clockwise', 'rotate_flip', 'pause', 'restart',
+           'undo', 'redo', 'rewind']
+
+# Number of times per second the game is advanced (see GameEngine.tick()), this is independent of the frame rate
+TICK_RATE = 240
+
+# The most time (in seconds) a single GameEngine.update() will simulate
+MAX_UPDATE_TIME = 0.25
+
 # Time before a piece is automatically locked when it is unable to fall
 LOCK_DELAY = 0.5
 
@@ -37,6 +75,9 @@ MAX_LOCK_RESET = 15
 
 # The highest level that can be reached (level increases drop speed and score multiplier)
 MAX_LEVEL = 15
+
+# Practice mode, the rewind action goes back to the last piece that spawned at least this many seconds ago (see GameEngine.rewind())
+REWIND_TIME = 5
 # Basic grid functionality copied from: https://api.arcade.academy/en/latest/examples/array_backed_grid_sprites_1.html#array-backed-grid-sprites-1
 
 
@@ -87,8 +128,25 @@ SCORE_DATA = {
     #  Multiplier for combos
     'combo_mp': 50
 }
+
+# Lines of garbage sent to opponents in versus mode (see versus.py), indexed by lines cleared like SCORE_DATA
+ATTACK_DATA = {
+    'normal_clear': [0, 1, 2, 4],
+    'mini_t_spin': [0, 0],
+    't_spin': [0, 2, 4, 6],
+    # Added when a Tetris or a T-Spin that clears lines follows another one
+    'back_to_back': 1,
+    # Added for each placement in a row that clears lines, index is the number of previous placements in the combo (the last value repeats)
+    'combo': [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 4, 5],
+    # Sent instead of the above if the grid is empty after a clear
+    'perfect_clear': 10
+}
+
+# Garbage tiles are stored with this type in GameEngine.grid, so they are drawn with the grid line color
+GARBAGE_TILE = 'grid_lines'
 # TODO: make defaults compliant with guideline, add control customization
-@dataclass
+# Created from pytris.cfg by pytris_cfg.load_config(), settings are replaced with a new object when the config is reloaded instead of being changed
+@dataclass(frozen=True)
 class Settings:
     # Keybinds
     move_left: int
@@ -101,24 +159,14 @@ class Settings:
     rotate_flip: int
     pause: int
     restart: int
+    undo: int
+    redo: int
+    rewind: int
+    toggle_timing_hud: int
 
     # Other Settings
-    colors = {
-        # Empty Tile
-        '': tuple,
-        # Pieces
-        'I': tuple,
-        'J': tuple,
-        'L': tuple,
-        'O': tuple,
-        'S': tuple,
-        'T': tuple,
-        'Z': tuple,
-        # Other
-        'background': tuple,
-        'grid_line': tuple,
-        'text': tuple
-    }
+    # RGB tuple of each piece type, '' (empty tile), 'background', 'grid_lines' and 'text'
+    colors: dict
     normal_opacity: int
     ghost_opacity: int
 
@@ -131,18 +179,63 @@ class Settings:
     # The time between each movement while holding the down key
     drop_auto_repeat_rate: float
 
-# Stores data for the active piece
+    # Show the timing HUD (see timing.py) when the game starts
+    timing_hud: bool
+
+    # The number of frames the timing HUD shows statistics for
+    timing_hud_frames: int
+
+# The subset of Settings used by the game engine, the defaults match the generated config
+# Used when running the engine without a config (e.g. headless simulations)
 @dataclass
+class Handling:
+    delayed_auto_shift: float = 0.2
+    auto_repeat_rate: float = 0.005
+    drop_auto_repeat_rate: float = 0
+
+# Names of the Handling settings (these affect the outcome of a game, so they are stored in recordings)
+HANDLING_SETTINGS = ['delayed_auto_shift', 'auto_repeat_rate', 'drop_auto_repeat_rate']
+
+# Everything needed to reproduce a game, see recording.py
+@dataclass
+class Recording:
+    seed: int
+    # Values of HANDLING_SETTINGS
+    handling: dict
+    # GameEngine.tick_rate
+    tick_rate: int
+    # Actions that were already held down when the game started
+    held: list
+    # (number of ticks before the input, action, True if pressed or False if released)
+    inputs: list
+    # Number of ticks the game ran for
+    ticks: int = 0
+    # (number of ticks before the change, values of HANDLING_SETTINGS) for each time the settings changed during the game
+    handling_changes: list = field(default_factory=list)
+    # Final game_statistics (as a dict) and the reason the game ended, set when the game ends
+    stats: dict = None
+    game_over_reason: str = ''
+    # Name of the randomizer (see randomizer.RANDOMIZERS), recordings from before randomizers existed used the 7-bag
+    randomizer: str = '7-bag'
+    # (number of ticks before it was received, number of inputs before it was received, lines, hole column) of garbage received in versus mode
+    garbage: list = field(default_factory=list)
+    # Practice mode allows undo, redo and rewind (see GameEngine.undo())
+    practice: bool = False
+
+# Stores data for the active piece
+# Uses __slots__ and a shared Shape (see srs.py) rather than tile lists so moving or rotating a piece doesn't allocate anything
+@dataclass(slots=True)
 class ActivePiece:
     # Type of piece (e.g. 'I')
     type: str
     # The coordinates rotational center of the piece
-    center: list[int]
-    # The coordinates of each individual tile
-    tiles: list[list[int]]
+    x: int
+    y: int
     # The number of clockwise rotations needed to put the pieces rotation in its current state relative to its spawn position
     # 0 = spawn, 1 = rotated clockwise, 2 = flipped (i.e. 2x clockwise), 3 = rotated counter-clockwise (i.e. 3x clockwise)
     rotation: int
+    # srs.SHAPES[type][rotation], the position of each tile relative to the center
+    shape: object
     # The lowest line any tile of the active piece has reached,
     # this is for determining when to switch from the 'lock' phase to the 'falling' phase
     lowest_line: int
@@ -153,11 +246,61 @@ class ActivePiece:
     # This is used for scoring T-Spins
     rotation_point: int
 
+    # The coordinates of each individual tile (creates a new list, not used by the engine's hot paths)
+    @property
+    def tiles(self) -> list[tuple[int, int]]:
+        return [(self.x + dx, self.y + dy) for dx, dy in self.shape.tiles]
+
 # Stores data for the ghost piece
-@dataclass
+@dataclass(slots=True)
 class GhostPiece:
-    center: list[int]
-    tiles: list[list[int]]
+    x: int
+    y: int
+    shape: object
+
+    @property
+    def tiles(self) -> list[tuple[int, int]]:
+        return [(self.x + dx, self.y + dy) for dx, dy in self.shape.tiles]
+
+# Parts of the game that need to be redrawn, returned by GameEngine.collect_changes()
+@dataclass(slots=True)
+class Changes:
+    # (column, row) of each main grid tile that may have changed color
+    cells: set
+    preview: bool
+    hold: bool
+    # Everything should be redrawn (e.g. after a restart), cells is empty when this is set
+    full: bool
+
+# A position the active piece can be locked in, returned by GameEngine.placements() (see search.py)
+@dataclass(frozen=True, slots=True)
+class Placement:
+    type: str
+    rotation: int
+    # The center of the piece when it is locked
+    x: int
+    y: int
+    # The fewest actions that move the piece there from where it was (followed by 'hard_drop' to place it),
+    # 'move_down' means holding it until the piece stops falling
+    path: tuple
+    # The rotation point the piece has after the path (-1 if the last action is not a rotation), used for scoring T-Spins
+    rotation_point: int
+
+# What a placed piece changed on the board, passed to GameEngine.placement_callback (see versus.py, protocol.py)
+# Applying these in order to an empty board reproduces the board without sending the whole grid
+@dataclass(slots=True)
+class BoardDelta:
+    type: str
+    rotation: int
+    # The center of the piece when it was placed
+    x: int
+    y: int
+    # Rows that were cleared (indices after the piece was placed, before they were removed)
+    cleared: tuple
+    # Lines of garbage sent to opponents (after cancelling incoming garbage)
+    attack: int
+    # (lines, hole column) of each incoming garbage added to the bottom after the clear
+    garbage: tuple
 
 # Useful for distinguishing between falling and lock phases, and debugging
 class GamePhase(Enum):
@@ -195,3 +338,60 @@ class WindowScale:
     hold_size: list[int]
     info_offset: int
     font_size: int
+
+# Everything about a game in progress that isn't derived from something else, see GameEngine.save_state() and load_state()
+# Used for replay keyframes (see replayfile.py), the handling settings and the recording are not included
+@dataclass(frozen=True, slots=True)
+class EngineState:
+    # Tile types of the main grid, a tuple of rows
+    grid: tuple
+    # (type, x, y, rotation, lowest_line, lock_counter, rotation_point) of the active piece
+    piece: tuple
+    # (x, y) of the ghost
+    ghost: tuple
+    hold: str
+    hold_ready: bool
+    # Randomizer.getstate()
+    randomizer: tuple
+    stats: game_statistics
+    combo: int
+    back_to_back_bonus: bool
+    attack_combo: int
+    attack_back_to_back: bool
+    spin: str
+    # (lines, hole column) of each garbage that hasn't been added yet
+    pending_garbage: tuple
+    fall_interval: float
+    cur_time: float
+    timers: dict
+    game_phase: GamePhase
+    fall_while_locking: bool
+    held_actions: frozenset
+    last_horizontal_key: int
+    paused: bool
+    pieces_placed: int
+    # Number of ticks (GameEngine.recording.ticks)
+    ticks: int
+
+# The game right before a piece spawned, used for undo in practice mode (see GameEngine.take_snapshot())
+# The rows (and everything else) are immutable and shared with the game and other snapshots, so a snapshot only uses memory for what changed
+@dataclass(frozen=True, slots=True)
+class Snapshot:
+    # GameEngine.grid, rows, heights and holes as tuples
+    grid: tuple
+    rows: tuple
+    heights: tuple
+    holes: tuple
+    hold: str
+    # Number of pieces taken from the randomizer (see Randomizer.rewind())
+    randomizer: int
+    # (score, clears, total_clears, level, t_spin, mini_t_spin), the lists are tuples
+    stats: tuple
+    combo: int
+    back_to_back_bonus: bool
+    attack_combo: int
+    attack_back_to_back: bool
+    pending_garbage: tuple
+    fall_interval: float
+    cur_time: float
+    pieces_placed: int
@@ -1,91 +1,183 @@
-import pytris_cfg
+from time import perf_counter
+# When main.py started running, the phases shown by --startup-benchmark are measured from here
+START_TIME = perf_counter()
 
 import arcade
-from bisect import insort
-import copy
-from globals import *
+from engine import GameEngine
+from globals import (ACTIONS, CONFIG_CHECK_INTERVAL, GRID_DIMS, INFO_CENTER_SPAWN, INFO_GRID_DIMS, MAX_SAVED_SCORES, PREVIEW_COUNT,
+                     PREVIEW_GRID_DIMS, RENDERED_GRID_HEIGHT, SCREEN_TITLE, SPAWN_POSITIONS, TILE_TEXTURE_SIZE, TIMING_GRAPH_SCALE,
+                     TIMING_GRAPH_SIZE, TIMING_HUD_REFRESH, WINDOW_CACHE, WindowScale)
+import json
 from math import ceil
-from os.path import exists
-import pyglet
-from random import shuffle
-from screeninfo import get_monitors
+import os
+import protocol
+import pytris_cfg
+from replayfile import ReplayWriter
+from scores import default_player, ScoreEntry, ScoreStore
+from threading import Thread
+from timing import FrameTimer, SECTIONS, StartupTimer
+
+# (column, row) of each tile of a piece when it is shown in one section of the preview grid
+INFO_TILES = {type: {(INFO_CENTER_SPAWN[0] + dx, INFO_CENTER_SPAWN[1] + dy) for dx, dy in positions} for type, positions in SPAWN_POSITIONS.items()}
+
+
+# Set the default window size to be proportional to the primary monitor's resolution (to prevent the default size from varying based on dpi)
+# Probing the monitors is slow, so the size is read from WINDOW_CACHE if it exists, the cache is refreshed after the first frame (see MyGame.on_draw())
+def default_window_size() -> tuple[list[int], bool]:
+    try:
+        with open(WINDOW_CACHE, 'r') as file:
+            return json.load(file), True
+    except (OSError, ValueError):
+        size = probe_window_size()
+        save_window_size(size)
+        return size, False
+
+
+def probe_window_size() -> list[int]:
+    # screeninfo is only imported when it is used
+    from screeninfo import get_monitors
+
+    for m in get_monitors():
+        if m.is_primary:
+            return [round(m.height*0.75*(840/1000)), round(m.height*0.75)]
+
+    # If get_monitors() does not find a primary monitor, fall back to fixed resolution
+    return [1000, 840]
+
+
+def save_window_size(size: list[int]):
+    try:
+        with open(WINDOW_CACHE + '.tmp', 'w') as file:
+            json.dump(size, file)
+        os.replace(WINDOW_CACHE + '.tmp', WINDOW_CACHE)
+    except OSError as ex:
+        print(f'Could not write window cache: {ex}')
+
+
+# Probes the monitors again and updates the cache if the primary monitor changed, the new size is used on the next launch
+def refresh_window_size(cached: list[int]):
+    size = probe_window_size()
+    if size != cached:
+        save_window_size(size)
 
 
 class MyGame(arcade.Window):
     # Load default settings
-    def __init__(self):
+    # startup_timer is only given by --startup-benchmark, the window closes after the first frame when it is
+    # The window is hidden if visible is False (used by bench.py)
+    # versus is (versus.VersusClient, seed, randomizer) when playing a versus match, the client must have joined the match already
+    # The game's state is published to spectators on spectate_port if it is given (see spectate.py)
+    # practice allows undo, redo and rewind (see GameEngine.undo()), practice games aren't added to the leaderboard
+    def __init__(self, startup_timer: StartupTimer = None, visible: bool = True, versus: tuple = None, spectate_port: int = None,
+                 practice: bool = False):
+        self.startup_timer = startup_timer
 
-        # Set the default window size to be proportional to the primary monitor's resolution (to prevent the default size from varying based on dpi)
-        for m in get_monitors():
-            if m.is_primary:
-                default_window_size = [round(m.height*0.75*(840/1000)), round(m.height*0.75)]
-                break
+        # Load settings from config file (new one is generated if it does not exist)
+        self.settings = pytris_cfg.load_config()
+        # The config is reloaded when it is changed while the game is running (see check_config())
+        self.config_mtime = pytris_cfg.config_mtime()
+        self.config_check_timer = CONFIG_CHECK_INTERVAL
+        self.mark_startup('config')
 
-        # If get_monitors() does not find a primary monitor, fall back to fixed resolution
-        else:
-            default_window_size = [1000, 840]
+        window_size, cached = default_window_size()
+        # The cached size is checked after the first frame (see on_draw())
+        self.cached_window_size = window_size if cached else None
+        self.mark_startup('monitor')
 
         # Call the parent class and set up the window
-        super().__init__(default_window_size[0], default_window_size[1], SCREEN_TITLE, resizable=True)
+        super().__init__(window_size[0], window_size[1], SCREEN_TITLE, resizable=True, visible=visible)
+        self.mark_startup('window')
         self.scale = WindowScale
 
-        # Create the main grid
-        self.grid = self.create_grid(GRID_DIMS, '')
+        # Every tile sprite uses this texture, the color of a tile is applied as a tint
+        self.tile_texture = arcade.Texture.create_filled('pytris_tile', (TILE_TEXTURE_SIZE, TILE_TEXTURE_SIZE), (255, 255, 255))
+
+        # Sprites for the main grid
         self.grid_sprite_list = arcade.SpriteList()
         self.grid_sprites = []
 
-        # Create the preview grid
-        self.preview_grid = self.create_grid(PREVIEW_GRID_DIMS, 'background')
+        # Sprites for the preview grid
         self.preview_grid_sprite_list = arcade.SpriteList()
         self.preview_grid_sprites = []
 
-        # Create the hold grid
-        self.hold_grid = self.create_grid(INFO_GRID_DIMS, 'background')
+        # Sprites for the hold grid
         self.hold_grid_sprite_list = arcade.SpriteList()
         self.hold_grid_sprites = []
 
-        # Create object to store ghost tiles (indicates where a piece will be dropped on a hard drop)
-        self.ghost = GhostPiece([[0, 0], [0, 0], [0, 0], [0, 0]], [0, 0])
+        # Recolor every sprite on the next frame instead of only the tiles that changed (e.g. after the sprites are recreated)
+        self.redraw_all = True
 
-        self.game_phase = GamePhase
-        self.fall_while_locking = False
+        # Maps key codes to the action they are bound to (e.g. arcade.key.LEFT: 'move_left')
+        self.actions = {getattr(self.settings, action): action for action in ACTIONS}
 
-        # Sets up handler for pressed keys
-        self.keys = pyglet.window.key.KeyStateHandler()
-        self.push_handlers(self.keys)
+        # Every finished game is added to the leaderboard (see scores.py), the database is opened when the first game ends
+        self.scores = None
+        self.player = default_player()
+
+        # All game rules are handled by the engine, this class only draws its state and passes inputs to it
+        self.versus = None
+        if versus:
+            # Every player in the match gets the same pieces, each placed piece is sent to the server (see versus.py)
+            self.versus, seed, randomizer = versus
+            self.engine = GameEngine(self.settings, self.game_over, seed, randomizer=randomizer)
+            self.engine.placement_callback = self.versus.send_piece
+            self.engine.allow_restart = False
+        else:
+            self.engine = GameEngine(self.settings, self.game_over, practice=practice)
+
+        self.publisher = None
+        if spectate_port is not None:
+            # Imported here so the network modules aren't loaded unless they are used
+            from spectate import SpectatorPublisher
+            self.publisher = SpectatorPublisher('localhost', spectate_port)
+
+        # Text is kept between frames and only laid out again when its string, position or size changes (see update_text())
+        # Positions and sizes are set on the first frame
+        self.score_text = arcade.Text('', 0, 0, self.settings.colors['text'], 24, 1, 'center')
+        self.hold_text = arcade.Text('Hold', 0, 0, self.settings.colors['text'], 24, 1, 'center')
+        self.game_over_text = arcade.Text('', 0, 0, self.settings.colors['text'], 24, 1, 'center')
+
+        # Timing HUD, frame_timer is None while it is off (see toggle_timing_hud())
+        self.frame_timer = None
+        self.timing_text = arcade.Text('', 0, 0, self.settings.colors['text'], 10, 400, font_name='Courier New', anchor_y='top', multiline=True)
+        # When the timing text was last changed
+        self.timing_text_time = 0
+        if self.settings.timing_hud:
+            self.toggle_timing_hud()
+        self.mark_startup('init')
+
+    # Ends a phase of --startup-benchmark (see timing.StartupTimer)
+    def mark_startup(self, phase: str):
+        if self.startup_timer:
+            self.startup_timer.mark(phase)
+
+    # Create a grid of sprites to correspond with a normal grid, returns True if new sprites were created
+    # If the grid already has sprites with the same dimensions, they are resized and moved instead of being recreated
+    def create_sprite_grid(self, size: list[int], visible_size: list[int], tile_size: int, line_width: int, position: list[int], sprite_list, sprite_list_2d) -> bool:
+        rebuild = len(sprite_list_2d) != visible_size[1] or any(len(row) != visible_size[0] for row in sprite_list_2d)
+        if rebuild:
+            # Create a sprite list for batch drawing all the grid sprites
+            sprite_list.clear()
+            # Create a 2d list of sprites (references to the main sprite list) for easy access
+            sprite_list_2d.clear()
+
+            # Create a list of sprites to represent each grid location, they all share the same white texture and are tinted with sprite.color
+            for row in range(visible_size[1]):
+                sprite_list_2d.append([])
+                for column in range(visible_size[0]):
+                    sprite = arcade.Sprite(texture=self.tile_texture)
+                    sprite_list.append(sprite)
+                    sprite_list_2d[row].append(sprite)
 
-        # Load settings from config file (new one is generated if it does not exist)
-        self.settings = Settings
-        pytris_cfg.load_config(self.settings)
-
-    def create_grid(self, size: list[int], default_value) -> list[list[int]]:
-        # Create a grid of strings that represent the type of piece occupying a tile (for determining the color), empty strings represent an empty tile
-        grid = []
-        for row in range(size[1]):
-            grid.append([])
-            for column in range(size[0]):
-                grid[row].append(default_value)
-        return grid
-
-    # Create a grid of sprites to correspond with a normal grid
-    def create_sprite_grid(self, size: list[int], visible_size: list[int], tile_size: int, line_width: int, position: list[int], sprite_list, sprite_list_2d):
-        # Create a sprite list for batch drawing all the grid sprites
-        sprite_list.clear()
-        # Create a 2d list of sprites (references to the main sprite list) for easy access
-        sprite_list_2d.clear()
-
-        # Create a list of solid-color sprites to represent each grid location
         for row in range(visible_size[1]):
-            sprite_list_2d.append([])
             for column in range(visible_size[0]):
-                x = column * (tile_size + line_width) + (tile_size / 2 + line_width) + position[0]
-                y = row * (tile_size + line_width) + (tile_size / 2 + line_width) + position[1]
-                sprite = arcade.SpriteSolidColor(
-                    tile_size, tile_size, (255, 255, 255))
-                sprite.center_x = x
-                sprite.center_y = y
-                sprite_list.append(sprite)
-                sprite_list_2d[row].append(sprite)
+                sprite = sprite_list_2d[row][column]
+                sprite.width = tile_size
+                sprite.height = tile_size
+                sprite.center_x = column * (tile_size + line_width) + (tile_size / 2 + line_width) + position[0]
+                sprite.center_y = row * (tile_size + line_width) + (tile_size / 2 + line_width) + position[1]
+
+        return rebuild
 
     # Adjusts scaling when the window's size changes, this is automatically called once after __init__()
     def on_resize(self, width, height):
@@ -129,8 +221,8 @@ class MyGame(arcade.Window):
             self.scale.grid_pos[0] - self.scale.preview_size[0] - self.scale.info_offset,
             self.scale.grid_pos[1] + self.scale.grid_size[1] - self.scale.hold_size[1]]
 
-        # Create new sprite grids with new parameters
-        self.create_sprite_grid(
+        # Move and resize the sprite grids (new sprites are only created the first time)
+        rebuilt = self.create_sprite_grid(
             GRID_DIMS,
             [GRID_DIMS[0], RENDERED_GRID_HEIGHT],
             self.scale.tile_size,
@@ -139,7 +231,7 @@ class MyGame(arcade.Window):
             self.grid_sprite_list,
             self.grid_sprites)
 
-        self.create_sprite_grid(
+        rebuilt |= self.create_sprite_grid(
             PREVIEW_GRID_DIMS,
             PREVIEW_GRID_DIMS,
             self.scale.tile_size,
@@ -148,7 +240,7 @@ class MyGame(arcade.Window):
             self.preview_grid_sprite_list,
             self.preview_grid_sprites)
 
-        self.create_sprite_grid(
+        rebuilt |= self.create_sprite_grid(
             INFO_GRID_DIMS,
             INFO_GRID_DIMS,
             self.scale.tile_size,
@@ -157,452 +249,162 @@ class MyGame(arcade.Window):
             self.hold_grid_sprite_list,
             self.hold_grid_sprites)
 
+        # New sprites don't have any colors yet
+        if rebuilt:
+            self.redraw_all = True
+
         # Text size
         self.scale.font_size = 24
+        self.mark_startup('resize')
 
-    # Updates sprite grid to match positions of tiles
+    # Updates sprite grid to match positions of tiles, only tiles reported as changed by the engine are recolored
     def redraw_grid(self):
-
-        # Adds the placed pieces to the sprite grid (and clears anything else)
-        for column in range(GRID_DIMS[0]):
-            for row in range(RENDERED_GRID_HEIGHT):
-                self.grid_sprites[row][column].color = \
-                    self.settings.colors[self.grid[row][column]] + (self.settings.normal_opacity,)
-
-        # Draws the ghost tiles
-        # If the game ends, , don't redraw the ghost tiles (that haven't been updated)
-        if not self.game_ended:
-            for tile in self.ghost.tiles:
-                if not tile[1] >= RENDERED_GRID_HEIGHT:
-                    self.grid_sprites[tile[1]][tile[0]].color = \
-                        self.settings.colors[self.active_piece.type] + (self.settings.ghost_opacity,)
-
-        # Draws the active piece (overwrites ghost tiles if overlapping)
-        for tile in self.active_piece.tiles:
-            if not tile[1] >= RENDERED_GRID_HEIGHT:
-                self.grid_sprites[tile[1]][tile[0]].color = \
-                    self.settings.colors[self.active_piece.type] + (self.settings.normal_opacity,)
-
-        # Draw preview grid
-        for column in range(PREVIEW_GRID_DIMS[0]):
-            for row in range(PREVIEW_GRID_DIMS[1]):
-                self.preview_grid_sprites[row][column].color = \
-                    self.settings.colors[self.preview_grid[row][column]] + (self.settings.normal_opacity,)
+        game = self.engine
+        changes = game.collect_changes()
+
+        # Redraw everything after a resize or restart
+        if changes.full or self.redraw_all:
+            self.redraw_all = False
+            changes.preview, changes.hold = True, True
+            changes.cells = {(column, row) for column in range(GRID_DIMS[0]) for row in range(RENDERED_GRID_HEIGHT)}
+
+        if changes.cells:
+            active_tiles = set(game.active_piece.tiles)
+            # If the game ends, don't draw the ghost tiles (that haven't been updated)
+            ghost_tiles = set() if game.game_ended else set(game.ghost.tiles)
+
+            for column, row in changes.cells:
+                if row >= RENDERED_GRID_HEIGHT:
+                    continue
+                # The active piece is drawn over ghost tiles if overlapping, and both are drawn over the placed pieces
+                if (column, row) in active_tiles:
+                    color = self.settings.colors[game.active_piece.type] + (self.settings.normal_opacity,)
+                elif (column, row) in ghost_tiles:
+                    color = self.settings.colors[game.active_piece.type] + (self.settings.ghost_opacity,)
+                else:
+                    color = self.settings.colors[game.grid[row][column]] + (self.settings.normal_opacity,)
+                self.grid_sprites[row][column].color = color
+
+        # Draw preview grid from the engine's view of the piece queue, the next piece is at the top
+        # Each piece has its own INFO_GRID_DIMS section of the preview grid
+        if changes.preview:
+            background = self.settings.colors['background'] + (self.settings.normal_opacity,)
+            for i, type in enumerate(game.preview):
+                color = self.settings.colors[type] + (self.settings.normal_opacity,)
+                tiles = INFO_TILES[type]
+                bottom = (PREVIEW_COUNT - 1 - i) * INFO_GRID_DIMS[1]
+                for row in range(INFO_GRID_DIMS[1]):
+                    for column in range(INFO_GRID_DIMS[0]):
+                        self.preview_grid_sprites[bottom + row][column].color = color if (column, row) in tiles else background
 
         # Draw hold grid
-        for column in range(INFO_GRID_DIMS[0]):
-            for row in range(INFO_GRID_DIMS[1]):
-                self.hold_grid_sprites[row][column].color = \
-                    self.settings.colors[self.hold_grid[row][column]] + (self.settings.normal_opacity,)
+        if changes.hold:
+            for column in range(INFO_GRID_DIMS[0]):
+                for row in range(INFO_GRID_DIMS[1]):
+                    self.hold_grid_sprites[row][column].color = \
+                        self.settings.colors[game.hold_grid[row][column]] + (self.settings.normal_opacity,)
 
     # Called at the beginning and when the restart keybind is pressed
     def setup(self):
-
-        self.game_phase = GamePhase.GENERATION
-
-        # Generate the first bag
-        self.bag = ['I', 'J', 'L', 'O', 'S', 'T', 'Z']
-        shuffle(self.bag)
-
-        # Determines if the player can swap the active piece with their hold
-        self.hold_ready = True
-        self.active_piece = ActivePiece(
-            '', [0, 0], [[0, 0], [0, 0], [0, 0], [0, 0]], 0, GRID_DIMS[1], 0, -1)
-
-        self.fall_interval = 1
-        self.cur_time = 0
-        self.hold = ''
-        self.back_to_back_bonus = False
-
-        # Clear main grid
-        for i in range(GRID_DIMS[1]):
-            for j in range(GRID_DIMS[0]):
-                self.grid[i][j] = ''
-
-        # Clear preview grid
-        for i in range(PREVIEW_GRID_DIMS[1]):
-            for j in range(PREVIEW_GRID_DIMS[0]):
-                self.preview_grid[i][j] = 'background'
-
-        # Clear Hold grid
-        for i in range(INFO_GRID_DIMS[1]):
-            for j in range(INFO_GRID_DIMS[0]):
-                self.hold_grid[i][j] = 'background'
-
-        self.timers = {
-            # Time until the active piece will move down automatically
-            'fall': self.fall_interval,
-            # Time until the active piece will move down while the down key is pressed
-            'drop_ARR': 0.0,
-            # Auto Repeat Rate
-            'ARR': 0.0,
-            # Delayed Auto Shift
-            'DAS': 0.0
-        }
-        self.cur_time = 0
-        self.paused = False
-        self.game_ended = False
-        self.stats = game_statistics(0, [0, 0, 0, 0], 0, 1, [0, 0, 0, 0], [0, 0])
-        self.combo = 0
-
-        # Spawn the first piece
-        self.spawn_piece(False)
-
-        # Update preview for first bag
-        for i, type in enumerate(reversed(self.bag[:PREVIEW_COUNT])):
-            for tile in SPAWN_POSITIONS[type]:
-                self.preview_grid[(INFO_CENTER_SPAWN[1] + (i)) * 2 + tile[1]][INFO_CENTER_SPAWN[0] + tile[0]] = type
+        self.engine.setup()
+        # The game is written to a replay while it is played (see replayfile.py and update_replay())
+        self.replay_writer = ReplayWriter(self.engine)
 
     def on_key_press(self, symbol, modifiers):
-        cfg = self.settings
-        if symbol == cfg.pause:
-            self.pause(not self.paused)
-        elif symbol == cfg.restart:
-            self.setup()
-
-        # Don't check movement binds if the game is paused
-        elif self.paused:
-            return
+        if symbol == self.settings.toggle_timing_hud:
+            self.toggle_timing_hud()
+        # Inputs are timestamped when they are received so the engine can apply them at the tick they happened on
+        elif symbol in self.actions:
+            self.engine.queue_input(self.actions[symbol], True, perf_counter())
 
-        elif symbol == cfg.move_left:
-            self.move_tiles(self.active_piece.tiles, -1, 0, center=self.active_piece.center)
-            self.reset_lock_timer()
-            self.timers['DAS'] = self.settings.delayed_auto_shift
-            # Stores the most recent move_left or move_right key press (determines which direction the piece should move if both are pressed)
-            # Value is the direction the block would move in
-            self.last_horizontal_key = -1
-
-        elif symbol == cfg.move_right:
-            self.move_tiles(self.active_piece.tiles, 1, 0, center=self.active_piece.center)
-            self.reset_lock_timer()
-            self.timers['DAS'] = self.settings.delayed_auto_shift
-            self.last_horizontal_key = 1
-
-        elif symbol == cfg.hold and self.hold_ready:
-            self.spawn_piece(True)
-            self.hold_ready = False
-
-        elif symbol == cfg.rotate_clockwise:
-            self.rotate_active(1)
-            # Checked here rather than in rotate_active() to prevent the lowest_line from changing when a flip rotate fails
-            self.check_lowest_pos()
-            self.reset_lock_timer()
-
-        elif symbol == cfg.rotate_counter_clockwise:
-            self.rotate_active(-1)
-            self.check_lowest_pos()
-            self.reset_lock_timer()
-
-        # Tries to rotate the piece twice, if it fails, revert to original position
-        elif symbol == cfg.rotate_flip:
-            tmp_piece = copy.deepcopy(self.active_piece)
-
-            if not (self.rotate_active(1) and self.rotate_active(1)):
-                self.active_piece = copy.deepcopy(tmp_piece)
-
-            else:
-                self.check_lowest_pos()
-
-        elif symbol == cfg.hard_drop:
-            self.place_piece()
-            return
-        else:
-            return
-
-        self.update_ghost()
-
-    # Applies ARR, DAS and drop_ARR
-    def held_keys(self):
-        # drop ARR
-        if self.keys[self.settings.move_down]:
-            # If drop_ARR is 0, move the active piece down until it hits an object
-            if self.settings.drop_auto_repeat_rate == 0:
-                for i in range(GRID_DIMS[1]):
-                    if self.move_tiles(self.active_piece.tiles, 0, -1, center=self.active_piece.center):
-                        if self.game_phase == GamePhase.FALLING:
-                            # Soft drop score is applied before score() to show the score increasing as the piece is falling
-                            self.stats.score += 1 * SCORE_DATA['soft_drop_mp']
-                    else:
-                        break
-            elif self.timers['drop_ARR'] <= 0:
-                if self.move_tiles(self.active_piece.tiles, 0, -1, center=self.active_piece.center) and self.game_phase == GamePhase.FALLING:
-                    self.stats.score += 1 * SCORE_DATA['soft_drop_mp']
-                # Reset the fall timer when the piece is manually moved down, this make it more predictable
-                self.timers['fall'] = self.fall_interval
-
-        # DAS and ARR
-        if self.timers['DAS'] <= 0:
-            # If ARR is 0, move the active piece in the corresponding direction until it hits an object
-            if self.settings.auto_repeat_rate == 0:
-                while True:
-                    if not self.move_tiles(self.active_piece.tiles, self.last_horizontal_key, 0, center=self.active_piece.center):
-                        self.update_ghost()
-                        break
-            elif self.timers['ARR'] <= 0:
-                # If both horizontal movement keys are held down, use self.last_horizontal_key to determine direction
-                if self.keys[self.settings.move_left] and self.keys[self.settings.move_right]:
-                    self.move_tiles(self.active_piece.tiles, self.last_horizontal_key, 0, center=self.active_piece.center)
-
-                elif self.keys[self.settings.move_left]:
-                    self.move_tiles(self.active_piece.tiles, -1, 0, center=self.active_piece.center)
-
-                elif self.keys[self.settings.move_right]:
-                    self.move_tiles(self.active_piece.tiles, 1, 0, center=self.active_piece.center)
-                else:
-                    return
-                self.timers['ARR'] = self.settings.auto_repeat_rate
-                self.update_ghost()
+    def on_key_release(self, symbol, modifiers):
+        if symbol in self.actions:
+            self.engine.queue_input(self.actions[symbol], False, perf_counter())
 
     def on_update(self, delta_time):
-        if not self.paused:
-            self.cur_time += delta_time
-
-            # Decrease all timers by the time since this function was last called
-            for key in self.timers.keys():
-                self.timers[key] -= delta_time
-
-            # Execute appropriate functions for the current game phase
-            if self.game_phase == GamePhase.FALLING:
-                self.falling()
-
-            elif self.game_phase == GamePhase.LOCK:
-                self.locking()
-
-            self.held_keys()
-
-    # Generation Phase
-    def spawn_piece(self, from_hold: bool):
-        # Used for scoring T-Spins, see rotate_active for better description
-        self.active_piece.rotation_point = -1
-        if from_hold:
-            # If hold is empty (first use of the current game), get a new piece from the bag instead of the hold
-            if self.hold == '':
-                self.hold = self.active_piece.type
-                self.active_piece.type = self.bag.pop(0)
-                self.update_preview()
-
-            # Swap active piece and hold
+        if self.frame_timer:
+            self.frame_timer.next_frame()
+
+        self.config_check_timer -= delta_time
+        if self.config_check_timer <= 0:
+            self.config_check_timer = CONFIG_CHECK_INTERVAL
+            self.check_config()
+
+        if self.versus:
+            self.poll_versus()
+
+        self.engine.update(delta_time, perf_counter())
+
+        # Never waits for spectators, slow ones are sent a keyframe once they catch up
+        if self.publisher:
+            self.publisher.publish(self.engine)
+
+        self.update_replay()
+
+    # Adds everything that happened since the last frame to the replay, it is finished when the game ends
+    # Restarting starts a new replay, the replay of a game that was restarted before it ended is deleted
+    def update_replay(self):
+        writer = self.replay_writer
+        if writer.recording is not self.engine.recording:
+            self.finish_replay()
+            self.replay_writer = ReplayWriter(self.engine)
+        elif not writer.file.closed:
+            writer.update()
+            if self.engine.game_ended:
+                writer.close()
+
+    # Closes the replay if it is still being written, it is deleted if the game didn't end
+    def finish_replay(self):
+        writer = self.replay_writer
+        if not writer.file.closed:
+            if writer.recording.stats is None:
+                writer.discard()
             else:
-                self.active_piece.type, self.hold = self.hold, self.active_piece.type
-            self.update_hold()
-        else:
-            # Remove first type from the bag and set the new piece to that type
-            self.active_piece.type = self.bag.pop(0)
-
-        # Sets the rotational center of the piece to be at the spawn point
-        self.active_piece.center = copy.deepcopy(CENTER_SPAWN)
-        self.active_piece.rotation = 0
-
-        # Place tiles relative to the center
-        self.active_piece.tiles = [[
-            CENTER_SPAWN[j] + SPAWN_POSITIONS[self.active_piece.type][i][j]
-            for j in range(2)]
-            for i in range(4)]
-
-        # If the new piece does not have room to spawn, the game is over
-        if not self.is_valid_pos(self.active_piece.tiles):
-            self.game_over('Block Out')
+                writer.close()
+
+    # Quitting in the middle of a game deletes its replay, like restarting
+    def on_close(self):
+        self.finish_replay()
+        super().on_close()
+
+    # Adds garbage sent by opponents and prints the results of a versus match
+    def poll_versus(self):
+        for message_type, values in self.versus.poll():
+            if message_type == protocol.GARBAGE:
+                self.engine.receive_garbage(values[1], values[2])
+            elif message_type == protocol.PLAYER_OUT and values[0] != self.versus.player:
+                print(f'Player {values[0]} is out (place {values[1]})')
+            elif message_type == protocol.END:
+                print('You won!' if values[0] == self.versus.player else f'Player {values[0]} won')
+        # The server waits for every player to disconnect after the match ends, the game can be restarted after that
+        if self.versus.ended:
+            self.versus.close()
+            self.engine.allow_restart = True
+            self.versus = None
+
+    # Reloads the config if pytris.cfg has been modified, keybinds, colors, opacities and handling apply immediately
+    # If the new config has errors, they are printed and the current settings are kept
+    def check_config(self):
+        mtime = pytris_cfg.config_mtime()
+        if mtime == self.config_mtime:
             return
-
-        # If the bag has fewer pieces than the preview is set to display, generate and append a new bag
-        # Each bag has one of each tile, which ensures even distribution of pieces
-        if len(self.bag) == PREVIEW_COUNT:
-            self.new_bag = ['I', 'J', 'L', 'O', 'S', 'T', 'Z']
-            shuffle(self.new_bag)
-            self.bag.extend(self.new_bag)
-
-        # Piece spawns partially outside of the visible grid, but tries to move down immediately; the lock phase is not started until it fails to move down naturally,
-        # this gives additional time equal to fall_interval to move instead of the usual 0.5 when a piece cannot fall
-        self.move_tiles(self.active_piece.tiles, 0, -1, center=self.active_piece.center)
-        self.timers['fall'] = self.fall_interval
-
-        # Resets the lowest line to be used for tracking lock timer resets and switching from the lock to falling phase
-        self.active_piece.lowest_line = GRID_DIMS[1]
-        self.check_lowest_pos()
-
-        self.game_phase = GamePhase.FALLING
-
-        # Updates the ghost tiles to match the new piece
-        self.update_ghost()
-
-    # Falling Phase
-    def falling(self):
-        # If the fall timer has expired, try to move the active piece
-        if self.timers['fall'] <= 0:
-            # If the active piece cannot be moved, enter the locking phase
-            if not self.move_tiles(self.active_piece.tiles, 0, -1, center=self.active_piece.center):
-                self.game_phase = GamePhase.LOCK
-                self.timers['lock'] = LOCK_DELAY
-
-            else:
-                # Reset the fall timer
-                self.timers['fall'] = self.fall_interval
-
-    # Locking Phase
-    def locking(self):
-        # Pieces can fall during the locking phase if the lowest y position of any tile is greater than or equal to the lowest position any tile was previously (for the active piece)
-        # If the piece falls below that threshold, check_lowest_pos() will switch back to the falling phase
-        if self.fall_while_locking:
-            if self.timers['fall'] <= 0:
-                if not self.move_tiles(self.active_piece.tiles, 0, -1, center=self.active_piece.center):
-                    self.fall_while_locking = False
-                    # Check but don't increment the lock counter
-                    if self.active_piece.lock_counter < MAX_LOCK_RESET:
-                        self.timers['lock'] = LOCK_DELAY
-
-                self.timers['fall'] = self.fall_interval
-
-        # If the active piece can move down, reset the fall timer and allow it to fall during the lock phase
-        elif self.active_piece.tiles != self.ghost.tiles:
-            self.timers['fall'] = self.fall_interval
-            self.fall_while_locking = True
-
-        # If the lock timer has expired, place the active piece
-        else:
-            if self.timers['lock'] <= 0:
-                self.place_piece()
-
-    # Resets the lock timer and increments the lock counter if in the locking phase and the lock counter has not exceeded the max
-    def reset_lock_timer(self):
-        if self.game_phase == GamePhase.LOCK and self.active_piece.lock_counter < MAX_LOCK_RESET:
-            self.active_piece.lock_counter += 1
-            self.timers['lock'] = LOCK_DELAY
-
-    # Places the active piece at the position of the ghost piece
-    def place_piece(self):
-        # End the game if the placed piece is completely outside the visible grid
-        if min([self.ghost.tiles[i][1] for i in range(4)]) >= RENDERED_GRID_HEIGHT:
-            self.paused = False
-            self.game_over('Lock Out')
+        self.config_mtime = mtime
+        settings = pytris_cfg.load_config(self.settings)
+        if settings == self.settings:
             return
+        print('Config reloaded')
 
-        # Add the position of the ghost tiles to the main grid
-        # (the ghost tiles are always the position a piece will be placed)
-        for tile in self.ghost.tiles:
-            self.grid[tile[1]][tile[0]] = self.active_piece.type
-
-        # Clear any full rows (only checks rows which the piece was placed in)
-        self.iterate(set([self.ghost.tiles[i][1] for i in range(4)]))
-
-        # Calculate score
-        self.score()
-
-        # Eliminate any lines marked for clearing in the iterate phase
-        self.eliminate()
-
-        # Round the score to an int (although the score never has a decimal value other than 0 aside from floating point imprecision)
-        self.stats.score = round(self.stats.score)
-        self.spawn_piece(False)
-        self.hold_ready = True
-        self.update_preview()
-
-    # Iterate/Pattern/Eliminate Phase
-    def iterate(self, rows: set[int]):
-        self.game_phase = GamePhase.ITERATE
-        self.clears = []
-        # If a row has a value in each position, add it to the list of lines to be cleared
-        for i in rows:
-            for j in range(GRID_DIMS[0]):
-                if not self.grid[i][j]:
-                    break
-            else:
-                self.clears.append(i)
-
-        self.cleared_lines = len(self.clears)
-        self.stats.total_clears += self.cleared_lines
-        # If a new level has been reached and does not exceed the maximum
-
-    # Calculate scores
-    def score(self):
-        # Indicates if score has been applied to prevent T-Spins getting extra points from clearing lines
-        scored = False
-        # increment combo
-        if self.cleared_lines > 0:
-            self.combo += 1
-        self.game_phase = GamePhase.COMPLETION
-        # Hard drop score, active piece is not moved on a hard drop, so the difference between it and the ghost is the number of lines dropped
-        self.stats.score += (self.active_piece.center[1] - self.ghost.center[1]) * SCORE_DATA['hard_drop_mp']
-
-        # Sets the effective multiplier for the back-to-back bonus
-        if self.back_to_back_bonus:
-            eff_back_to_back_mp = SCORE_DATA['back_to_back_mp']
-        else:
-            eff_back_to_back_mp = 1
-
-        # If the active piece is a 'T' and the last movement was a rotation, check for a T-Spin
-        if self.active_piece.type == 'T' and self.active_piece.rotation_point != -1:
-            # A T-Spin/Mini T-Spin is when a 'T' piece is placed in a position where at least 3
-            # of the 4 corners diagonally adjacent to its center are occupied or out of bounds, or rotation point 5 is used
-            # A rotation must be the last successful movement to count
-
-            # the indices of corners[] (after rotation is applied) correspond with the numbers in the diagram below
-            # Hashes represent the piece, underscore represents a blank tile, if rotated, the corner indices rotate as well
-            # 0#1
-            # ###
-            # 3_2
-            corners = [[-1, 1], [1, 1], [1, -1], [-1, -1]]
-            # Align corners with the active piece's rotation
-            for i in range(self.active_piece.rotation):
-                corners.insert(0, corners.pop())
-
-            # Convert corners into an array of booleans that indicate if a corner (relative to the active piece's center) is occupied/out of bounds
-            for i, corner in enumerate([[self.active_piece.center[i] + corners[j][i] for i in range(2)] for j in range(4)]):
-                try:
-                    corners[i] = bool(self.grid[corner[1]][corner[0]])
-                # Out of bounds
-                except:
-                    corners[i] = True
-
-            # Normal T-Spin
-            # If corners 0 and 1 are occupied or the final rotation used rotation point 4 (guideline says rotation point 5, but this is 0-indexed)
-            if (corners[0] and corners[1] and (corners[2] or corners[3])) or self.active_piece.rotation_point == 4:
-                self.stats.score += SCORE_DATA['t_spin'][self.cleared_lines] * eff_back_to_back_mp * self.stats.level
-                self.stats.t_spin[self.cleared_lines] += 1
-                # A T-Spin without any clears does not reset the back-to-back bonus, but does not start it either
-                if self.cleared_lines > 0:
-                    self.back_to_back_bonus = True
-                scored = True
-
-            # Mini T-Spin
-            # If at least 3 of the corners are occupied/out of bounds and the last movement was a rotation
-            elif sum(corners) >= 3:
-                self.stats.score += SCORE_DATA['t_spin'][self.cleared_lines] * self.stats.level
-                self.stats.mini_t_spin[self.cleared_lines] += 1
-                if self.cleared_lines > 0:
-                    self.back_to_back_bonus = True
-                scored = True
-
-        # If T-Spin points were already awarded, don't add points for normal clears
-        if not scored:
-            # Reset the back-to-back multiplier if the placement was not a tetris (i.e. 4 line clears)
-            if self.cleared_lines != 4:
-                eff_back_to_back_mp = 1
-            if self.cleared_lines > 0:
-                self.stats.score += SCORE_DATA['normal_clear'][self.cleared_lines - 1] * eff_back_to_back_mp * self.stats.level
-
-            if self.cleared_lines == 4:
-                self.back_to_back_bonus = True
-            else:
-                self.back_to_back_bonus = False
-
-        # Add combo score
-        if self.combo:
-            self.stats.score += (self.combo - 1) * SCORE_DATA['combo_mp'] * self.stats.level
-
-    def eliminate(self):
-        # Eliminate Phase
-        # Remove rows starting from the highest to prevent row numbers being offset
-        self.clears.sort()
-        for row in reversed(self.clears):
-            self.grid.pop(row)
-            # Add a new row at the top to replace the old row (This avoids moving every tile down)
-            self.grid.append([])
-            for j in range(GRID_DIMS[0]):
-                self.grid[-1].append('')
-        if self.stats.total_clears // 10 > self.stats.level and self.stats.level < MAX_LEVEL:
-            self.stats.level += 1
-            # Calculate and apply new fall interval
-            self.fall_interval = pow((0.8 - ((self.stats.level - 1) * 0.007)), self.stats.level)
+        # Release actions whose key changed, otherwise they would stay held because the release of the old key is ignored
+        for action in ACTIONS:
+            if action in self.engine.held_actions and getattr(settings, action) != getattr(self.settings, action):
+                self.engine.queue_input(action, False, perf_counter())
+
+        self.settings = settings
+        self.actions = {getattr(settings, action): action for action in ACTIONS}
+        self.engine.set_settings(settings)
+        for text in (self.score_text, self.hold_text, self.game_over_text, self.timing_text):
+            text.color = settings.colors['text']
+        self.redraw_all = True
 
     def on_draw(self):
         self.clear()
@@ -623,221 +425,199 @@ class MyGame(arcade.Window):
         self.preview_grid_sprite_list.draw()
         self.hold_grid_sprite_list.draw()
 
+        # Background of the game over text
+        if self.engine.game_ended:
+            arcade.draw_xywh_rectangle_filled(
+                self.scale.grid_pos[0],
+                self.scale.grid_pos[1] + self.scale.grid_size[1] // 2 - self.scale.font_size * 2,
+                self.scale.grid_size[1], self.scale.font_size * 4,
+                self.settings.colors['background'])
+
+        self.draw_labels()
+
+        if self.frame_timer:
+            self.draw_timing_hud()
+
+        if self.cached_window_size:
+            # The monitors are probed in the background so it doesn't delay the first frame
+            Thread(target=refresh_window_size, args=(self.cached_window_size,), daemon=True).start()
+            self.cached_window_size = None
+
+        if self.startup_timer:
+            self.mark_startup('draw')
+            print(self.startup_timer.report())
+            self.startup_timer = None
+            arcade.exit()
+
+    # Turns the timing HUD on or off, methods are only wrapped with timers while it is on (see timing.py)
+    def toggle_timing_hud(self):
+        if self.frame_timer:
+            self.frame_timer.unwrap_all()
+            self.frame_timer = None
+            self.engine.input_latencies = None
+            return
+
+        self.frame_timer = FrameTimer(self.settings.timing_hud_frames)
+        for name, section in (('on_update', 'update'), ('on_draw', 'draw'), ('redraw_grid', None), ('update_text', None), ('on_resize', None)):
+            self.frame_timer.wrap(self, name, section)
+        for name in ('update_ghost', 'rotate_active', 'place_piece'):
+            self.frame_timer.wrap(self.engine, name)
+        # Time from receiving each key event to the update that applied it
+        self.engine.input_latencies = self.frame_timer.history['input_latency']
+        self.timing_text_time = 0
+
+    # Draws the min/avg/p99 time of each section and a graph of the frame times in the top left corner
+    def draw_timing_hud(self):
+        timer = self.frame_timer
+        margin = self.scale.info_offset
+        # Nothing has been timed until the first update after the HUD is turned on
+        if timer.frame_start is None:
+            return
+
+        # The text is only laid out again a few times per second
+        if timer.frame_start - self.timing_text_time >= TIMING_HUD_REFRESH:
+            self.timing_text_time = timer.frame_start
+            lines = [f'{"ms":<14}{"min":>7}{"avg":>7}{"p99":>7}']
+            for section in SECTIONS + ['input_latency']:
+                lines.append(f'{section:<14}' + ''.join(f'{value * 1000:7.2f}' for value in timer.summary(section)))
+            self.timing_text.text = '\n'.join(lines)
+        if self.timing_text.position != (margin, self.scale.size[1] - margin):
+            self.timing_text.position = (margin, self.scale.size[1] - margin)
+        self.timing_text.draw()
+
+        # Frame time graph below the text, the line across it is 1/60 of a second
+        frames = timer.history['frame']
+        if len(frames) < 2:
+            return
+        top = self.scale.size[1] - margin - self.timing_text.content_height - margin
+        bottom = top - TIMING_GRAPH_SIZE[1]
+        arcade.draw_xywh_rectangle_filled(margin, bottom, TIMING_GRAPH_SIZE[0], TIMING_GRAPH_SIZE[1], self.settings.colors['background'])
+        target = bottom + TIMING_GRAPH_SCALE / 60
+        arcade.draw_line(margin, target, margin + TIMING_GRAPH_SIZE[0], target, self.settings.colors['grid_lines'])
+        step = TIMING_GRAPH_SIZE[0] / (timer.frames - 1)
+        arcade.draw_line_strip(
+            [(margin + i * step, bottom + min(TIMING_GRAPH_SIZE[1], frame * TIMING_GRAPH_SCALE)) for i, frame in enumerate(frames)],
+            self.settings.colors['text'])
+
+    # Draws the score, the Hold label and the game over text
+    def draw_labels(self):
         # Draw score
-        arcade.draw_text(
-            f'Score:\n{self.stats.score}\nLevel: {self.stats.level}',
+        self.update_text(
+            self.score_text,
+            f'Score:\n{self.engine.stats.score}\nLevel: {self.engine.stats.level}',
             self.scale.hold_pos[0], self.scale.hold_pos[1] - self.scale.font_size * 2,
-            font_size=self.scale.font_size,
-            width=self.scale.hold_size[0],
-            align='center',
-            color=self.settings.colors['text'])
+            self.scale.hold_size[0])
+        self.score_text.draw()
 
         # Draw Hold label if the hold is empty (this is just to indicate that there is a hold feature,
         # but is unnecessary to render once a piece is in it)
-        if not self.hold:
-            arcade.draw_text(
-                f'Hold',
+        if not self.engine.hold:
+            self.update_text(
+                self.hold_text,
+                'Hold',
                 self.scale.hold_pos[0],
                 self.scale.hold_pos[1] + (self.scale.hold_size[1] - self.scale.font_size) / 2,
-                width=self.scale.hold_size[0],
-                font_size=self.scale.font_size,
-                align='center',
-                color=self.settings.colors['text'])
-
-        if self.game_ended:
-            arcade.draw_xywh_rectangle_filled(
-                self.scale.grid_pos[0],
-                self.scale.grid_pos[1] + self.scale.grid_size[1] // 2 - self.scale.font_size * 2,
-                self.scale.grid_size[1], self.scale.font_size * 4,
-                self.settings.colors['background'])
+                self.scale.hold_size[0])
+            self.hold_text.draw()
 
-            arcade.draw_text(
-                f'Game Over\nScore: {self.stats.score}',
+        if self.engine.game_ended:
+            self.update_text(
+                self.game_over_text,
+                f'Game Over\nScore: {self.engine.stats.score}',
                 self.scale.grid_pos[0], self.scale.grid_pos[1] + self.scale.grid_size[1] // 2 + round(self.scale.font_size * 0.5),
-                self.settings.colors['text'],
-                self.scale.font_size,
-                self.scale.grid_size[0], 'center')
-
-    # Update the preview grid
-    def update_preview(self):
-        type = self.bag[PREVIEW_COUNT - 1]
-        del self.preview_grid[PREVIEW_GRID_DIMS[1] - 2:PREVIEW_GRID_DIMS[1] - 1]
-        # For each tile in 1 section of the preview grid
-        for i in range(round(PREVIEW_GRID_DIMS[1] / PREVIEW_COUNT)):
-            self.preview_grid.insert(0, [])
-            for j in range(PREVIEW_GRID_DIMS[0]):
-                self.preview_grid[0].append('background')
-        for tile in SPAWN_POSITIONS[type]:
-            self.preview_grid[INFO_CENTER_SPAWN[1] + tile[1]][INFO_CENTER_SPAWN[0] + tile[0]] = type
-
-    # Update the hold grid
-    def update_hold(self):
-        for i in range(INFO_GRID_DIMS[1]):
-            for j in range(INFO_GRID_DIMS[0]):
-                self.hold_grid[i][j] = 'background'
-
-        for tile in SPAWN_POSITIONS[self.hold]:
-            self.hold_grid[INFO_CENTER_SPAWN[1] + tile[1]][INFO_CENTER_SPAWN[0] + tile[0]] = self.hold
-
-    def rotate_active(self, steps: int) -> bool:
-        # The 'Super Rotation System' is rather unintuitive,
-        # I won't bother trying to fully explain it here, but these sources do a good job
-        # https://tetris.wiki/Super_Rotation_System
-        # https://www.youtube.com/watch?v=yIpk5TJ_uaI
-
-        # Stores the position of the piece after being rotated
-        rotated_piece = copy.deepcopy(self.active_piece)
-        rotated_piece.rotation = (self.active_piece.rotation + steps) % 4
-        # Stores the new position
-        new_position = copy.deepcopy(self.active_piece)
-
-        # Rotate pieces around the center
-        # for each step: for each tile: new_pos = (y, -x) (relative to center piece)
-        rotated_piece.tiles = [[
-            rotated_piece.center[j] + [
-                steps * (rotated_piece.tiles[i][1] - rotated_piece.center[1]),
-                - steps * ((rotated_piece.tiles[i][0] - rotated_piece.center[0]))][j]
-            for j in range(2)]
-            for i in range(4)]
-
-        # The number of rotation tests to apply (1 for an 'O' piece, 5 for everything else)
-        test_count = len(OFFSETS[self.active_piece.type][0])
-
-        # The offsets for each test to be applied
-        offset_data = [[
-            OFFSETS[self.active_piece.type][self.active_piece.rotation][test][i] -
-            OFFSETS[self.active_piece.type][rotated_piece.rotation][test][i]
-            for i in range(2)]
-            for test in range(test_count)]
-
-        # Attempt each of the 5 translations
-        for test in range(5):
-
-            # Set the tile positions according to the offset
-            new_position = copy.deepcopy(rotated_piece.tiles)
-            if not (offset_data[test][0] == 0 and offset_data[test][1] == 0):
-                self.move_tiles(new_position, offset_data[test][0], offset_data[test][1])
-
-            # Check if the new tile positions are occupied
-            if self.is_valid_pos(new_position):
-                self.active_piece = copy.deepcopy(rotated_piece)
-                self.active_piece.tiles = new_position
-                self.active_piece.center = [rotated_piece.center[i] + offset_data[test][i] for i in range(2)]
-                # Stores the index of the successful test,
-                # if the piece is a 'T', this will be used in score() to identify what type of T-Spin (if any) was preformed
-                self.active_piece.rotation_point = test
-                return True
-
-        return False
-
-    # Translates the active piece by the given value, returns false if it fails
-    def move_tiles(self, tiles: list[list[int]], x: int, y: int, center: list[int] = None) -> bool:
-        # Add tile coordinates after translation to new_pos
-        new_pos = [[tile[j] + [x, y][j] for j in range(2)] for tile in tiles]
-        if self.is_valid_pos(new_pos):
-            tiles[:] = new_pos
-            if center:
-                center[:] = [center[i] + [x, y][i] for i in range(2)]
-                # If center is an argument, it can be assumed the active piece was moved
-                self.check_lowest_pos()
-                self.active_piece.rotation_point = -1
-            return True
-        return False
-
-    # Checks if a list of tiles overlaps any placed tiles or is out of bounds
-    def is_valid_pos(self, tiles: list[list[int]]) -> bool:
-        for tile in tiles:
-            if not (0 <= tile[0] < GRID_DIMS[0] and 0 <= tile[1] < GRID_DIMS[1]):
-                return False
-
-            elif self.grid[tile[1]][tile[0]]:
-                return False
-
-        return True
-
-    # Updates the current position of the ghost tiles
-    def update_ghost(self):
-        new_ghost = GhostPiece
-        new_ghost.tiles = copy.deepcopy(self.active_piece.tiles)
-        new_ghost.center = copy.deepcopy(self.active_piece.center)
-        for i in range(GRID_DIMS[1]):
-            if not self.is_valid_pos(new_ghost.tiles):
-                return
-            self.ghost.tiles = copy.deepcopy(new_ghost.tiles)
-            self.ghost.center = copy.deepcopy(new_ghost.center)
-
-            for j in range(4):
-                new_ghost.tiles[j][1] -= 1
-            new_ghost.center[1] -= 1
-
-    # When the active piece moves or rotates, if the lowest y position is less than the previous lowest for the piece, reset the lock_counter
-    def check_lowest_pos(self):
-        for tile in self.active_piece.tiles:
-            if tile[1] < self.active_piece.lowest_line:
-                self.active_piece.lowest_line = tile[1]
-                self.active_piece.lock_counter = 0
-                self.game_phase = GamePhase.FALLING
-
-    # Pause or unpause the game
-    def pause(self, new_pause_state: bool):
-        # If unpaused after the game has ended, reset the game
-        if self.paused and self.game_ended:
-            self.setup()
-        else:
-            self.paused = new_pause_state
-
+                self.scale.grid_size[0])
+            self.game_over_text.draw()
+
+    # Changes a cached arcade.Text, each property is only set if it is different because setting any of them lays out the text again
+    def update_text(self, text: arcade.Text, value: str, x: float, y: float, width: int):
+        if text.text != value:
+            text.text = value
+        if text.position != (x, y):
+            text.position = (x, y)
+        if text.font_size != self.scale.font_size:
+            text.font_size = self.scale.font_size
+        if text.width != width:
+            text.width = width
+
+    # Called by the engine when the game ends
     def game_over(self, reason: str):
+        stats = self.engine.stats
+        cur_time = self.engine.cur_time
         # Print scores to terminal (didn't have time to make a GUI for this)
         print(
             f'Game Over: {reason}\n'
-            f'Score: {self.stats.score}\n'
-            f'Time: {int(self.cur_time // 60)}m {round(self.cur_time % 60)}s\n'
-            f'Level: {self.stats.level}\n'
-            f'Total Clears: {self.stats.total_clears}\n'
+            f'Score: {stats.score}\n'
+            f'Time: {int(cur_time // 60)}m {round(cur_time % 60)}s\n'
+            f'Level: {stats.level}\n'
+            f'Total Clears: {stats.total_clears}\n'
             f'Clears by line count (excluding T-Spins):\n'
-            f'1: {self.stats.clears[0]}, 2: {self.stats.clears[1]}, 3: {self.stats.clears[2]}, 4: {self.stats.clears[3]}\n'
+            f'1: {stats.clears[0]}, 2: {stats.clears[1]}, 3: {stats.clears[2]}, 4: {stats.clears[3]}\n'
             f'T-Spins by line count:\n'
-            f'0: {self.stats.t_spin[0]}, 1: {self.stats.t_spin[1]}, 2: {self.stats.t_spin[2]}, 3: {self.stats.t_spin[3]}\n'
+            f'0: {stats.t_spin[0]}, 1: {stats.t_spin[1]}, 2: {stats.t_spin[2]}, 3: {stats.t_spin[3]}\n'
             f'Mini T-Spins by line count:\n'
-            f'0: {self.stats.mini_t_spin[0]}, 1: {self.stats.mini_t_spin[1]}')
-
-        # Create a new score file if it does not exist
-        if not exists(SCORE_FILE):
-            with open(SCORE_FILE, 'w') as file:
-                file.write()
-
-        with open(SCORE_FILE, 'r') as file:
-            lines = []
-            for line in file.readlines():
-                try:
-                    lines.append(int(line))
-                except:
-                    pass
-            lines.reverse()
-            add_score = False
-            if len(lines) == 0:
-                add_score = True
-            elif self.stats.score >= lines[0]:
-                add_score = True
-            if add_score:
-                print('New High Score!')
-            insort(lines, self.stats.score)
-            if len(lines) > MAX_SAVED_SCORES:
-                lines.pop()
-        scores = ('\n'.join([str(line) for line in reversed(lines)]))
-        print(f'High Scores:\n{scores}')
+            f'0: {stats.mini_t_spin[0]}, 1: {stats.mini_t_spin[1]}')
+
+        if self.versus:
+            self.versus.game_over(reason)
+
+        # The replay is finished after this update (see update_replay()), it can be verified with recording.py or seeked with replayfile.py
+        replay = self.replay_writer.path
+        print(f'Replay saved to {replay}')
 
-        # Write scores to file
-        with open(SCORE_FILE, 'w') as file:
-            file.write(scores + '\n')
-        self.game_ended = True
-        self.pause(True)
+        if self.engine.practice:
+            return
+
+        if self.scores is None:
+            self.scores = ScoreStore()
+            self.scores.migrate_score_file()
+        best = self.scores.top(1)
+        self.scores.add(ScoreEntry(
+            stats.score, stats.level, stats.total_clears, cur_time, self.player, reason, self.engine.game_seed, replay))
+        if not best or stats.score >= best[0].score:
+            print('New High Score!')
+
+        scores = '\n'.join(str(entry.score) for entry in self.scores.top(MAX_SAVED_SCORES))
+        print(f'High Scores:\n{scores}')
 
 
 def main():
     '''Main function'''
-    window = MyGame()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Play Pytris')
+    parser.add_argument('--startup-benchmark', action='store_true', help='print the time taken by each phase of starting the game and exit after the first frame')
+    parser.add_argument('--connect', metavar='HOST:PORT', help='play a versus match on a server started with versus.py server')
+    parser.add_argument('--name', default=default_player(), help='name shown to other players in versus matches')
+    parser.add_argument('--spectate-port', type=int, metavar='PORT', help='let spectators watch the game on this port (see spectate.py watch)')
+    parser.add_argument('--practice', action='store_true', help='allow undoing and redoing pieces and rewinding, the score is not saved')
+    args = parser.parse_args()
+    if args.practice and args.connect:
+        parser.error('--practice can not be used in versus matches')
+
+    startup_timer = None
+    if args.startup_benchmark:
+        startup_timer = StartupTimer(START_TIME)
+        startup_timer.mark('imports')
+
+    versus = None
+    if args.connect:
+        # Imported here so the network modules aren't loaded unless they are used
+        from versus import VersusClient
+
+        host, port = args.connect.rsplit(':', 1)
+        client = VersusClient(host, int(port))
+        print(f'Waiting for the match to start on {args.connect}')
+        try:
+            player, players, seed, randomizer = client.join(args.name)
+        except ConnectionError as ex:
+            print(ex)
+            exit(1)
+        print(f'You are player {player} of {players}')
+        versus = (client, seed, randomizer)
+
+    window = MyGame(startup_timer, versus=versus, spectate_port=args.spectate_port, practice=args.practice)
     window.setup()
+    window.mark_startup('setup')
     arcade.run()
 
 
@@ -0,0 +1,123 @@
+from globals import FULL_ROW, GRID_DIMS
+from random import Random
+from srs import ROTATIONS
+
+# Policies decide the inputs for each piece when games are simulated without a window (see simulate.py)
+# A policy is called with the engine when a new piece has spawned and returns the actions to press for that piece,
+# the last action should be 'hard_drop' so that the piece is placed
+# 'move_down' is held for one tick (i.e. a soft drop to the floor with drop_auto_repeat_rate = 0)
+
+# Actions the random policy chooses from (pause and restart are left out so games always finish)
+RANDOM_ACTIONS = ['move_left', 'move_right', 'move_down', 'hold', 'rotate_clockwise', 'rotate_counter_clockwise', 'rotate_flip']
+
+# The action that rotates a piece from its spawn rotation to each rotation (index = rotation), and the steps it applies
+ROTATION_ACTIONS = [([], ()), (['rotate_clockwise'], (1,)), (['rotate_flip'], (1, 1)), (['rotate_counter_clockwise'], (-1,))]
+
+
+# Returns (x, y, rotation, shape) of the active piece after applying each rotation step (the same way GameEngine.rotate_active() does),
+# or None if any of the rotations fail
+def rotated_position(game, steps: tuple):
+    piece = game.active_piece
+    x, y, rotation, shape = piece.x, piece.y, piece.rotation, piece.shape
+    for step in steps:
+        rotation, shape, kicks = ROTATIONS[piece.type][rotation][step]
+        test = game.find_kick(shape, kicks, x, y)
+        if test == -1:
+            return None
+        x, y = x + kicks[test][0], y + kicks[test][1]
+    return x, y, rotation, shape
+
+
+# Presses random actions before each hard drop
+class RandomPolicy:
+    def __init__(self, seed: int = None, max_actions: int = 6):
+        self.random = Random(seed)
+        self.max_actions = max_actions
+
+    def __call__(self, game) -> list[str]:
+        return [self.random.choice(RANDOM_ACTIONS) for i in range(self.random.randrange(self.max_actions + 1))] + ['hard_drop']
+
+
+# Repeats a fixed list of input sequences, one sequence per piece
+class ScriptedPolicy:
+    def __init__(self, script: list[list[str]]):
+        self.script = script
+        self.index = 0
+
+    # Loads a script with one sequence per line, actions are separated by spaces (e.g. 'rotate_clockwise move_left hard_drop')
+    @classmethod
+    def from_file(cls, path: str):
+        with open(path, 'r') as file:
+            return cls([line.split() for line in file if line.strip() and not line.startswith('#')])
+
+    def __call__(self, game) -> list[str]:
+        actions = self.script[self.index % len(self.script)]
+        self.index += 1
+        if not actions or actions[-1] != 'hard_drop':
+            actions = actions + ['hard_drop']
+        return actions
+
+
+# Tries every rotation and column the piece can be hard dropped in from spawn, and picks the board that scores best on
+# a weighted sum of aggregate height, completed lines, holes and bumpiness
+class HeuristicPolicy:
+    # Weights from https://codemyroad.wordpress.com/2013/04/14/tetris-ai-the-near-perfect-player/
+    def __init__(self, height: float = -0.510066, lines: float = 0.760666, holes: float = -0.35663, bumpiness: float = -0.184483):
+        self.weights = (height, lines, holes, bumpiness)
+
+    def __call__(self, game) -> list[str]:
+        best, best_actions = None, ['hard_drop']
+
+        for rotation_actions, steps in ROTATION_ACTIONS:
+            position = rotated_position(game, steps)
+            if position is None:
+                continue
+            x, y, rotation, shape = position
+
+            # Try every column the rotated piece can be moved to
+            for direction, action in ((-1, 'move_left'), (1, 'move_right')):
+                target = x if direction == -1 else x + 1
+                while game.shape_fits(shape, target, y):
+                    value = self.evaluate(game.rows, shape, target, y - game.drop_distance(shape, target, y))
+                    if best is None or value > best:
+                        best = value
+                        best_actions = rotation_actions + [action] * abs(target - x) + ['hard_drop']
+                    target += direction
+
+        return best_actions
+
+    # Scores the board after placing a shape centered at (x, y)
+    def evaluate(self, rows: list[int], shape, x: int, y: int) -> float:
+        rows = rows[:]
+        for dy, mask in shape.masks[x]:
+            rows[y + dy] |= mask
+        remaining = [row for row in rows if row != FULL_ROW]
+        lines = len(rows) - len(remaining)
+
+        heights = [0] * GRID_DIMS[0]
+        holes = 0
+        for column in range(GRID_DIMS[0]):
+            bit = 1 << column
+            for row in range(len(remaining) - 1, -1, -1):
+                if remaining[row] & bit:
+                    heights[column] = row + 1
+                    break
+            holes += sum(1 for row in range(heights[column]) if not remaining[row] & bit)
+
+        bumpiness = sum(abs(heights[i] - heights[i + 1]) for i in range(GRID_DIMS[0] - 1))
+        return (self.weights[0] * sum(heights) + self.weights[1] * lines
+                + self.weights[2] * holes + self.weights[3] * bumpiness)
+
+
+# evaluate.AutoPlayer, imported when used so the other policies don't require NumPy
+def autoplay_policy():
+    from evaluate import AutoPlayer
+    return AutoPlayer()
+
+
+POLICIES = {
+    'random': RandomPolicy,
+    'scripted': ScriptedPolicy.from_file,
+    'heuristic': HeuristicPolicy,
+    'autoplay': autoplay_policy
+}
@@ -0,0 +1,211 @@
+from globals import BoardDelta, FULL_ROW, GARBAGE_TILE, GRID_DIMS
+from srs import SHAPES
+import struct
+
+# Binary messages for versus mode (see versus.py)
+# Every message is framed as (1 byte length, 1 byte message type, body), so a message is at most 255 bytes after the length
+# Boards are never sent whole, a player sends a BoardDelta after each placed piece (about 13 bytes) and everyone else applies it to
+# their copy of that player's board (see apply_delta())
+
+# Message types
+HELLO = 1         # client -> server: name
+START = 2         # server -> client: player id, number of players, seed, randomizer name
+PIECE = 3         # client -> server: sequence number, BoardDelta
+OPPONENT = 4      # server -> client: player id, sequence number, BoardDelta (another player's piece)
+ACK = 5           # server -> client: sequence number of a received PIECE (used to measure latency)
+GARBAGE = 6       # server -> client: player id of the sender, lines, hole column
+GAME_OVER = 7     # client -> server: reason
+PLAYER_OUT = 8    # server -> client: player id, place (1 = winner)
+END = 9           # server -> client: player id of the winner (255 if nobody won)
+
+# Used for piece types on the wire
+PIECE_TYPES = ('I', 'J', 'L', 'O', 'S', 'T', 'Z')
+
+# Tile types of grid rows (see encode_row()), used by spectators (spectate.py) and replay keyframes (replayfile.py)
+TILE_TYPES = ('', 'I', 'J', 'L', 'O', 'S', 'T', 'Z', GARBAGE_TILE)
+TILE_CODES = {type: code for code, type in enumerate(TILE_TYPES)}
+ROW_BYTES = (GRID_DIMS[0] * 4 + 7) // 8
+
+HEADER = struct.Struct('<BB')
+START_BODY = struct.Struct('<BBI')
+# Sequence number, type * 4 + rotation, x, y, bitmask of cleared rows, attack, number of garbage entries
+PIECE_BODY = struct.Struct('<HBbBIBB')
+GARBAGE_ENTRY = struct.Struct('<BB')
+PLAYER_BODY = struct.Struct('<B')
+ACK_BODY = struct.Struct('<H')
+GARBAGE_BODY = struct.Struct('<BBB')
+PLAYER_OUT_BODY = struct.Struct('<BB')
+
+
+def frame(message_type: int, body: bytes = b'') -> bytes:
+    return HEADER.pack(len(body) + 1, message_type) + body
+
+
+# Names are cut to 250 bytes, on a character boundary
+def encode_string(value: str) -> bytes:
+    return value.encode()[:250].decode(errors='ignore').encode()
+
+
+def encode_delta(sequence: int, delta: BoardDelta) -> bytes:
+    cleared = 0
+    for row in delta.cleared:
+        cleared |= 1 << row
+    return PIECE_BODY.pack(sequence & 0xFFFF, PIECE_TYPES.index(delta.type) * 4 + delta.rotation, delta.x, delta.y, cleared,
+                           delta.attack, len(delta.garbage)) + b''.join(GARBAGE_ENTRY.pack(*entry) for entry in delta.garbage)
+
+
+# Returns (sequence number, BoardDelta) from the start of body
+def decode_delta(body: bytes, offset: int = 0) -> tuple[int, BoardDelta]:
+    sequence, piece, x, y, cleared, attack, count = PIECE_BODY.unpack_from(body, offset)
+    offset += PIECE_BODY.size
+    garbage = tuple(GARBAGE_ENTRY.unpack_from(body, offset + i * GARBAGE_ENTRY.size) for i in range(count))
+    rows = tuple(row for row in range(GRID_DIMS[1]) if cleared >> row & 1)
+    return sequence, BoardDelta(PIECE_TYPES[piece // 4], piece % 4, x, y, rows, attack, garbage)
+
+
+# A row of tile types (e.g. GameEngine.grid[row]) with each tile as 4 bits, 5 bytes for a 10 wide grid
+def encode_row(row: list[str]) -> bytes:
+    value = 0
+    for column, tile in enumerate(row):
+        value |= TILE_CODES[tile] << column * 4
+    return value.to_bytes(ROW_BYTES, 'little')
+
+
+def decode_row(data: bytes) -> tuple[str, ...]:
+    value = int.from_bytes(data, 'little')
+    return tuple(TILE_TYPES[value >> column * 4 & 15] for column in range(GRID_DIMS[0]))
+
+
+# Unsigned integers of any size, 7 bits per byte (e.g. scores, which can pass 2 ** 32 in long games), used by spectate.py and replayfile.py
+def write_varint(buffer: bytearray, value: int):
+    while value >= 0x80:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+# Returns (value, offset after it)
+def read_varint(data, offset: int) -> tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def hello(name: str) -> bytes:
+    return frame(HELLO, encode_string(name))
+
+
+def start(player: int, players: int, seed: int, randomizer: str) -> bytes:
+    return frame(START, START_BODY.pack(player, players, seed) + encode_string(randomizer))
+
+
+def piece(sequence: int, delta: BoardDelta) -> bytes:
+    return frame(PIECE, encode_delta(sequence, delta))
+
+
+# Forwards the body of a PIECE message from a player without decoding it
+def opponent(player: int, body: bytes) -> bytes:
+    return frame(OPPONENT, PLAYER_BODY.pack(player) + body)
+
+
+def ack(sequence: int) -> bytes:
+    return frame(ACK, ACK_BODY.pack(sequence))
+
+
+def garbage(player: int, lines: int, hole: int) -> bytes:
+    return frame(GARBAGE, GARBAGE_BODY.pack(player, lines, hole))
+
+
+def game_over(reason: str) -> bytes:
+    return frame(GAME_OVER, encode_string(reason))
+
+
+def player_out(player: int, place: int) -> bytes:
+    return frame(PLAYER_OUT, PLAYER_OUT_BODY.pack(player, place))
+
+
+def end(winner: int) -> bytes:
+    return frame(END, PLAYER_BODY.pack(255 if winner is None else winner))
+
+
+# Decodes the body of a message into a tuple of its values (see the message types above)
+def decode(message_type: int, body: bytes) -> tuple:
+    if message_type in (HELLO, GAME_OVER):
+        # Strings come from other players, invalid UTF-8 mustn't stop the server
+        return (body.decode(errors='replace'),)
+    if message_type == START:
+        return START_BODY.unpack_from(body) + (body[START_BODY.size:].decode(errors='replace'),)
+    if message_type == PIECE:
+        return decode_delta(body)
+    if message_type == OPPONENT:
+        return (body[0],) + decode_delta(body, PLAYER_BODY.size)
+    if message_type == ACK:
+        return ACK_BODY.unpack(body)
+    if message_type == GARBAGE:
+        return GARBAGE_BODY.unpack(body)
+    if message_type == PLAYER_OUT:
+        return PLAYER_OUT_BODY.unpack(body)
+    if message_type == END:
+        return (None if body[0] == 255 else body[0],)
+    raise ValueError(f'Unknown message type {message_type}')
+
+
+# Splits a stream of bytes (e.g. from a TCP socket) into messages
+class MessageReader:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    # Adds received bytes and returns every complete message as (message type, body)
+    def feed(self, data: bytes) -> list[tuple[int, bytes]]:
+        buffer = self.buffer
+        buffer += data
+        messages = []
+        offset = 0
+        while offset < len(buffer) and offset + 1 + buffer[offset] <= len(buffer):
+            length = buffer[offset]
+            messages.append((buffer[offset + 1], bytes(buffer[offset + 2:offset + 1 + length])))
+            offset += 1 + length
+        del buffer[:offset]
+        return messages
+
+
+# Applies a BoardDelta to a board (row bitmasks, like GameEngine.rows) the same way the engine placed the piece
+# Returns False if the garbage pushed tiles out of the grid (the player topped out)
+# Raises ValueError, leaving the board unchanged, if the delta couldn't have come from this board (the piece overlaps tiles or is
+# outside the grid, the cleared rows aren't the rows it filled, or the garbage doesn't fit), the client isn't trusted
+def apply_delta(rows: list[int], delta: BoardDelta) -> bool:
+    masks = SHAPES[delta.type][delta.rotation].masks.get(delta.x)
+    if masks is None:
+        raise ValueError(f'{delta.type} piece placed outside the grid (column {delta.x})')
+    placed = rows[:]
+    for dy, mask in masks:
+        row = delta.y + dy
+        if not 0 <= row < GRID_DIMS[1]:
+            raise ValueError(f'{delta.type} piece placed outside the grid (row {row})')
+        if placed[row] & mask:
+            raise ValueError(f'{delta.type} piece overlaps tiles in row {row}')
+        placed[row] |= mask
+
+    full = [row for row, mask in enumerate(placed) if mask == FULL_ROW]
+    if sorted(delta.cleared) != full:
+        raise ValueError(f'Cleared rows {sorted(delta.cleared)} don\'t match the full rows {full}')
+    for row in reversed(full):
+        del placed[row]
+    placed.extend([0] * len(full))
+
+    for lines, hole in delta.garbage:
+        if not 0 < lines <= GRID_DIMS[1] or not 0 <= hole < GRID_DIMS[0]:
+            raise ValueError(f'Invalid garbage ({lines} lines, hole in column {hole})')
+
+    rows[:] = placed
+    for lines, hole in delta.garbage:
+        if any(rows[GRID_DIMS[1] - lines:]):
+            return False
+        del rows[GRID_DIMS[1] - lines:]
+        rows[0:0] = [FULL_ROW & ~(1 << hole)] * lines
+    return True
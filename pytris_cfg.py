@@ -1,12 +1,15 @@
 import arcade.key
 from ast import literal_eval
 import configparser
-from globals import CONFIG_FILE, Settings
+from dataclasses import asdict
+from globals import CONFIG_CACHE, CONFIG_FILE, Settings
+from hashlib import sha256
+import json
+import os
 from os.path import exists
 
-
-
-config = configparser.ConfigParser(allow_no_value=True, comment_prefixes='#')
+# Changing this invalidates existing config caches (e.g. when Settings changes)
+CACHE_VERSION = 2
 
 # Default config values
 DEFAULT_CONFIG = {
@@ -22,7 +25,12 @@ DEFAULT_CONFIG = {
         'rotate_counter_clockwise': 'Z',
         'rotate_flip': 'F',
         'pause': 'ESCAPE',
-        'restart': 'F4'
+        'restart': 'F4',
+        '# Only used in practice mode (python main.py --practice)': None,
+        'undo': 'U',
+        'redo': 'I',
+        'rewind': 'BACKSPACE',
+        'toggle_timing_hud': 'F3'
     },
     'colors': {
         'empty_tile': '(0, 0, 0)',
@@ -50,78 +58,181 @@ DEFAULT_CONFIG = {
         'auto_repeat_rate': '0.005',
 
         '\n# The time between each movement while holding the down key': None,
-        'drop_auto_repeat_rate': '0'
+        'drop_auto_repeat_rate': '0',
+
+        '\n# Show how long frames and parts of each frame take (can also be toggled with toggle_timing_hud)': None,
+        'timing_hud': 'False',
+
+        '\n# The number of frames the timing HUD shows statistics for': None,
+        'timing_hud_frames': '120'
     }
 }
 
-# Loads and validates pytris.cfg, creates new cfg if missing
-def load_config(settings: Settings):
+# Keys added after the first release, configs written before them don't have them, so their default values are used when they are missing
+DEFAULTED_KEYS = {
+    'keybinds': ('undo', 'redo', 'rewind', 'toggle_timing_hud'),
+    'other': ('timing_hud', 'timing_hud_frames')
+}
+
+# Loads pytris.cfg (a new one is generated if it is missing) and returns it as Settings
+# The validated settings are cached in CONFIG_CACHE with the file's mtime and hash, so the config is only validated again when it changes
+# If the config has errors, the program exits, or previous is returned if it is given (i.e. when reloading while the game is running)
+def load_config(previous: Settings = None) -> Settings:
     new_config = False
     if not exists(CONFIG_FILE):
-        # Generate a new config
-        config['keybinds'] = DEFAULT_CONFIG['keybinds']
-        config['colors'] = DEFAULT_CONFIG['colors']
-        config['other'] = DEFAULT_CONFIG['other']
+        write_default_config()
+        new_config = True
 
-        with open(CONFIG_FILE, 'w') as file:
-            config.write(file)
+    stat = os.stat(CONFIG_FILE)
+    cache = read_cache()
+    # The file has not been modified since it was cached
+    if cache and cache['mtime'] == stat.st_mtime_ns and cache['size'] == stat.st_size:
+        return settings_from_cache(cache)
 
-        # Remove comments from config (configparser only removes comments when it is reading an existing config)
-        for section in config.sections():
-            for key, value in config[section].items():
-                if '#' in key:
-                    config.remove_option(section, key)
+    with open(CONFIG_FILE, 'rb') as file:
+        content = file.read()
+    digest = sha256(content).hexdigest()
 
-        print(f'New config generated at {CONFIG_FILE}')
-        new_config = True
+    # The file was modified (or copied) but its contents are the same
+    if cache and cache['hash'] == digest:
+        settings = settings_from_cache(cache)
+    else:
+        settings = compile_config(content.decode())
+        if settings is None:
+            print('One or more config errors found, fix errors or delete pytris.cfg to generate a new one')
+            if previous is None:
+                exit(1)
+            return previous
 
-    if validate_config():
-        if new_config:
-            print('The config is meant to be changed manually\n\nDefault Keybinds:')
-        for section in config.sections():
-            for key, value in config[section].items():
+    if new_config:
+        print('The config is meant to be changed manually\n\nDefault Keybinds:')
+        for key in DEFAULT_CONFIG['keybinds']:
+            if '#' not in key:
+                print(f'{key}: {DEFAULT_CONFIG["keybinds"][key]}')
 
-                # If the key is keybind, convert it to its corresponding key code (int)
-                if section == 'keybinds':
-                    setattr(settings, key, getattr(arcade.key, value))
-                    if new_config:
-                        print(f'{key}: {value}')
-                    continue
-
-                value = literal_eval(value)
-                if section == 'colors':
-                    # If the length of a key is 1, (i.e. the single-letter name of a piece), convert it to uppercase
-                    if len(key) == 1:
-                        settings.colors[key.upper()] = value
-                    # Empty tiles are represented by an empty string, but empty_tile is used in the config for clarity
-                    elif key == 'empty_tile':
-                        settings.colors[''] = value
-                    else:
-                        settings.colors[key] = value
+    write_cache(stat, digest, settings)
+    return settings
+
+
+# The modification time of pytris.cfg (None if it doesn't exist), used to check if it has changed
+def config_mtime() -> int:
+    try:
+        return os.stat(CONFIG_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def write_default_config():
+    config = configparser.ConfigParser(allow_no_value=True, comment_prefixes='#')
+    config['keybinds'] = DEFAULT_CONFIG['keybinds']
+    config['colors'] = DEFAULT_CONFIG['colors']
+    config['other'] = DEFAULT_CONFIG['other']
+
+    with open(CONFIG_FILE, 'w') as file:
+        config.write(file)
+
+    print(f'New config generated at {CONFIG_FILE}')
+
+
+# Validates a config and converts it to Settings, returns None if there are errors (they are printed)
+def compile_config(text: str) -> Settings:
+    config = configparser.ConfigParser(allow_no_value=True, comment_prefixes='#')
+    try:
+        config.read_string(text)
+    except configparser.Error as ex:
+        print(f'Config Error: {ex}')
+        return None
+
+    for section, keys in DEFAULTED_KEYS.items():
+        if config.has_section(section):
+            for key in keys:
+                if not config.has_option(section, key):
+                    config[section][key] = DEFAULT_CONFIG[section][key]
+
+    if not validate_config(config):
+        return None
+
+    values = {}
+    colors = {}
+    for section in config.sections():
+        for key, value in config[section].items():
+
+            # If the key is keybind, convert it to its corresponding key code (int)
+            if section == 'keybinds':
+                values[key] = getattr(arcade.key, value)
+                continue
+
+            value = literal_eval(value)
+            if section == 'colors':
+                # If the length of a key is 1, (i.e. the single-letter name of a piece), convert it to uppercase
+                if len(key) == 1:
+                    colors[key.upper()] = value
+                # Empty tiles are represented by an empty string, but empty_tile is used in the config for clarity
+                elif key == 'empty_tile':
+                    colors[''] = value
                 else:
-                    setattr(settings, key, value)
-    else:
-        print('One or more config errors found, fix errors or delete pytris.cfg to generate a new one')
-        exit(1)
+                    colors[key] = value
+            else:
+                values[key] = value
+
+    return Settings(colors=colors, **values)
+
 
+def read_cache() -> dict:
+    try:
+        with open(CONFIG_CACHE, 'r') as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if cache.get('version') != CACHE_VERSION:
+        return None
+    return cache
 
-# Validates pytris.cfg (used by load_config()
-def validate_config() -> bool:
+
+def settings_from_cache(cache: dict) -> Settings:
+    values = dict(cache['settings'])
+    # JSON doesn't have tuples
+    values['colors'] = {key: tuple(value) for key, value in values['colors'].items()}
+    return Settings(**values)
+
+
+# The cache is written to a temporary file first so that it is never left partially written
+def write_cache(stat: os.stat_result, digest: str, settings: Settings):
+    cache = {'version': CACHE_VERSION, 'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': digest, 'settings': asdict(settings)}
+    try:
+        with open(CONFIG_CACHE + '.tmp', 'w') as file:
+            json.dump(cache, file)
+        os.replace(CONFIG_CACHE + '.tmp', CONFIG_CACHE)
+    except OSError as ex:
+        print(f'Could not write config cache: {ex}')
+
+
+# Validates a parsed config (used by compile_config())
+def validate_config(config: configparser.ConfigParser) -> bool:
     failed, skip = False, False
-    config.read(CONFIG_FILE)
-    # sleep(10)
+
+    for section in DEFAULT_CONFIG:
+        if not config.has_section(section):
+            print(f'Config Error: Missing section: {section}')
+            failed = True
 
     for section in config.sections():
+        if section not in DEFAULT_CONFIG:
+            print(f'Config Error: Invalid section: {section}')
+            failed = True
+            continue
+
+        # configparser does not support case-sensitive keys
+        expected = {key.lower() for key in DEFAULT_CONFIG[section] if '#' not in key}
+        keys = set(config[section].keys())
         # Check for missing keys
-        for key in DEFAULT_CONFIG[section].keys():
-            if not key in config[section].keys() and not '#' in list(key):
-                print(f'Config Error: Missing key: {key}')
-                failed, skip = True, True
+        for key in expected - keys:
+            print(f'Config Error: Missing key: {key}')
+            failed, skip = True, True
         # Check for extra keys
-        for key in config[section].keys():
-            # configparser does not support case-sensitive keys
-            if not key in [list(DEFAULT_CONFIG[section].keys())[i].lower() for i in range(len(list(DEFAULT_CONFIG[section].keys())))]:
-                failed, skip = True, True
+        for key in keys - expected:
+            print(f'Config Error: Unknown key: {key}')
+            failed, skip = True, True
         # If there are missing/extra keys, don't finish validation
         if not skip:
             for key, value in config[section].items():
@@ -150,13 +261,30 @@ def validate_config() -> bool:
                             except:
                                 raise Exception(f'{key} must be an integer in the range 0-255 (e.g. 24)')
 
+                        elif key == 'timing_hud':
+                            try:
+                                converted_value = literal_eval(value)
+                                if type(converted_value) != bool:
+                                    raise Exception()
+                            except:
+                                raise Exception(f'{key} must be either True or False')
+
+                        elif key == 'timing_hud_frames':
+                            try:
+                                converted_value = literal_eval(value)
+                                if type(converted_value) != int or converted_value < 1:
+                                    raise Exception()
+                            except:
+                                raise Exception(f'{key} must be an integer greater than 0 (e.g. 120)')
+
                         else:
                             try:
                                 converted_value = literal_eval(value)
-                                if not type(converted_value) in (int, float):
+                                # Negative times would make the auto repeat loops in GameEngine.held_keys() never end
+                                if not type(converted_value) in (int, float) or converted_value < 0:
                                     raise Exception()
                             except:
-                                raise Exception(f'{key} must be either an int or a float')
+                                raise Exception(f'{key} must be either an int or a float, and not negative')
 
                     else:
                         raise Exception(f'Invalid section: {section}')
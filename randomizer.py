@@ -0,0 +1,131 @@
+from collections import deque
+from itertools import islice
+from random import Random
+
+# Randomizers decide the order of pieces, each has its own random number generator so a game's pieces only depend on its seed
+# Pieces are generated in groups (e.g. one bag at a time) into a queue, next() takes pieces from the front and peek() shows the next
+# pieces without removing them (the preview), both only generate more pieces when the queue runs out
+# If keep_history is set (practice games), pieces taken by next() are kept, so a game can go back to an earlier piece and get the same
+# pieces again (see rewind())
+
+PIECES = ('I', 'J', 'L', 'O', 'S', 'T', 'Z')
+
+
+class Randomizer:
+    def __init__(self, seed: int = None):
+        self.random = Random(seed)
+        self.queue = deque()
+        # Every piece next() returned, in order (only if keep_history is set, other games would keep every piece they are dealt)
+        self.keep_history = False
+        self.taken = []
+
+    # Adds the next group of pieces to the end of the queue
+    def fill(self):
+        raise NotImplementedError
+
+    def next(self) -> str:
+        if not self.queue:
+            self.fill()
+        piece = self.queue.popleft()
+        if self.keep_history:
+            self.taken.append(piece)
+        return piece
+
+    # The number of pieces next() has returned, rewind() goes back to it
+    def position(self) -> int:
+        return len(self.taken)
+
+    # Goes back (or forward again) to a position, pieces taken after it are put back at the front of the queue so next() returns them
+    # again (takes time proportional to the number of pieces, the random number generator is only used if the queue runs out)
+    def rewind(self, position: int):
+        self.queue.extendleft(reversed(self.taken[position:]))
+        del self.taken[position:]
+        while len(self.taken) < position:
+            self.next()
+
+    # The next count pieces, in the order next() will return them
+    def peek(self, count: int) -> tuple[str]:
+        while len(self.queue) < count:
+            self.fill()
+        return tuple(islice(self.queue, count))
+
+    # Everything needed to continue the same piece order later (see setstate()), e.g. for replay keyframes (see replayfile.py)
+    def getstate(self) -> tuple:
+        return self.random.getstate(), tuple(self.queue)
+
+    # Pieces taken before the state can't be rewound to
+    def setstate(self, state: tuple):
+        self.random.setstate(state[0])
+        self.queue = deque(state[1])
+        self.taken = []
+
+    # Removes and returns the next count pieces (much faster than calling next() count times, e.g. for testing distributions)
+    # These can't be rewound
+    def generate(self, count: int) -> list[str]:
+        while len(self.queue) < count:
+            self.fill()
+        queue = self.queue
+        return [queue.popleft() for i in range(count)]
+
+
+# Shuffled bags with each piece bag_count times, every piece appears bag_count times every 7 * bag_count pieces
+class BagRandomizer(Randomizer):
+    def __init__(self, seed: int = None, bag_count: int = 1):
+        super().__init__(seed)
+        self.bag = list(PIECES) * bag_count
+
+    def fill(self):
+        # The 7-bag shuffles with the same generator calls as the engine did before randomizers existed, so old recordings replay the same
+        bag = self.bag[:]
+        self.random.shuffle(bag)
+        self.queue.extend(bag)
+
+
+# TGM style, rerolls a piece (up to rolls times) if it is one of the last 4 pieces, so repeats are unlikely but possible
+# The defaults are TGM2's, TGM1 used 4 rolls and a history of 'Z', 'Z', 'Z', 'Z'
+class HistoryRandomizer(Randomizer):
+    def __init__(self, seed: int = None, rolls: int = 6, history: tuple = ('Z', 'S', 'S', 'Z')):
+        super().__init__(seed)
+        self.rolls = rolls
+        self.history = deque(history, maxlen=len(history))
+        self.first = True
+
+    # Pieces are generated 7 at a time, the order doesn't depend on how many are generated at once
+    def fill(self):
+        choice, history, queue = self.random.choice, self.history, self.queue
+        for i in range(len(PIECES)):
+            # The first piece is never an S, Z or O, which can't be placed without creating a hole
+            if self.first:
+                self.first = False
+                piece = choice(('I', 'J', 'L', 'T'))
+            else:
+                for roll in range(self.rolls):
+                    piece = choice(PIECES)
+                    if piece not in history:
+                        break
+            history.append(piece)
+            queue.append(piece)
+
+    def getstate(self) -> tuple:
+        return super().getstate() + (tuple(self.history), self.first)
+
+    def setstate(self, state: tuple):
+        super().setstate(state[:2])
+        self.history = deque(state[2], maxlen=self.history.maxlen)
+        self.first = state[3]
+
+
+# Every piece is equally likely regardless of previous pieces
+class PureRandomizer(Randomizer):
+    def fill(self):
+        self.queue.extend(self.random.choices(PIECES, k=len(PIECES)))
+
+
+RANDOMIZERS = {
+    '7-bag': BagRandomizer,
+    '14-bag': lambda seed=None: BagRandomizer(seed, 2),
+    'tgm': HistoryRandomizer,
+    'random': PureRandomizer
+}
+
+DEFAULT_RANDOMIZER = '7-bag'
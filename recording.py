@@ -0,0 +1,136 @@
+from dataclasses import asdict
+from engine import GameEngine
+from globals import EngineState, Handling, Recording, REPLAY_DIR, REPLAY_EXTENSION
+import json
+from os import makedirs
+from time import perf_counter, strftime
+
+# Saving, loading and verifying recorded games
+# A recording (see globals.Recording) stores the seed and every input, so replaying it with the engine reproduces the game exactly
+
+
+def save_recording(recording: Recording, path: str = None) -> str:
+    if path is None:
+        makedirs(REPLAY_DIR, exist_ok=True)
+        path = f'{REPLAY_DIR}/{strftime("%Y%m%d-%H%M%S")}-{recording.seed}.json'
+
+    with open(path, 'w') as file:
+        json.dump(asdict(recording), file, separators=(',', ':'))
+    return path
+
+
+def load_recording(path: str) -> Recording:
+    # Binary replays are converted to a Recording
+    if path.endswith(REPLAY_EXTENSION):
+        from replayfile import ReplayReader
+        with ReplayReader(path) as reader:
+            return reader.recording()
+
+    with open(path, 'r') as file:
+        data = json.load(file)
+    data['inputs'] = [tuple(i) for i in data['inputs']]
+    return Recording(**data)
+
+
+# Plays a recording without a window, as fast as possible, and returns the engine in its final state
+# If start (an EngineState, e.g. from a replay keyframe, see replayfile.py) is given, the game continues from it and the recording only has
+# what happened after it, if pieces is given, the replay stops as soon as that many pieces have been placed
+# writer (a replayfile.ReplayWriter) is attached to the game and updated after every input and tick (e.g. to convert a recording)
+def replay(recording: Recording, start: EngineState = None, pieces: int = None, writer=None) -> GameEngine:
+    game = GameEngine(Handling(**recording.handling), seed=recording.seed, tick_rate=recording.tick_rate, randomizer=recording.randomizer,
+                      practice=recording.practice)
+    game.held_actions.update(recording.held)
+    game.setup()
+    first = 0
+    if start:
+        game.load_state(start)
+        first = start.ticks
+    if writer:
+        writer.attach(game)
+    stop = -1 if pieces is None else pieces
+    if game.pieces_placed == stop:
+        return game
+
+    inputs = recording.inputs
+    changes = recording.handling_changes
+    garbage = recording.garbage
+    i, j, k = 0, 0, 0
+    for tick in range(first, recording.ticks + 1):
+        # Apply every settings change, garbage and input that happened before this tick (or after the last tick, e.g. the hard drop that ended the game)
+        last = tick == recording.ticks
+        while j < len(changes) and (last or changes[j][0] <= tick):
+            game.settings = Handling(**changes[j][1])
+            j += 1
+        while True:
+            # Garbage is received in the same order relative to the inputs as it was in the game (the order matters if both happen on the same tick)
+            while k < len(garbage) and (last or garbage[k][0] <= tick) and garbage[k][1] <= i:
+                game.receive_garbage(garbage[k][2], garbage[k][3])
+                k += 1
+            if i < len(inputs) and (last or inputs[i][0] <= tick):
+                if inputs[i][2]:
+                    game.press(inputs[i][1])
+                else:
+                    game.release(inputs[i][1])
+                i += 1
+                if writer:
+                    writer.update()
+                if game.pieces_placed == stop:
+                    return game
+            else:
+                break
+        if not last:
+            game.tick()
+            if writer:
+                writer.update()
+            if game.pieces_placed == stop:
+                return game
+
+    return game
+
+
+# Replays a recording and checks that it results in the statistics it claims, returns (path, error or '', game time)
+def verify(path: str) -> tuple[str, str, float]:
+    try:
+        recording = load_recording(path)
+        game = replay(recording)
+    except Exception as ex:
+        return path, f'Could not replay: {ex}', 0
+
+    if recording.stats is None:
+        return path, 'Recording does not have final statistics', game.cur_time
+    if asdict(game.stats) != recording.stats:
+        return path, f'Statistics do not match, replay resulted in {asdict(game.stats)}', game.cur_time
+    if game.game_over_reason != recording.game_over_reason:
+        return path, f'Game over reason does not match, replay resulted in "{game.game_over_reason}"', game.cur_time
+    return path, '', game.cur_time
+
+
+# The game (main.py) imports this module to save recordings, so modules only needed for verifying are imported here to keep startup fast
+def main():
+    import argparse
+    from multiprocessing import Pool
+
+    parser = argparse.ArgumentParser(description='Verify recorded Pytris games by replaying them')
+    parser.add_argument('paths', nargs='+', help=f'recording files (.json or {REPLAY_EXTENSION})')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of processes to replay with')
+    args = parser.parse_args()
+
+    start = perf_counter()
+    failed, game_time = 0, 0
+    with Pool(args.jobs) as pool:
+        for path, error, cur_time in pool.imap_unordered(verify, args.paths, chunksize=8):
+            game_time += cur_time
+            if error:
+                failed += 1
+                print(f'{path}: {error}')
+
+    elapsed = perf_counter() - start
+    print(
+        f'Verified {len(args.paths)} recordings ({failed} failed) in {elapsed:.2f}s\n'
+        f'{len(args.paths) / elapsed:.1f} games/s, {game_time / elapsed:.0f}x realtime')
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,665 @@
+from bisect import bisect_right
+from dataclasses import asdict
+from globals import (ACTIONS, BoardDelta, EMPTY_ROW, EngineState, game_statistics, GamePhase, GRID_DIMS, Recording, REPLAY_DIR, REPLAY_EXTENSION,
+                     REPLAY_INDEX_EXTENSION)
+import json
+import mmap
+from os import makedirs, remove
+from protocol import decode_row, encode_row, PIECE_TYPES, read_varint, ROW_BYTES, TILE_CODES, TILE_TYPES, write_varint
+from recording import load_recording, replay
+import struct
+from time import strftime
+
+# Binary replays, a compact alternative to the JSON recordings (see recording.py) that can be written while the game is played and
+# continued from any piece or time without replaying the game from the start
+#
+# A replay is a header followed by records, each is (1 byte kind, varint ticks since the previous record, body), integers are varints so
+# most inputs are 2 bytes. Besides the inputs (and garbage and settings changes, everything recording.replay() needs), every placed piece
+# is stored as a record (a BoardDelta) and every KEYFRAME_INTERVAL pieces a keyframe stores the whole state of the engine (see
+# globals.EngineState). The random number generator's state is 2.5KB but only changes every few hundred pieces, so it is a separate record
+# that keyframes refer to and it is only written again when it changed.
+#
+# The index is a separate file (the replay's path + REPLAY_INDEX_EXTENSION) with a fixed size entry for each placed piece: the tick it was
+# placed on, the offset of its record and the offset of the last keyframe before it. Both files are only ever appended to, so nothing is
+# rewritten when the game ends, and both are memory-mapped when read, so seeking to a piece is one index lookup, decoding the keyframe and
+# replaying at most KEYFRAME_INTERVAL pieces from it (seeking to a time is a binary search of the index first).
+
+KEYFRAME_INTERVAL = 32
+
+MAGIC = b'PYTR'
+INDEX_MAGIC = b'PYTI'
+VERSION = 1
+INDEX_HEADER = struct.Struct('<4sI')
+# Tick, offset of the piece's record, offset of the last keyframe before it (0 if there wasn't one, replays then start at the beginning)
+INDEX_ENTRY = struct.Struct('<III')
+
+# Record kinds
+PLACEMENT = 1
+GARBAGE = 2
+HANDLING = 3
+RANDOM_STATE = 4
+KEYFRAME = 5
+END = 6
+# Inputs are INPUT + ACTIONS.index(action) * 2 + 1 if pressed
+INPUT = 64
+
+# Mersenne Twister state (see random.getstate()), without its position
+RANDOM_WORDS = struct.Struct('<624I')
+DOUBLE = struct.Struct('<d')
+
+SPINS = ('', 't_spin', 'mini_t_spin')
+TIMERS = ('fall', 'drop_ARR', 'ARR', 'DAS', 'lock')
+# Flags of the booleans in a keyframe
+HOLD_READY = 1
+BACK_TO_BACK = 2
+ATTACK_BACK_TO_BACK = 4
+FALL_WHILE_LOCKING = 8
+PAUSED = 16
+
+
+# Signed values are zigzag encoded (0, -1, 1, -2... become 0, 1, 2, 3...) so small negative values are still 1 byte
+def write_signed(buffer: bytearray, value: int):
+    write_varint(buffer, value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def read_signed(data, offset: int) -> tuple[int, int]:
+    value, offset = read_varint(data, offset)
+    return (value >> 1 if not value & 1 else -(value >> 1) - 1), offset
+
+
+def write_json(buffer: bytearray, value):
+    data = json.dumps(value, separators=(',', ':')).encode()
+    write_varint(buffer, len(data))
+    buffer += data
+
+
+def read_json(data, offset: int) -> tuple[object, int]:
+    length, offset = read_varint(data, offset)
+    return json.loads(bytes(data[offset:offset + length])), offset + length
+
+
+# The extra state of a randomizer after the random number generator (see Randomizer.getstate()), tuples of pieces and booleans
+def write_randomizer_extra(buffer: bytearray, values: tuple):
+    write_varint(buffer, len(values))
+    for value in values:
+        if isinstance(value, bool):
+            buffer.append(value)
+        else:
+            buffer.append(2)
+            write_varint(buffer, len(value))
+            buffer += bytes(TILE_CODES[piece] for piece in value)
+
+
+def read_randomizer_extra(data, offset: int) -> tuple[tuple, int]:
+    count, offset = read_varint(data, offset)
+    values = []
+    for i in range(count):
+        kind = data[offset]
+        offset += 1
+        if kind < 2:
+            values.append(bool(kind))
+        else:
+            length, offset = read_varint(data, offset)
+            values.append(tuple(TILE_TYPES[code] for code in data[offset:offset + length]))
+            offset += length
+    return tuple(values), offset
+
+
+# Writes a game to a binary replay while it is played, update() adds everything that happened since it was last called (call it e.g. once
+# per frame) and close() adds the final statistics if the game ended
+class ReplayWriter:
+    def __init__(self, game=None, path: str = None, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.game = None
+        if game is not None:
+            self.attach(game)
+
+    # Starts writing the game, it must have been set up and nothing must have happened since
+    def attach(self, game):
+        recording = game.recording
+        if self.path is None:
+            # Games with the same seed (e.g. versus matches) can be started in the same second, a number is added instead of
+            # overwriting the earlier replay
+            makedirs(REPLAY_DIR, exist_ok=True)
+            name = f'{REPLAY_DIR}/{strftime("%Y%m%d-%H%M%S")}-{recording.seed}'
+            self.path = name + REPLAY_EXTENSION
+            copy = 1
+            while True:
+                try:
+                    self.file = open(self.path, 'xb')
+                    break
+                except FileExistsError:
+                    copy += 1
+                    self.path = f'{name}-{copy}{REPLAY_EXTENSION}'
+        else:
+            self.file = open(self.path, 'wb')
+        self.game = game
+        self.recording = recording
+        self.index = open(self.path + REPLAY_INDEX_EXTENSION, 'wb')
+
+        header = bytearray(MAGIC)
+        header.append(VERSION)
+        write_json(header, {
+            'seed': recording.seed, 'handling': recording.handling, 'tick_rate': recording.tick_rate, 'held': recording.held,
+            'randomizer': recording.randomizer, 'keyframe_interval': self.keyframe_interval, 'practice': recording.practice})
+        self.file.write(header)
+        self.index.write(INDEX_HEADER.pack(INDEX_MAGIC, VERSION))
+        self.offset = len(header)
+
+        # Number of inputs, handling changes and garbage already written
+        self.written = [0, 0, 0]
+        # (tick, number of inputs before it, BoardDelta) of pieces placed since the last update()
+        self.placements = []
+        self.previous_callback = game.placement_callback
+        game.placement_callback = self.placed
+
+        self.tick = recording.ticks
+        self.handling = recording.handling
+        self.keyframe_offset = 0
+        self.keyframe_pieces = game.pieces_placed
+        self.random_words = None
+        self.random_offset = 0
+
+    def placed(self, delta: BoardDelta):
+        self.placements.append((self.recording.ticks, len(self.recording.inputs), delta))
+        if self.previous_callback:
+            self.previous_callback(delta)
+
+    def update(self):
+        recording, game = self.recording, self.game
+        inputs, changes, garbage = self.written
+        if (not self.placements and inputs == len(recording.inputs) and changes == len(recording.handling_changes)
+                and garbage == len(recording.garbage)):
+            return
+
+        # Everything is written in the order recording.replay() applies it: by tick, then by the number of inputs before it
+        events = [(tick, i, 2, INPUT + ACTIONS.index(action) * 2 + pressed, None)
+                  for i, (tick, action, pressed) in enumerate(recording.inputs[inputs:], inputs)]
+        events.extend((tick, -1, 0, HANDLING, handling) for tick, handling in recording.handling_changes[changes:])
+        events.extend((tick, i, 1, GARBAGE, (lines, hole)) for tick, i, lines, hole in recording.garbage[garbage:])
+        events.extend((tick, i, 0, PLACEMENT, delta) for tick, i, delta in self.placements)
+        events.sort(key=lambda event: event[:3])
+        self.written = [len(recording.inputs), len(recording.handling_changes), len(recording.garbage)]
+        self.placements.clear()
+
+        buffer = bytearray()
+        entries = bytearray()
+        for tick, i, order, kind, value in events:
+            if kind == PLACEMENT:
+                entries += INDEX_ENTRY.pack(tick, self.offset + len(buffer), self.keyframe_offset)
+            buffer.append(kind)
+            write_varint(buffer, tick - self.tick)
+            self.tick = tick
+            if kind == PLACEMENT:
+                buffer.append(PIECE_TYPES.index(value.type) * 4 + value.rotation)
+                write_signed(buffer, value.x)
+                write_varint(buffer, value.y)
+                write_varint(buffer, sum(1 << row for row in value.cleared))
+                write_varint(buffer, value.attack)
+                write_varint(buffer, len(value.garbage))
+                for lines, hole in value.garbage:
+                    write_varint(buffer, lines)
+                    write_varint(buffer, hole)
+            elif kind == GARBAGE:
+                write_varint(buffer, value[0])
+                write_varint(buffer, value[1])
+            elif kind == HANDLING:
+                self.handling = value
+                write_json(buffer, value)
+
+        # A keyframe can't store the undo history of a practice game (see GameEngine.undo()), so those are only replayed from the start
+        keyframe = not game.game_ended and not game.practice and game.pieces_placed - self.keyframe_pieces >= self.keyframe_interval
+        if keyframe:
+            self.write_keyframe(buffer)
+        self.file.write(buffer)
+        self.index.write(entries)
+        self.offset += len(buffer)
+        # The index never refers to data that hasn't been written (as long as the keyframes have been flushed)
+        if keyframe:
+            self.file.flush()
+            self.index.flush()
+
+    def write_keyframe(self, buffer: bytearray):
+        game = self.game
+        state = game.save_state()
+        random_state, *extra = state.randomizer
+        version, words, gauss = random_state
+        if words[:624] != self.random_words:
+            self.random_words = words[:624]
+            self.random_offset = self.offset + len(buffer)
+            buffer.append(RANDOM_STATE)
+            write_varint(buffer, state.ticks - self.tick)
+            self.tick = state.ticks
+            buffer += RANDOM_WORDS.pack(*self.random_words)
+
+        self.keyframe_offset = self.offset + len(buffer)
+        self.keyframe_pieces = game.pieces_placed
+        body = bytearray()
+        write_varint(body, state.ticks)
+        # The handling settings are only stored if they changed during the game
+        if self.handling == self.recording.handling:
+            body.append(0)
+        else:
+            body.append(1)
+            write_json(body, self.handling)
+
+        write_varint(body, self.random_offset)
+        write_varint(body, words[624])
+        if gauss is None:
+            body.append(0)
+        else:
+            body.append(1)
+            body += DOUBLE.pack(gauss)
+        write_randomizer_extra(body, tuple(extra))
+
+        # Rows above the stack are empty
+        grid = state.grid
+        height = GRID_DIMS[1]
+        while height and not any(grid[height - 1]):
+            height -= 1
+        write_varint(body, height)
+        for row in grid[:height]:
+            body += encode_row(row)
+
+        type, x, y, rotation, lowest_line, lock_counter, rotation_point = state.piece
+        body.append(TILE_CODES[type])
+        for value in (x, y, rotation, lowest_line, lock_counter, rotation_point, *state.ghost):
+            write_signed(body, value)
+        body.append(TILE_CODES[state.hold])
+        body.append(state.hold_ready * HOLD_READY | state.back_to_back_bonus * BACK_TO_BACK
+                    | state.attack_back_to_back * ATTACK_BACK_TO_BACK | state.fall_while_locking * FALL_WHILE_LOCKING | state.paused * PAUSED)
+        body.append(SPINS.index(state.spin))
+
+        stats = state.stats
+        for value in (round(stats.score), *stats.clears, stats.total_clears, stats.level, *stats.t_spin, *stats.mini_t_spin,
+                      state.combo, state.attack_combo, state.pieces_placed, len(state.pending_garbage)):
+            write_varint(body, value)
+        for lines, hole in state.pending_garbage:
+            write_varint(body, lines)
+            write_varint(body, hole)
+
+        body += DOUBLE.pack(state.fall_interval)
+        body += DOUBLE.pack(state.cur_time)
+        write_varint(body, len(state.timers))
+        for name, value in state.timers.items():
+            body.append(TIMERS.index(name))
+            body += DOUBLE.pack(value)
+        body.append(state.game_phase.value)
+        write_varint(body, sum(1 << ACTIONS.index(action) for action in state.held_actions))
+        write_signed(body, state.last_horizontal_key)
+
+        buffer.append(KEYFRAME)
+        write_varint(buffer, state.ticks - self.tick)
+        self.tick = state.ticks
+        write_varint(buffer, len(body))
+        buffer += body
+
+    # Writes everything left and the final statistics (if the game ended) and closes the files, the game's placement_callback is restored
+    def close(self):
+        self.update()
+        recording = self.recording
+        if recording.stats is not None:
+            buffer = bytearray((END,))
+            write_varint(buffer, recording.ticks - self.tick)
+            write_json(buffer, {'stats': recording.stats, 'game_over_reason': recording.game_over_reason})
+            self.file.write(buffer)
+        self.detach()
+
+    # Closes and deletes the replay (e.g. when the game is restarted before it ended)
+    def discard(self):
+        self.detach()
+        remove(self.path)
+        remove(self.path + REPLAY_INDEX_EXTENSION)
+
+    def detach(self):
+        self.game.placement_callback = self.previous_callback
+        self.file.close()
+        self.index.close()
+
+
+# Reads a binary replay, the index is memory-mapped if it exists (and rebuilt in memory if it doesn't, e.g. after a crash)
+class ReplayReader:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC or self.data[len(MAGIC)] != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} replay')
+        self.header, self.start = read_json(self.data, len(MAGIC) + 1)
+
+        self.index = None
+        try:
+            with open(path + REPLAY_INDEX_EXTENSION, 'rb') as file:
+                if file.read(INDEX_HEADER.size) == INDEX_HEADER.pack(INDEX_MAGIC, VERSION):
+                    self.index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            pass
+        if self.index is None:
+            self.index = self.build_index()
+        self.pieces = (len(self.index) - INDEX_HEADER.size) // INDEX_ENTRY.size
+        # Index entries that refer to data after the end of the replay (it wasn't flushed before a crash) are ignored
+        while self.pieces and self.entry(self.pieces - 1)[1] >= len(self.data):
+            self.pieces -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        if isinstance(self.index, mmap.mmap):
+            self.index.close()
+
+    # (tick, offset, keyframe offset) of the nth piece placed (starting at 0)
+    def entry(self, piece: int) -> tuple[int, int, int]:
+        return INDEX_ENTRY.unpack_from(self.index, INDEX_HEADER.size + piece * INDEX_ENTRY.size)
+
+    def build_index(self) -> bytes:
+        index = bytearray(INDEX_HEADER.pack(INDEX_MAGIC, VERSION))
+        keyframe = 0
+        for kind, tick, offset, value in self.records(self.start, 0):
+            if kind == PLACEMENT:
+                index += INDEX_ENTRY.pack(tick, offset, keyframe)
+            elif kind == KEYFRAME:
+                keyframe = offset
+        return bytes(index)
+
+    # Yields (kind, tick, offset, value) of each record from offset, tick is the tick of the record before it
+    # value is the (action, pressed) of an input, the (lines, hole) of garbage, the BoardDelta of a placement, the handling settings,
+    # the final {'stats', 'game_over_reason'} or None for keyframes and random states (which are read by keyframe())
+    def records(self, offset: int, tick: int):
+        data = self.data
+        end = len(data)
+        while offset < end:
+            start = offset
+            try:
+                kind = data[offset]
+                delta, offset = read_varint(data, offset + 1)
+                tick += delta
+                if kind >= INPUT:
+                    value = (ACTIONS[(kind - INPUT) // 2], bool(kind & 1))
+                elif kind == PLACEMENT:
+                    piece = data[offset]
+                    x, offset = read_signed(data, offset + 1)
+                    y, offset = read_varint(data, offset)
+                    cleared, offset = read_varint(data, offset)
+                    attack, offset = read_varint(data, offset)
+                    count, offset = read_varint(data, offset)
+                    garbage = []
+                    for i in range(count):
+                        lines, offset = read_varint(data, offset)
+                        hole, offset = read_varint(data, offset)
+                        garbage.append((lines, hole))
+                    rows = tuple(row for row in range(GRID_DIMS[1]) if cleared >> row & 1)
+                    value = BoardDelta(PIECE_TYPES[piece // 4], piece % 4, x, y, rows, attack, tuple(garbage))
+                elif kind == GARBAGE:
+                    lines, offset = read_varint(data, offset)
+                    hole, offset = read_varint(data, offset)
+                    value = (lines, hole)
+                elif kind in (HANDLING, END):
+                    value, offset = read_json(data, offset)
+                elif kind == RANDOM_STATE:
+                    value = None
+                    offset += RANDOM_WORDS.size
+                elif kind == KEYFRAME:
+                    value = None
+                    length, offset = read_varint(data, offset)
+                    offset += length
+                else:
+                    raise ValueError(f'Unknown record kind {kind} at {start}')
+            # The last record is incomplete if the game crashed while it was being written
+            except IndexError:
+                return
+            if offset > end:
+                return
+            yield kind, tick, start, value
+
+    # The recording (see globals.Recording) of the whole game, or up to stop_tick
+    def recording(self, stop_tick: int = None) -> Recording:
+        return self.read_recording(self.start, 0, self.header['handling'], stop_tick=stop_tick)
+
+    # The recording of everything from offset (e.g. the record after a keyframe) up to stop_offset or stop_tick (including the record at
+    # stop_offset and every record on stop_tick), tick and handling are the tick and settings at offset
+    def read_recording(self, offset: int, tick: int, handling: dict, stop_offset: int = None, stop_tick: int = None) -> Recording:
+        header = self.header
+        recording = Recording(header['seed'], handling, header['tick_rate'], header['held'], [], tick, randomizer=header['randomizer'],
+                              practice=header.get('practice', False))
+        for kind, tick, start, value in self.records(offset, tick):
+            if stop_tick is not None and tick > stop_tick:
+                break
+            recording.ticks = tick
+            if kind >= INPUT:
+                recording.inputs.append((tick, *value))
+            elif kind == GARBAGE:
+                recording.garbage.append((tick, len(recording.inputs), *value))
+            elif kind == HANDLING:
+                recording.handling_changes.append((tick, value))
+            elif kind == END:
+                recording.stats = value['stats']
+                recording.game_over_reason = value['game_over_reason']
+            if start == stop_offset:
+                break
+        if stop_tick is not None:
+            recording.ticks = stop_tick
+        return recording
+
+    # (EngineState, handling settings, offset of the next record) of the keyframe at offset
+    def keyframe(self, offset: int) -> tuple[EngineState, dict, int]:
+        data = self.data
+        offset = read_varint(data, offset + 1)[1]
+        length, offset = read_varint(data, offset)
+        end = offset + length
+        ticks, offset = read_varint(data, offset)
+        handling = self.header['handling']
+        if data[offset]:
+            handling, offset = read_json(data, offset + 1)
+        else:
+            offset += 1
+
+        random_offset, offset = read_varint(data, offset)
+        position, offset = read_varint(data, offset)
+        random_offset = read_varint(data, random_offset + 1)[1]
+        words = RANDOM_WORDS.unpack_from(data, random_offset)
+        gauss = None
+        if data[offset]:
+            gauss = DOUBLE.unpack_from(data, offset + 1)[0]
+            offset += DOUBLE.size
+        extra, offset = read_randomizer_extra(data, offset + 1)
+
+        height, offset = read_varint(data, offset)
+        grid = [decode_row(data[offset + row * ROW_BYTES:offset + (row + 1) * ROW_BYTES]) for row in range(height)]
+        grid.extend([EMPTY_ROW] * (GRID_DIMS[1] - height))
+        offset += height * ROW_BYTES
+
+        type = TILE_TYPES[data[offset]]
+        offset += 1
+        values = []
+        for i in range(8):
+            value, offset = read_signed(data, offset)
+            values.append(value)
+        hold, flags, spin = TILE_TYPES[data[offset]], data[offset + 1], SPINS[data[offset + 2]]
+        offset += 3
+
+        values_end = []
+        for i in range(17):
+            value, offset = read_varint(data, offset)
+            values_end.append(value)
+        score, *counts = values_end
+        stats = game_statistics(score, counts[0:4], counts[4], counts[5], counts[6:10], counts[10:12])
+        combo, attack_combo, pieces_placed, pending = counts[12:16]
+        pending_garbage = []
+        for i in range(pending):
+            lines, offset = read_varint(data, offset)
+            hole, offset = read_varint(data, offset)
+            pending_garbage.append((lines, hole))
+
+        fall_interval = DOUBLE.unpack_from(data, offset)[0]
+        cur_time = DOUBLE.unpack_from(data, offset + DOUBLE.size)[0]
+        offset += DOUBLE.size * 2
+        count, offset = read_varint(data, offset)
+        timers = {}
+        for i in range(count):
+            timers[TIMERS[data[offset]]] = DOUBLE.unpack_from(data, offset + 1)[0]
+            offset += 1 + DOUBLE.size
+        game_phase = GamePhase(data[offset])
+        held, offset = read_varint(data, offset + 1)
+        last_horizontal_key, offset = read_signed(data, offset)
+
+        state = EngineState(
+            tuple(grid), (type, *values[:6]), tuple(values[6:]), hold, bool(flags & HOLD_READY),
+            ((3, words + (position,), gauss), *extra), stats, combo, bool(flags & BACK_TO_BACK), attack_combo,
+            bool(flags & ATTACK_BACK_TO_BACK), spin, tuple(pending_garbage), fall_interval, cur_time, timers, game_phase,
+            bool(flags & FALL_WHILE_LOCKING), frozenset(action for i, action in enumerate(ACTIONS) if held >> i & 1),
+            last_horizontal_key, bool(flags & PAUSED), pieces_placed, ticks)
+        return state, handling, end
+
+    # The game right after its nth piece was placed (0 is the start of the game)
+    def seek(self, piece: int):
+        if not 0 <= piece <= self.pieces:
+            raise IndexError(f'Piece {piece} is not in the replay ({self.pieces} pieces)')
+        if piece == 0:
+            return self.replay_from(0, pieces=0)
+        # Undone pieces are placed again, so in practice games the piece'th placement can be before the game has that many pieces
+        if self.header.get('practice', False):
+            return self.replay_from(0, pieces=piece)
+        tick, offset, keyframe = self.entry(piece - 1)
+        return self.replay_from(keyframe, pieces=piece, stop_offset=offset)
+
+    # The game after the given number of ticks (including the inputs on that tick)
+    def seek_tick(self, tick: int):
+        # Starts from the keyframe before the first piece placed after the tick, unless that keyframe is after the tick
+        piece = bisect_right(range(self.pieces), tick, key=lambda piece: self.entry(piece)[0])
+        keyframe = self.entry(piece)[2] if piece < self.pieces else self.last_keyframe()
+        if keyframe and self.keyframe(keyframe)[0].ticks > tick:
+            keyframe = self.entry(piece - 1)[2] if piece else 0
+        return self.replay_from(keyframe, stop_tick=tick)
+
+    # The last keyframe in the replay (the index only has the ones before each piece)
+    def last_keyframe(self) -> int:
+        if not self.pieces:
+            offset, keyframe = self.start, 0
+        else:
+            tick, offset, keyframe = self.entry(self.pieces - 1)
+        for kind, tick, start, value in self.records(offset, 0):
+            if kind == KEYFRAME:
+                keyframe = start
+        return keyframe
+
+    # Replays from a keyframe (or the start of the game if it is 0) to a piece, a record or a tick
+    def replay_from(self, keyframe: int, pieces: int = None, stop_offset: int = None, stop_tick: int = None):
+        if not keyframe:
+            return replay(self.read_recording(self.start, 0, self.header['handling'], stop_offset, stop_tick), pieces=pieces)
+        state, handling, offset = self.keyframe(keyframe)
+        return replay(self.read_recording(offset, state.ticks, handling, stop_offset, stop_tick), state, pieces)
+
+
+# Converts a recording (.json) to a binary replay, returns (path, error or '')
+def convert(job: tuple) -> tuple[str, str]:
+    path, output = job
+    try:
+        recording = load_recording(path)
+        writer = ReplayWriter(path=output)
+        game = replay(recording, writer=writer)
+        writer.close()
+    except Exception as ex:
+        return path, f'Could not convert: {ex}'
+    if recording.stats is not None and asdict(game.stats) != recording.stats:
+        return path, 'Statistics do not match'
+    return path, ''
+
+
+def main():
+    import argparse
+    from multiprocessing import Pool
+    from os.path import basename, getsize, splitext
+    from random import Random
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(description='Convert, inspect and seek binary Pytris replays')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = commands.add_parser('convert', help='convert recordings (.json) to binary replays')
+    convert_parser.add_argument('paths', nargs='+')
+    convert_parser.add_argument('-o', '--output', help='directory to save the replays in (default: next to each recording)')
+    convert_parser.add_argument('-j', '--jobs', type=int, default=1)
+
+    info_parser = commands.add_parser('info', help='print the size and contents of replays')
+    info_parser.add_argument('paths', nargs='+')
+
+    seek_parser = commands.add_parser('seek', help='print the state of a replay at a piece or time')
+    seek_parser.add_argument('path')
+    position = seek_parser.add_mutually_exclusive_group(required=True)
+    position.add_argument('--piece', type=int)
+    position.add_argument('--time', type=float, help='seconds since the start of the game')
+    seek_parser.add_argument('--check', action='store_true', help='check the state matches replaying the whole game')
+
+    bench_parser = commands.add_parser('bench', help='time seeking to random pieces compared to replaying from the start')
+    bench_parser.add_argument('path')
+    bench_parser.add_argument('-n', '--count', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        outputs = [(f'{args.output}/{splitext(basename(path))[0]}' if args.output else splitext(path)[0]) + REPLAY_EXTENSION
+                   for path in args.paths]
+        if args.output:
+            makedirs(args.output, exist_ok=True)
+        failed = 0
+        with Pool(args.jobs) as pool:
+            for path, error in pool.imap_unordered(convert, zip(args.paths, outputs), chunksize=8):
+                if error:
+                    failed += 1
+                    print(f'{path}: {error}')
+        print(f'Converted {len(args.paths) - failed} of {len(args.paths)} recordings')
+        if failed:
+            exit(1)
+
+    elif args.command == 'info':
+        for path in args.paths:
+            with ReplayReader(path) as reader:
+                size = getsize(path)
+                keyframes = sum(kind == KEYFRAME for kind, tick, offset, value in reader.records(reader.start, 0))
+                recording = reader.recording()
+                print(
+                    f'{path}: {reader.pieces} pieces, {len(recording.inputs)} inputs, {recording.ticks / recording.tick_rate:.1f}s, '
+                    f'{keyframes} keyframes, {size} bytes ({size / max(reader.pieces, 1):.1f} per piece) + '
+                    f'{len(reader.index)} byte index, {recording.game_over_reason or "not finished"}')
+
+    elif args.command == 'seek':
+        with ReplayReader(args.path) as reader:
+            start = perf_counter()
+            if args.piece is not None:
+                game = reader.seek(args.piece)
+            else:
+                game = reader.seek_tick(round(args.time * reader.header['tick_rate']))
+            elapsed = perf_counter() - start
+            print(f'Piece {game.pieces_placed}, tick {game.recording.ticks} ({elapsed * 1000:.2f}ms): {asdict(game.stats)}')
+            if args.check:
+                if args.piece is not None:
+                    full = replay(reader.recording(), pieces=args.piece)
+                else:
+                    full = replay(reader.recording(game.recording.ticks))
+                if full.save_state() != game.save_state():
+                    print('State does not match replaying the whole game')
+                    exit(1)
+                print('State matches replaying the whole game')
+
+    else:
+        with ReplayReader(args.path) as reader:
+            recording = reader.recording()
+            pieces = Random(0).choices(range(reader.pieces + 1), k=args.count)
+            start = perf_counter()
+            for piece in pieces:
+                reader.seek(piece)
+            seek_time = (perf_counter() - start) / args.count
+            start = perf_counter()
+            for piece in pieces:
+                replay(recording, pieces=piece)
+            replay_time = (perf_counter() - start) / args.count
+            print(f'Seek: {seek_time * 1000:.2f}ms, replay from the start: {replay_time * 1000:.2f}ms ({replay_time / seek_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
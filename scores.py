@@ -0,0 +1,169 @@
+from dataclasses import dataclass
+from getpass import getuser
+from globals import MAX_SAVED_SCORES, SCORE_DB, SCORE_FILE
+from os import replace
+from os.path import exists
+import sqlite3
+from time import strftime
+
+# Leaderboard of every finished game, stored in an SQLite database (SCORE_DB)
+# Scores are indexed, so adding a game and reading the top scores doesn't depend on how many games are stored
+
+
+# A finished game as stored in the database
+@dataclass
+class ScoreEntry:
+    score: int
+    level: int
+    lines: int
+    # Length of the game in seconds
+    time: float
+    # Name of the player (or policy, for simulated games)
+    player: str = ''
+    # Why the game ended (e.g. 'Lock Out')
+    reason: str = ''
+    seed: int = None
+    # Path of the game's recording (see recording.py), if it was saved
+    replay: str = None
+    # Local time the game ended, 'YYYY-MM-DD HH:MM:SS'
+    date: str = None
+    # Set by the database
+    id: int = None
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    score INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    time REAL NOT NULL,
+    player TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    seed INTEGER,
+    replay TEXT,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC);
+CREATE INDEX IF NOT EXISTS scores_by_player ON scores (player, score DESC);
+CREATE INDEX IF NOT EXISTS scores_by_date ON scores (date);
+CREATE INDEX IF NOT EXISTS scores_by_level ON scores (level DESC, score DESC);
+CREATE INDEX IF NOT EXISTS scores_by_lines ON scores (lines DESC, score DESC);
+CREATE INDEX IF NOT EXISTS scores_by_replay ON scores (replay);
+'''
+
+COLUMNS = ['score', 'level', 'lines', 'time', 'player', 'reason', 'seed', 'replay', 'date']
+
+# Leaderboards can be sorted by these (each has an index), ties are sorted by score
+ORDERS = ['score', 'level', 'lines']
+
+
+class ScoreStore:
+    def __init__(self, path: str = SCORE_DB):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    # Imports the scores from the old text file (one score per line), the file is renamed afterwards so it is only imported once
+    def migrate_score_file(self, path: str = SCORE_FILE):
+        if not exists(path):
+            return
+        entries = []
+        with open(path, 'r') as file:
+            for line in file:
+                try:
+                    entries.append(ScoreEntry(int(line), 0, 0, 0))
+                except ValueError:
+                    pass
+        self.add_many(entries)
+        replace(path, path + '.migrated')
+
+    # Adds a finished game and returns its id
+    def add(self, entry: ScoreEntry) -> int:
+        # Each transaction is committed as a whole, or not at all if it fails
+        with self.connection:
+            cursor = self.connection.execute(
+                f'INSERT INTO scores ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))})', self.values(entry))
+        entry.id = cursor.lastrowid
+        return entry.id
+
+    # Adds many games in one transaction (much faster than calling add() for each)
+    def add_many(self, entries: list[ScoreEntry]):
+        with self.connection:
+            self.connection.executemany(
+                f'INSERT INTO scores ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))})', map(self.values, entries))
+
+    def values(self, entry: ScoreEntry) -> tuple:
+        if entry.date is None:
+            entry.date = strftime('%Y-%m-%d %H:%M:%S')
+        return tuple(getattr(entry, column) for column in COLUMNS)
+
+    # The highest scores (or levels or lines, see ORDERS), of every player or only the given player
+    def top(self, count: int = MAX_SAVED_SCORES, player: str = None, order: str = 'score') -> list[ScoreEntry]:
+        if order not in ORDERS:
+            raise ValueError(f'Can not sort scores by {order}')
+        query = f'SELECT {", ".join(COLUMNS)}, id FROM scores'
+        parameters = []
+        if player is not None:
+            query += ' WHERE player = ?'
+            parameters.append(player)
+        query += f' ORDER BY {order} DESC, score DESC LIMIT ?' if order != 'score' else ' ORDER BY score DESC LIMIT ?'
+        parameters.append(count)
+        return [ScoreEntry(*row) for row in self.connection.execute(query, parameters)]
+
+    # The game a replay was saved for (None if it isn't on the leaderboard, e.g. a practice game)
+    def find_replay(self, replay: str) -> ScoreEntry:
+        row = self.connection.execute(f'SELECT {", ".join(COLUMNS)}, id FROM scores WHERE replay = ?', (replay,)).fetchone()
+        return ScoreEntry(*row) if row else None
+
+    # The number of stored games with a higher score (i.e. the position of a score on the leaderboard - 1)
+    def rank(self, score: int, player: str = None) -> int:
+        if player is None:
+            return self.connection.execute('SELECT COUNT(*) FROM scores WHERE score > ?', (score,)).fetchone()[0]
+        return self.connection.execute('SELECT COUNT(*) FROM scores WHERE player = ? AND score > ?', (player, score)).fetchone()[0]
+
+    def count(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+
+
+# The name scores are saved under when a game is played in the window
+def default_player() -> str:
+    try:
+        return getuser()
+    except Exception:
+        return ''
+
+
+def main():
+    # Imported here because the game (main.py) imports this module, see recording.main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show the Pytris leaderboard')
+    parser.add_argument('-n', '--count', type=int, default=10, help='number of scores to show')
+    parser.add_argument('-p', '--player', help='only show scores of this player')
+    parser.add_argument('-s', '--sort', choices=ORDERS, default='score', help='sort the leaderboard by this')
+    parser.add_argument('--replay', help='only show the game this replay was saved for')
+    parser.add_argument('--database', default=SCORE_DB)
+    args = parser.parse_args()
+
+    store = ScoreStore(args.database)
+    rows = [['#', 'score', 'level', 'lines', 'time', 'player', 'date', 'replay']]
+    if args.replay is not None:
+        entry = store.find_replay(args.replay)
+        entries = [entry] if entry else []
+    else:
+        entries = store.top(args.count, args.player, args.sort)
+    for i, entry in enumerate(entries, 1):
+        rows.append([str(i), str(entry.score), str(entry.level), str(entry.lines), f'{entry.time:.1f}', entry.player, entry.date, entry.replay or ''])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print('  '.join(value.ljust(widths[i]) for i, value in enumerate(row)))
+    print(f'\n{store.count()} games stored')
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+from functools import lru_cache
+from globals import GRID_DIMS, Placement
+from srs import ROTATIONS, SHAPES
+
+# Finds every position a piece can be locked in by searching through the positions it can reach with the same movement
+# and rotation rules as GameEngine (breadth-first, so each position is found with the fewest inputs)
+# Used through GameEngine.placements()
+
+# The inputs tried from each position: (action, horizontal movement, rotation steps)
+# 'move_down' is a soft drop to the lowest position the piece can reach (i.e. holding the down key with drop_auto_repeat_rate = 0)
+MOVES = (
+    ('move_left', -1, ()),
+    ('move_right', 1, ()),
+    ('rotate_clockwise', 0, (1,)),
+    ('rotate_counter_clockwise', 0, (-1,)),
+    ('rotate_flip', 0, (1, 1)),
+    ('move_down', 0, None)
+)
+
+
+# rows is GameEngine.rows as a tuple, (x, y, rotation) is where the piece starts
+# Results are cached, so searching the same board again with the same piece is free
+@lru_cache(maxsize=4096)
+def find_placements(rows: tuple, type: str, x: int, y: int, rotation: int) -> tuple:
+    # Column heights (see GameEngine.heights)
+    heights = [0] * GRID_DIMS[0]
+    for row in range(GRID_DIMS[1]):
+        for column in range(GRID_DIMS[0]):
+            if rows[row] >> column & 1:
+                heights[column] = row + 1
+
+    # Same as GameEngine.shape_fits()
+    def fits(shape, x: int, y: int) -> bool:
+        masks = shape.masks.get(x)
+        if masks is None or y + shape.bottom < 0 or y + shape.top >= GRID_DIMS[1]:
+            return False
+        for dy, mask in masks:
+            if rows[y + dy] & mask:
+                return False
+        return True
+
+    # Same as GameEngine.drop_distance()
+    def drop_distance(shape, x: int, y: int) -> int:
+        distance = GRID_DIMS[1]
+        for dx, bottom in shape.columns:
+            gap = y + bottom - heights[x + dx]
+            if gap < 0:
+                distance = 0
+                while fits(shape, x, y - distance - 1):
+                    distance += 1
+                return distance
+            distance = min(distance, gap)
+        return distance
+
+    # Same as GameEngine.rotate_active() (a flip is 2 clockwise rotations that both have to succeed),
+    # returns the new position and the rotation point, or (None, -1) if the rotation fails
+    def rotate(x: int, y: int, rotation: int, steps: tuple) -> tuple:
+        kick = -1
+        for step in steps:
+            rotation, shape, kicks = ROTATIONS[type][rotation][step]
+            for kick, offset in enumerate(kicks):
+                if fits(shape, x + offset[0], y + offset[1]):
+                    x, y = x + offset[0], y + offset[1]
+                    break
+            else:
+                return None, -1
+        return (x, y, rotation), kick
+
+    start = (x, y, rotation)
+    # (previous position, action, rotation point) for each position that has been reached
+    parents = {start: None}
+    # Positions that can also be reached with a rotation as the last input (which matters for T-Spins)
+    # when the fewest inputs to reach them ends with a movement
+    spins = {}
+    queue = [start]
+    locks = []
+
+    for state in queue:
+        x, y, rotation = state
+        shape = SHAPES[type][rotation]
+        if not fits(shape, x, y - 1):
+            locks.append(state)
+
+        for action, dx, steps in MOVES:
+            kick = -1
+            if steps is None:
+                distance = drop_distance(shape, x, y)
+                if distance == 0:
+                    continue
+                new_state = (x, y - distance, rotation)
+
+            elif not steps:
+                if not fits(shape, x + dx, y):
+                    continue
+                new_state = (x + dx, y, rotation)
+
+            else:
+                new_state, kick = rotate(x, y, rotation, steps)
+                if new_state is None:
+                    continue
+
+            if new_state not in parents:
+                parents[new_state] = (state, action, kick)
+                queue.append(new_state)
+            elif kick != -1 and parents[new_state] and parents[new_state][2] == -1 and new_state not in spins:
+                spins[new_state] = (state, action, kick)
+
+    placements = []
+    for state in locks:
+        # T-Spins are only scored if the last input was a rotation, so prefer a path that ends with one for 'T' pieces
+        last = spins[state] if type == 'T' and state in spins else parents[state]
+        rotation_point = last[2] if last else -1
+        path = []
+        while last:
+            path.append(last[1])
+            last = parents[last[0]]
+        path.reverse()
+        placements.append(Placement(type, state[2], state[0], state[1], tuple(path), rotation_point))
+
+    return tuple(placements)
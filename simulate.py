@@ -0,0 +1,160 @@
+import argparse
+from dataclasses import asdict
+from engine import GameEngine
+import json
+from multiprocessing import Pool, cpu_count
+from policies import POLICIES
+from random import Random
+from randomizer import DEFAULT_RANDOMIZER, RANDOMIZERS
+from scores import ScoreEntry, ScoreStore
+from time import perf_counter
+
+# Runs many games without a window in a process pool and prints the distribution of their statistics
+# e.g. python simulate.py -n 10000 --policy heuristic --max-pieces 500
+
+# Percentiles are calculated from a random sample of at most this many games per statistic
+SAMPLE_SIZE = 100000
+
+# Number of games added to the leaderboard at once with --save-scores
+SCORE_BATCH_SIZE = 1000
+
+
+# Plays one game with the given policy, returns its statistics (as a flat dict) and the number of pieces placed
+# The game only ticks while a piece is soft dropped, so it has no meaningful length and its time isn't one of the statistics
+def run_game(job: tuple) -> dict:
+    seed, policy_name, policy_arg, max_pieces, randomizer = job
+    if policy_name == 'random':
+        policy = POLICIES[policy_name](seed)
+    elif policy_arg is not None:
+        policy = POLICIES[policy_name](policy_arg)
+    else:
+        policy = POLICIES[policy_name]()
+
+    game = GameEngine(seed=seed, randomizer=randomizer)
+    game.setup()
+    pieces = 0
+    while not game.game_ended and pieces < max_pieces:
+        for action in policy(game):
+            game.press(action)
+            if action == 'move_down':
+                game.tick()
+            game.release(action)
+            if game.game_ended:
+                break
+        pieces += 1
+
+    return {'seed': seed, 'reason': game.game_over_reason, 'pieces': pieces, **flatten_stats(asdict(game.stats))}
+
+
+# Splits list statistics into one value per index (e.g. clears -> clears_1, clears_2, ...)
+def flatten_stats(stats: dict) -> dict:
+    flat = {}
+    for key, value in stats.items():
+        if isinstance(value, list):
+            # clears starts at 1 line, t-spins start at 0 lines
+            start = 1 if key == 'clears' else 0
+            for i, item in enumerate(value):
+                flat[f'{key}_{i + start}'] = item
+        else:
+            flat[key] = value
+    # total_clears is the number of lines cleared
+    flat['lines'] = flat.pop('total_clears')
+    return flat
+
+
+# Keeps the count, mean, min and max of a statistic, and a fixed size random sample of it for percentiles
+class Distribution:
+    def __init__(self, random: Random):
+        self.random = random
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.sample = []
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        # Reservoir sampling, every value has an equal chance of being in the sample
+        if len(self.sample) < SAMPLE_SIZE:
+            self.sample.append(value)
+        else:
+            i = self.random.randrange(self.count)
+            if i < SAMPLE_SIZE:
+                self.sample[i] = value
+
+    def percentiles(self, percents: list[float]) -> list[float]:
+        ordered = sorted(self.sample)
+        return [ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))] for p in percents]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate Pytris games without a window and summarize their statistics')
+    parser.add_argument('-n', '--games', type=int, default=1000, help='number of games to play')
+    parser.add_argument('-j', '--jobs', type=int, default=cpu_count(), help='number of processes (default: number of cores)')
+    parser.add_argument('-p', '--policy', choices=POLICIES.keys(), default='heuristic', help='how inputs are chosen for each piece')
+    parser.add_argument('--script', help='input script for the scripted policy, one line of actions per piece')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game, each game uses the next seed')
+    parser.add_argument('-r', '--randomizer', choices=RANDOMIZERS.keys(), default=DEFAULT_RANDOMIZER, help='how the piece order is generated')
+    parser.add_argument('--max-pieces', type=int, default=1000, help='end games after this many pieces')
+    parser.add_argument('--percentiles', type=float, nargs='+', default=[5, 25, 50, 75, 95, 99])
+    parser.add_argument('-o', '--output', help='write the statistics of each game to this file as JSON lines')
+    parser.add_argument('--save-scores', action='store_true', help='add every game to the leaderboard (see scores.py), the player is the policy name')
+    args = parser.parse_args()
+
+    if args.policy == 'scripted' and not args.script:
+        parser.error('the scripted policy requires --script')
+
+    jobs = ((args.seed + i, args.policy, args.script, args.max_pieces, args.randomizer) for i in range(args.games))
+    distributions = {}
+    random = Random(args.seed)
+    output = open(args.output, 'w') if args.output else None
+    store = ScoreStore() if args.save_scores else None
+    entries = []
+    pieces = 0
+
+    start = perf_counter()
+    with Pool(args.jobs) as pool:
+        # Results are aggregated as each game finishes, so memory use doesn't grow with the number of games
+        for finished, result in enumerate(pool.imap_unordered(run_game, jobs, chunksize=4), 1):
+            pieces += result['pieces']
+            for key, value in result.items():
+                if key not in ('seed', 'reason'):
+                    distributions.setdefault(key, Distribution(random)).add(value)
+            if output:
+                output.write(json.dumps(result) + '\n')
+            if store:
+                # Simulated games are saved with a length of 0 (see run_game())
+                entries.append(ScoreEntry(
+                    result['score'], result['level'], result['lines'], 0, args.policy, result['reason'], result['seed']))
+                # Games are added in batches, each batch is one transaction
+                if len(entries) >= SCORE_BATCH_SIZE:
+                    store.add_many(entries)
+                    entries.clear()
+            if finished % max(1, args.games // 10) == 0:
+                print(f'{finished}/{args.games} games, {finished / (perf_counter() - start):.1f} games/s', flush=True)
+    if store:
+        store.add_many(entries)
+        store.close()
+    elapsed = perf_counter() - start
+    if output:
+        output.close()
+
+    header = ['statistic', 'mean', 'min'] + [f'p{p:g}' for p in args.percentiles] + ['max']
+    rows = [header]
+    for key, distribution in distributions.items():
+        rows.append([key, f'{distribution.total / distribution.count:.2f}', str(distribution.min)]
+                    + [f'{value:g}' for value in distribution.percentiles(args.percentiles)] + [str(distribution.max)])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print('  '.join(value.rjust(widths[i]) for i, value in enumerate(row)))
+
+    print(
+        f'\n{args.games} games ({pieces} pieces) in {elapsed:.2f}s with {args.jobs} processes\n'
+        f'{args.games / elapsed:.1f} games/s, {pieces / elapsed:.0f} pieces/s')
+
+
+if __name__ == '__main__':
+    main()
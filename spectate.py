@@ -0,0 +1,421 @@
+from collections import deque
+from globals import EMPTY_ROW, GARBAGE_TILE, game_statistics, GRID_DIMS, PREVIEW_COUNT, RENDERED_GRID_HEIGHT
+from protocol import decode_row, encode_row, read_varint, ROW_BYTES, TILE_CODES, TILE_TYPES, write_varint
+import selectors
+import socket
+import struct
+from time import perf_counter
+
+# Spectator mode, a game publishes its state to any number of subscribers (e.g. a dashboard watching many bot games)
+# Only what changed since the last published frame is sent (a delta), new subscribers and subscribers that fell behind get a keyframe
+# (the whole state) instead, so a slow subscriber never makes the game wait
+# e.g. python spectate.py bots -n 24 --port 9000, then python spectate.py watch localhost:9000-9023
+
+DEFAULT_PORT = 7778
+
+# A subscriber with more than this many unsent frames has its queue dropped and gets a keyframe when it catches up
+MAX_QUEUED_FRAMES = 64
+# A subscriber that hasn't accepted any data for this many seconds is disconnected
+STALL_TIMEOUT = 5
+
+# Frame kinds
+KEYFRAME = 1
+DELTA = 2
+
+# Flags of the parts included in a frame
+ROWS = 1
+PIECE = 2
+HOLD = 4
+PREVIEW = 8
+STATS = 16
+GAME_OVER = 32
+
+FRAME_HEADER = struct.Struct('<HBB')
+ROW_HEADER = struct.Struct('<B')
+# type, rotation, x, y, ghost y
+PIECE_BODY = struct.Struct('<BBbBB')
+# Statistics are sent as varints (see protocol.write_varint()), score, clears (4), total_clears, level, t_spin (4), mini_t_spin (2)
+STATS_COUNT = 13
+
+
+# Everything a spectator sees, built from frames by apply_frame() (and from the engine by the publisher, to find what changed)
+class SpectatorState:
+    def __init__(self):
+        self.grid = [EMPTY_ROW] * GRID_DIMS[1]
+        # (type, rotation, x, y, ghost y), type is '' before the first piece
+        self.piece = ('', 0, 0, 0, 0)
+        self.hold = ''
+        self.preview = ('',) * PREVIEW_COUNT
+        self.stats = game_statistics(0, [0, 0, 0, 0], 0, 1, [0, 0, 0, 0], [0, 0])
+        self.game_ended = False
+        self.frames = 0
+        self.keyframes = 0
+
+
+def stats_values(stats: game_statistics) -> tuple:
+    return (round(stats.score), *stats.clears, stats.total_clears, stats.level, *stats.t_spin, *stats.mini_t_spin)
+
+
+def encode_stats(values: tuple) -> bytes:
+    buffer = bytearray()
+    for value in values:
+        write_varint(buffer, value)
+    return bytes(buffer)
+
+
+# Publishes a game's state, call publish() whenever the game may have changed (e.g. every frame or every piece)
+class SpectatorPublisher:
+    def __init__(self, host: str = 'localhost', port: int = DEFAULT_PORT):
+        self.listener = socket.create_server((host, port))
+        self.listener.setblocking(False)
+        self.port = self.listener.getsockname()[1]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.subscribers = []
+        # The state as of the last published frame, deltas are relative to this
+        self.state = SpectatorState()
+        self.frames_sent = 0
+        self.keyframes_sent = 0
+        self.bytes_sent = 0
+
+    def close(self):
+        for subscriber in self.subscribers:
+            subscriber.sock.close()
+        self.selector.close()
+        self.listener.close()
+
+    def publish(self, game):
+        # New subscribers (checking is a single non-blocking select, so this costs almost nothing when nobody is connecting)
+        if self.selector.select(0):
+            self.accept()
+        if not self.subscribers:
+            return
+
+        delta = self.update_state(game)
+        keyframe = None
+        now = perf_counter()
+        for subscriber in list(self.subscribers):
+            if subscriber.needs_keyframe:
+                if keyframe is None:
+                    keyframe = self.keyframe()
+                    self.keyframes_sent += 1
+                subscriber.needs_keyframe = False
+                subscriber.queue.append(keyframe)
+            elif delta:
+                subscriber.queue.append(delta)
+            self.flush(subscriber, now)
+        if delta:
+            self.frames_sent += 1
+
+    def accept(self):
+        while True:
+            try:
+                sock, address = self.listener.accept()
+            except BlockingIOError:
+                return
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.subscribers.append(Subscriber(sock))
+
+    # Sends as many queued frames as the subscriber's socket accepts without waiting
+    def flush(self, subscriber, now: float):
+        queue = subscriber.queue
+        try:
+            while queue:
+                sent = subscriber.sock.send(memoryview(queue[0])[subscriber.offset:])
+                self.bytes_sent += sent
+                subscriber.offset += sent
+                subscriber.last_progress = now
+                if subscriber.offset < len(queue[0]):
+                    break
+                queue.popleft()
+                subscriber.offset = 0
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.drop(subscriber)
+            return
+
+        if not queue:
+            subscriber.last_progress = now
+        elif now - subscriber.last_progress > STALL_TIMEOUT:
+            self.drop(subscriber)
+        # Too far behind, the queued deltas are dropped (except a partly sent frame, which must be finished) and it gets a keyframe next
+        elif len(queue) > MAX_QUEUED_FRAMES:
+            first = queue.popleft() if subscriber.offset else None
+            queue.clear()
+            if first is not None:
+                queue.append(first)
+            subscriber.needs_keyframe = True
+
+    def drop(self, subscriber):
+        subscriber.sock.close()
+        self.subscribers.remove(subscriber)
+
+    # Updates self.state from the game and returns a delta frame of what changed (b'' if nothing did)
+    def update_state(self, game) -> bytes:
+        state = self.state
+        flags = 0
+        parts = []
+
+        rows = []
+        for row in range(RENDERED_GRID_HEIGHT):
+            # Rows of the engine's grid are immutable, so they can be kept without copying
+            if game.grid[row] != state.grid[row]:
+                state.grid[row] = game.grid[row]
+                rows.append(ROW_HEADER.pack(row) + encode_row(state.grid[row]))
+        if rows:
+            flags |= ROWS
+            parts.append(ROW_HEADER.pack(len(rows)))
+            parts.extend(rows)
+
+        piece = game.active_piece
+        current = (piece.type, piece.rotation, piece.x, piece.y, game.ghost.y)
+        if current != state.piece:
+            state.piece = current
+            flags |= PIECE
+            parts.append(self.encode_piece())
+
+        if game.hold != state.hold:
+            state.hold = game.hold
+            flags |= HOLD
+            parts.append(bytes((TILE_CODES[state.hold],)))
+
+        if game.preview != state.preview:
+            state.preview = game.preview
+            flags |= PREVIEW
+            parts.append(bytes(TILE_CODES[type] for type in state.preview))
+
+        values = stats_values(game.stats)
+        if values != stats_values(state.stats):
+            state.stats = game_statistics(values[0], list(values[1:5]), values[5], values[6], list(values[7:11]), list(values[11:13]))
+            flags |= STATS
+            parts.append(encode_stats(values))
+
+        if game.game_ended != state.game_ended:
+            state.game_ended = game.game_ended
+            flags |= GAME_OVER
+            parts.append(bytes((state.game_ended,)))
+
+        if not flags:
+            return b''
+        return self.frame(DELTA, flags, parts)
+
+    # The whole state as of the last published frame
+    def keyframe(self) -> bytes:
+        state = self.state
+        parts = [ROW_HEADER.pack(RENDERED_GRID_HEIGHT)]
+        parts.extend(ROW_HEADER.pack(row) + encode_row(state.grid[row]) for row in range(RENDERED_GRID_HEIGHT))
+        parts.append(self.encode_piece())
+        parts.append(bytes((TILE_CODES[state.hold],)))
+        parts.append(bytes(TILE_CODES[type] for type in state.preview))
+        parts.append(encode_stats(stats_values(state.stats)))
+        parts.append(bytes((state.game_ended,)))
+        return self.frame(KEYFRAME, ROWS | PIECE | HOLD | PREVIEW | STATS | GAME_OVER, parts)
+
+    def encode_piece(self) -> bytes:
+        type, rotation, x, y, ghost_y = self.state.piece
+        return PIECE_BODY.pack(TILE_CODES[type], rotation, x, y, ghost_y)
+
+    def frame(self, kind: int, flags: int, parts: list[bytes]) -> bytes:
+        body = b''.join(parts)
+        return FRAME_HEADER.pack(len(body) + 2, kind, flags) + body
+
+
+class Subscriber:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        # Frames waiting to be sent, offset is how much of the first one has been sent
+        self.queue = deque()
+        self.offset = 0
+        # Every subscriber starts with a keyframe
+        self.needs_keyframe = True
+        self.last_progress = perf_counter()
+
+
+# Applies a frame (without its length) to a SpectatorState, deltas are ignored until the first keyframe
+def apply_frame(state: SpectatorState, data: bytes):
+    kind, flags = data[0], data[1]
+    if kind == DELTA and not state.keyframes:
+        return
+    state.frames += 1
+    if kind == KEYFRAME:
+        state.keyframes += 1
+    offset = 2
+
+    if flags & ROWS:
+        count = data[offset]
+        offset += 1
+        for i in range(count):
+            state.grid[data[offset]] = decode_row(data[offset + 1:offset + 1 + ROW_BYTES])
+            offset += 1 + ROW_BYTES
+    if flags & PIECE:
+        type, rotation, x, y, ghost_y = PIECE_BODY.unpack_from(data, offset)
+        state.piece = (TILE_TYPES[type], rotation, x, y, ghost_y)
+        offset += PIECE_BODY.size
+    if flags & HOLD:
+        state.hold = TILE_TYPES[data[offset]]
+        offset += 1
+    if flags & PREVIEW:
+        state.preview = tuple(TILE_TYPES[code] for code in data[offset:offset + PREVIEW_COUNT])
+        offset += PREVIEW_COUNT
+    if flags & STATS:
+        values = []
+        for i in range(STATS_COUNT):
+            value, offset = read_varint(data, offset)
+            values.append(value)
+        state.stats = game_statistics(values[0], values[1:5], values[5], values[6], values[7:11], values[11:13])
+    if flags & GAME_OVER:
+        state.game_ended = bool(data[offset])
+
+
+# Reads frames from any number of publishers (each is one game), poll() applies everything received so far
+class SpectatorClient:
+    def __init__(self, addresses: list[tuple[str, int]]):
+        self.selector = selectors.DefaultSelector()
+        # (address, SpectatorState) of each game, in the order given
+        self.games = []
+        for address in addresses:
+            state = SpectatorState()
+            try:
+                sock = socket.create_connection(address)
+            except OSError:
+                state.game_ended = True
+                self.games.append((address, state))
+                continue
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ, (state, bytearray()))
+            self.games.append((address, state))
+
+    def poll(self, timeout: float = 0):
+        for key, events in self.selector.select(timeout):
+            state, buffer = key.data
+            try:
+                data = key.fileobj.recv(65536)
+            except BlockingIOError:
+                continue
+            except OSError:
+                data = b''
+            if not data:
+                self.selector.unregister(key.fileobj)
+                key.fileobj.close()
+                continue
+            buffer += data
+            offset = 0
+            while offset + 2 <= len(buffer):
+                length = buffer[offset] | buffer[offset + 1] << 8
+                if offset + 2 + length > len(buffer):
+                    break
+                apply_frame(state, bytes(buffer[offset + 2:offset + 2 + length]))
+                offset += 2 + length
+            del buffer[:offset]
+
+    def close(self):
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+        self.selector.close()
+
+
+# Text rendering of a state for the terminal dashboard, one string per line
+def render_text(state: SpectatorState, title: str) -> list[str]:
+    cells = [[tile[:1] if tile != GARBAGE_TILE else '#' for tile in row] for row in state.grid[:RENDERED_GRID_HEIGHT]]
+    type, rotation, x, y, ghost_y = state.piece
+    if type and not state.game_ended:
+        from srs import SHAPES
+        for dx, dy in SHAPES[type][rotation].tiles:
+            if 0 <= ghost_y + dy < RENDERED_GRID_HEIGHT and not cells[ghost_y + dy][x + dx]:
+                cells[ghost_y + dy][x + dx] = '+'
+            if 0 <= y + dy < RENDERED_GRID_HEIGHT:
+                cells[y + dy][x + dx] = type
+    lines = [title[:GRID_DIMS[0] + 2].ljust(GRID_DIMS[0] + 2)]
+    lines.extend('|' + ''.join(cell or '.' for cell in row) + '|' for row in reversed(cells))
+    lines.append(f'{state.stats.score:>{GRID_DIMS[0] + 2}}')
+    lines.append(f'L{state.stats.level} {state.stats.total_clears}l'.ljust(GRID_DIMS[0] + 2) if not state.game_ended else 'GAME OVER'.ljust(GRID_DIMS[0] + 2))
+    return lines
+
+
+# Parses 'host:port' or 'host:first-last' into a list of (host, port)
+def parse_addresses(values: list[str]) -> list[tuple[str, int]]:
+    addresses = []
+    for value in values:
+        host, ports = value.rsplit(':', 1)
+        first, last = ports.split('-') if '-' in ports else (ports, ports)
+        addresses.extend((host, port) for port in range(int(first), int(last) + 1))
+    return addresses
+
+
+def watch(addresses: list[tuple[str, int]], columns: int, refresh: float):
+    client = SpectatorClient(addresses)
+    try:
+        while True:
+            end = perf_counter() + refresh
+            while perf_counter() < end:
+                client.poll(max(0, end - perf_counter()))
+            output = ['\033[H\033[J']
+            for start in range(0, len(client.games), columns):
+                boards = [render_text(state, f'{address[1]}') for address, state in client.games[start:start + columns]]
+                for line in zip(*boards):
+                    output.append(' '.join(line))
+                output.append('')
+            print('\n'.join(output), flush=True)
+    except KeyboardInterrupt:
+        client.close()
+
+
+# Plays bot games forever (a new game starts when one ends), publishing each piece, pieces_per_second limits the speed so it can be watched
+def run_bot(job: tuple):
+    from engine import GameEngine
+    from policies import POLICIES
+    from time import sleep
+
+    port, policy_name, seed, pieces_per_second = job
+    publisher = SpectatorPublisher('localhost', port)
+    policy = POLICIES[policy_name](seed) if policy_name == 'random' else POLICIES[policy_name]()
+    game = GameEngine(seed=seed)
+    game.setup()
+    while True:
+        start = perf_counter()
+        if game.game_ended:
+            game.seed += 1
+            game.setup()
+        for action in policy(game):
+            game.press(action)
+            if action == 'move_down':
+                game.tick()
+            game.release(action)
+            if game.game_ended:
+                break
+        publisher.publish(game)
+        if pieces_per_second:
+            sleep(max(0, 1 / pieces_per_second - (perf_counter() - start)))
+
+
+def main():
+    import argparse
+    from multiprocessing import Pool
+
+    parser = argparse.ArgumentParser(description='Watch Pytris games, see main.py --spectate-port')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    watch_parser = commands.add_parser('watch', help='show games in the terminal')
+    watch_parser.add_argument('addresses', nargs='+', help='HOST:PORT or HOST:FIRST-LAST of each game')
+    watch_parser.add_argument('-c', '--columns', type=int, default=8, help='games per line')
+    watch_parser.add_argument('--refresh', type=float, default=0.25, help='seconds between redraws')
+
+    bots_parser = commands.add_parser('bots', help='play bot games that can be watched, each on its own port')
+    bots_parser.add_argument('-n', '--games', type=int, default=8)
+    bots_parser.add_argument('--port', type=int, default=9000, help='port of the first game, each game uses the next port')
+    bots_parser.add_argument('-p', '--policy', default='heuristic')
+    bots_parser.add_argument('--pps', type=float, default=5, help='pieces per second of each game (0 for no limit)')
+    args = parser.parse_args()
+
+    if args.command == 'watch':
+        watch(parse_addresses(args.addresses), args.columns, args.refresh)
+    else:
+        print(f'Publishing {args.games} games on ports {args.port}-{args.port + args.games - 1}')
+        with Pool(args.games) as pool:
+            pool.map(run_bot, [(args.port + i, args.policy, i, args.pps) for i in range(args.games)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+from dataclasses import dataclass
+from globals import GRID_DIMS, OFFSETS, SPAWN_POSITIONS
+
+# Super Rotation System tables (see DESIGN.md), precomputed once at import so rotating a piece is only lookups and collision checks
+
+
+# Rotates tile positions (relative to the center) clockwise the given number of times: (x, y) -> (y, -x)
+def rotate_shape(shape: tuple, steps: int) -> tuple:
+    for i in range(steps % 4):
+        shape = tuple((y, -x) for x, y in shape)
+    return shape
+
+
+# A piece in one rotation, pieces store a reference to one of these instead of their own tile lists
+@dataclass(frozen=True, slots=True)
+class Shape:
+    # The position of each tile relative to the center of the piece
+    tiles: tuple
+    # masks[x] is a tuple of (dy, row bitmask) for each row the shape covers when its center is in column x,
+    # columns where part of the shape would be outside the grid are not included
+    masks: dict
+    # The lowest and highest dy of any tile
+    bottom: int
+    top: int
+    # (dx, lowest dy) for each column the shape covers, used with the column heights to find where a piece lands
+    columns: tuple
+
+
+def create_shape(tiles: tuple) -> Shape:
+    masks = {}
+    for x in range(GRID_DIMS[0]):
+        if all(0 <= x + dx < GRID_DIMS[0] for dx, dy in tiles):
+            masks[x] = tuple(
+                (dy, sum(1 << (x + tile[0]) for tile in tiles if tile[1] == dy))
+                for dy in sorted(set(tile[1] for tile in tiles)))
+    columns = tuple(
+        (dx, min(tile[1] for tile in tiles if tile[0] == dx))
+        for dx in sorted(set(tile[0] for tile in tiles)))
+    return Shape(tiles, masks, min(dy for dx, dy in tiles), max(dy for dx, dy in tiles), columns)
+
+
+# SHAPES[type][rotation] is the Shape of a piece in the given rotation
+# The tiles are in the same order as SPAWN_POSITIONS for every rotation
+SHAPES = {
+    type: tuple(create_shape(rotate_shape(tuple(map(tuple, positions)), rotation)) for rotation in range(4))
+    for type, positions in SPAWN_POSITIONS.items()
+}
+
+# ROTATIONS[type][rotation][steps] = (new rotation, new shape, kicks)
+# steps is 1 (clockwise) or -1 (counter-clockwise), kicks are the translations to test in order (i.e. the wall kicks),
+# the index of the first kick that results in a valid position is the rotation point
+ROTATIONS = {
+    type: tuple({
+        steps: (
+            (rotation + steps) % 4,
+            SHAPES[type][(rotation + steps) % 4],
+            tuple(
+                (OFFSETS[type][rotation][test][0] - OFFSETS[type][(rotation + steps) % 4][test][0],
+                 OFFSETS[type][rotation][test][1] - OFFSETS[type][(rotation + steps) % 4][test][1])
+                for test in range(len(OFFSETS[type][0]))))
+        for steps in (1, -1)}
+        for rotation in range(4))
+    for type in SPAWN_POSITIONS
+}
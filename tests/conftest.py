@@ -0,0 +1,5 @@
+import sys
+from os.path import dirname, realpath
+
+# The game's modules are imported from the repository's root (like running them as scripts)
+sys.path.insert(0, dirname(dirname(realpath(__file__))))
@@ -0,0 +1,48 @@
+from engine import GameEngine
+from policies import HeuristicPolicy
+import pytest
+from randomizer import RANDOMIZERS
+
+
+def play(game, pieces: int):
+    policy = HeuristicPolicy()
+    for piece in range(pieces):
+        # Holding changes which pieces the randomizer has dealt
+        actions = ['hold'] + policy(game) if piece % 4 == 1 else policy(game)
+        for action in actions:
+            game.press(action)
+            game.release(action)
+
+
+@pytest.mark.parametrize('randomizer', list(RANDOMIZERS))
+def test_undo_redo(randomizer):
+    game = GameEngine(seed=8, randomizer=randomizer, practice=True)
+    game.setup()
+    play(game, 12)
+    states = [game.save_state()]
+    for i in range(6):
+        game.undo()
+        states.append(game.save_state())
+    assert states[-1].pieces_placed == states[0].pieces_placed - 6
+    for state in reversed(states[:-1]):
+        game.redo()
+        assert game.save_state() == state
+
+
+@pytest.mark.parametrize('randomizer', list(RANDOMIZERS))
+def test_randomizer_rewind(randomizer):
+    pieces = RANDOMIZERS[randomizer](3)
+    pieces.keep_history = True
+    dealt = [pieces.next() for i in range(30)]
+
+    pieces.rewind(10)
+    assert pieces.position() == 10
+    assert pieces.peek(5) == tuple(dealt[10:15])
+    # Forward again, past the pieces that were put back in the queue
+    pieces.rewind(25)
+    assert [pieces.next() for i in range(5)] == dealt[25:]
+    pieces.rewind(0)
+    assert [pieces.next() for i in range(30)] == dealt
+    pieces.rewind(50)
+    fresh = RANDOMIZERS[randomizer](3)
+    assert pieces.next() == fresh.generate(51)[-1]
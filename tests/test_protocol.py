@@ -0,0 +1,70 @@
+import dataclasses
+from engine import GameEngine
+from globals import FULL_ROW, GRID_DIMS
+from policies import HeuristicPolicy
+import protocol
+import pytest
+
+
+# Every BoardDelta of a game with line clears and garbage, and the game's board after each of them
+@pytest.fixture(scope='module')
+def deltas():
+    game = GameEngine(seed=5)
+    game.setup()
+    placed = []
+    game.placement_callback = lambda delta: placed.append((delta, list(game.rows)))
+    policy = HeuristicPolicy()
+    for piece in range(80):
+        if piece % 5 == 2:
+            game.receive_garbage(2, piece % 10)
+        for action in policy(game):
+            game.press(action)
+            game.release(action)
+        if game.game_ended:
+            break
+    return placed
+
+
+def test_delta_round_trip(deltas):
+    assert any(delta.cleared for delta, rows in deltas)
+    assert any(delta.garbage for delta, rows in deltas)
+    for sequence, (delta, rows) in enumerate(deltas):
+        assert protocol.decode_delta(protocol.encode_delta(sequence, delta)) == (sequence, delta)
+
+
+# The server's copy of a board (see versus.py) stays the same as the player's
+def test_apply_delta_matches_game(deltas):
+    rows = [0] * GRID_DIMS[1]
+    for sequence, (delta, game_rows) in enumerate(deltas):
+        sequence, delta = protocol.decode_delta(protocol.encode_delta(sequence, delta))
+        assert protocol.apply_delta(rows, delta)
+        assert rows == game_rows
+
+
+def test_apply_delta_rejects_invalid(deltas):
+    delta = deltas[0][0]
+    rows = [0] * GRID_DIMS[1]
+    protocol.apply_delta(rows, delta)
+    before = rows[:]
+    for invalid in (delta, dataclasses.replace(delta, y=GRID_DIMS[1]), dataclasses.replace(delta, cleared=(0,)),
+                    dataclasses.replace(delta, garbage=((1, GRID_DIMS[0]),))):
+        with pytest.raises(ValueError):
+            protocol.apply_delta(rows, invalid)
+        assert rows == before
+
+    # A full row that wasn't cleared
+    rows = [FULL_ROW] + [0] * (GRID_DIMS[1] - 1)
+    with pytest.raises(ValueError):
+        protocol.apply_delta(rows, dataclasses.replace(deltas[0][0], y=deltas[0][0].y + 1, cleared=()))
+
+
+def test_varint_round_trip():
+    buffer = bytearray()
+    values = [0, 1, 127, 128, 300, 2 ** 32, 2 ** 40 + 5]
+    for value in values:
+        protocol.write_varint(buffer, value)
+    offset = 0
+    for value in values:
+        read, offset = protocol.read_varint(buffer, offset)
+        assert read == value
+    assert offset == len(buffer)
@@ -0,0 +1,75 @@
+from engine import GameEngine
+from policies import HeuristicPolicy
+import pytest
+from recording import replay
+from replayfile import ReplayReader, ReplayWriter
+
+PIECES = 60
+
+
+# Plays pieces with the heuristic policy, letting a tick pass between inputs and adding garbage now and then
+def play(game, pieces: int, writer=None):
+    policy = HeuristicPolicy()
+    for piece in range(pieces):
+        if piece % 7 == 3:
+            game.receive_garbage(1 + piece % 3, piece % 10)
+        for action in policy(game):
+            game.press(action)
+            game.tick()
+            game.release(action)
+            if writer:
+                writer.update()
+            if game.game_ended:
+                return
+
+
+@pytest.fixture(scope='module')
+def replay_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('replays') / 'game.ptr')
+    game = GameEngine(seed=11)
+    game.setup()
+    writer = ReplayWriter(game, path, keyframe_interval=8)
+    play(game, PIECES, writer)
+    writer.close()
+    return path, game
+
+
+def test_recording_round_trip(replay_path):
+    path, game = replay_path
+    with ReplayReader(path) as reader:
+        recording = reader.recording()
+    assert reader.pieces == game.pieces_placed
+    assert recording.inputs == game.recording.inputs
+    assert recording.garbage == game.recording.garbage
+    assert replay(recording).save_state() == game.save_state()
+
+
+@pytest.mark.parametrize('piece', [0, 1, 7, 8, 9, 31, 32, 33, PIECES - 1])
+def test_seek_matches_full_replay(replay_path, piece):
+    path, game = replay_path
+    with ReplayReader(path) as reader:
+        piece = min(piece, reader.pieces)
+        seeked = reader.seek(piece)
+        full = replay(reader.recording(), pieces=piece)
+    assert seeked.pieces_placed == piece
+    assert seeked.save_state() == full.save_state()
+
+
+def test_seek_practice_game(tmp_path):
+    path = str(tmp_path / 'practice.ptr')
+    game = GameEngine(seed=4, practice=True)
+    game.setup()
+    writer = ReplayWriter(game, path, keyframe_interval=4)
+    play(game, 10, writer)
+    # Undoing is recorded as an input, so it is replayed
+    for i in range(2):
+        game.press('undo')
+        game.release('undo')
+    writer.update()
+    play(game, 5, writer)
+    writer.close()
+
+    with ReplayReader(path) as reader:
+        assert replay(reader.recording()).save_state() == game.save_state()
+        for piece in (3, reader.pieces):
+            assert reader.seek(piece).save_state() == replay(reader.recording(), pieces=piece).save_state()
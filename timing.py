@@ -0,0 +1,84 @@
+from collections import deque
+from time import perf_counter
+
+# Per-frame timing for the timing HUD (see MyGame.toggle_timing_hud())
+# Methods are only wrapped while the HUD is enabled, so timing costs nothing when it is off
+
+# Sections in the order they are shown, 'frame' is the time between frames, the others are the time spent in each method per frame
+SECTIONS = ['frame', 'update', 'draw', 'redraw_grid', 'update_text', 'on_resize', 'update_ghost', 'rotate_active', 'place_piece']
+
+
+class FrameTimer:
+    def __init__(self, frames: int):
+        # Number of frames the statistics are calculated over
+        self.frames = frames
+        # Times (in seconds) of each section for the last frames
+        self.history = {section: deque(maxlen=frames) for section in SECTIONS}
+        # Input latency of the last inputs (this is appended to by GameEngine.apply_inputs(), not next_frame())
+        self.history['input_latency'] = deque(maxlen=frames)
+        # Times of the frame in progress
+        self.current = dict.fromkeys(SECTIONS, 0.0)
+        self.frame_start = None
+        # (object, attribute) of each wrapped method
+        self.wrapped = []
+
+    # Replaces obj.name with a function that adds the time spent in it to the current frame
+    # The wrapper is stored on the instance, so removing it (see unwrap_all()) restores the original method
+    def wrap(self, obj, name: str, section: str = None):
+        method = getattr(obj, name)
+        current = self.current
+        section = section or name
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                current[section] += perf_counter() - start
+
+        setattr(obj, name, timed)
+        self.wrapped.append((obj, name))
+
+    def unwrap_all(self):
+        for obj, name in self.wrapped:
+            delattr(obj, name)
+        self.wrapped.clear()
+
+    # Called at the start of each frame, stores the times of the previous frame
+    def next_frame(self):
+        now = perf_counter()
+        if self.frame_start is not None:
+            self.current['frame'] = now - self.frame_start
+            for section in SECTIONS:
+                self.history[section].append(self.current[section])
+                self.current[section] = 0.0
+        self.frame_start = now
+
+    # (min, average, 99th percentile) of a section in seconds
+    def summary(self, section: str) -> tuple[float, float, float]:
+        times = self.history[section]
+        if not times:
+            return 0.0, 0.0, 0.0
+        ordered = sorted(times)
+        return ordered[0], sum(ordered) / len(ordered), ordered[min(len(ordered) - 1, round(0.99 * (len(ordered) - 1)))]
+
+
+# Time taken by each phase of starting the game, printed by main.py --startup-benchmark
+class StartupTimer:
+    def __init__(self, start: float):
+        # perf_counter() when main.py started running (interpreter startup is not included)
+        self.start = start
+        self.last = start
+        # (phase, seconds) in the order the phases finished
+        self.phases = []
+
+    # Ends the current phase, each phase is the time since the previous one ended
+    def mark(self, phase: str):
+        now = perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self) -> str:
+        lines = [f'{phase:<14}{seconds * 1000:9.2f} ms' for phase, seconds in self.phases]
+        lines.append(f'{"first frame":<14}{(self.last - self.start) * 1000:9.2f} ms')
+        return '\n'.join(lines)
@@ -0,0 +1,419 @@
+from engine import GameEngine
+from globals import GRID_DIMS
+from policies import POLICIES
+import protocol
+from random import Random, randrange
+from randomizer import DEFAULT_RANDOMIZER
+import selectors
+import socket
+from time import perf_counter
+
+# Versus mode over TCP, players (or bots) send garbage to each other by clearing lines
+# The server relays messages between players and keeps a copy of every board built from their BoardDeltas (see protocol.py),
+# it decides who garbage is sent to and where its hole is, so a match only depends on the server's seed
+# e.g. python versus.py local --players 2 --policy heuristic (a server and bots in separate processes on localhost)
+
+DEFAULT_PORT = 7777
+# Seconds the server waits for players to close their connections after the match ends (see VersusServer.drain())
+DRAIN_TIMEOUT = 5
+
+
+# A player connected to the server
+class Connection:
+    def __init__(self, sock: socket.socket, player: int):
+        self.sock = sock
+        self.player = player
+        self.name = ''
+        # The player has sent HELLO (names can be empty)
+        self.joined = False
+        self.reader = protocol.MessageReader()
+        # Bytes waiting to be sent
+        self.output = bytearray()
+        # Copy of the player's board (one bitmask per row, like GameEngine.rows)
+        self.rows = [0] * GRID_DIMS[1]
+        self.alive = True
+        self.pieces = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+
+class VersusServer:
+    def __init__(self, host: str = 'localhost', port: int = DEFAULT_PORT, players: int = 2, seed: int = None,
+                 randomizer: str = DEFAULT_RANDOMIZER, relay_boards: bool = True):
+        self.players = players
+        self.seed = seed if seed is not None else randrange(2 ** 32)
+        # Garbage targets and holes are chosen with this, separately from the players' piece order
+        self.random = Random(self.seed)
+        self.randomizer = randomizer
+        # Send every player's pieces to the other players (so they can show their opponents' boards), bots don't need this
+        self.relay_boards = relay_boards
+
+        self.listener = socket.create_server((host, port))
+        self.listener.setblocking(False)
+        # The port actually used (port 0 picks a free one)
+        self.port = self.listener.getsockname()[1]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.connections = []
+        # Player ids in the order they topped out
+        self.losers = []
+        self.started = False
+        self.finished = False
+
+    # Runs until the match ends (or until timeout seconds have passed), returns the winner's player id (None if nobody won)
+    def serve(self, timeout: float = None) -> int:
+        end = None if timeout is None else perf_counter() + timeout
+        while not self.finished and (end is None or perf_counter() < end):
+            for key, events in self.selector.select(0.5):
+                if key.fileobj is self.listener:
+                    self.accept()
+                    continue
+                connection = key.data
+                if events & selectors.EVENT_READ:
+                    self.read(connection)
+                if events & selectors.EVENT_WRITE:
+                    self.flush(connection)
+        self.drain()
+        self.close()
+        return self.winner()
+
+    # Sends what is left (e.g. END) and waits until every player has closed their connection (or timeout seconds have passed)
+    # Players can still be sending pieces when the match ends, closing a socket with unread data resets the connection, which can
+    # discard END before the player reads it
+    def drain(self, timeout: float = DRAIN_TIMEOUT):
+        end = perf_counter() + timeout
+        with selectors.DefaultSelector() as selector:
+            for connection in self.connections:
+                try:
+                    connection.sock.setblocking(True)
+                    connection.sock.sendall(connection.output)
+                    connection.sock.shutdown(socket.SHUT_WR)
+                    connection.sock.setblocking(False)
+                except OSError:
+                    continue
+                selector.register(connection.sock, selectors.EVENT_READ)
+            # Everything received now is discarded, the player is done when it closes its side
+            while selector.get_map() and perf_counter() < end:
+                for key, events in selector.select(end - perf_counter()):
+                    try:
+                        data = key.fileobj.recv(65536)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        data = b''
+                    if not data:
+                        selector.unregister(key.fileobj)
+
+    def close(self):
+        for connection in self.connections:
+            connection.sock.close()
+        self.selector.close()
+        self.listener.close()
+
+    def accept(self):
+        sock, address = self.listener.accept()
+        if self.started or len(self.connections) >= self.players:
+            sock.close()
+            return
+        sock.setblocking(False)
+        # Messages are small and sent one at a time, so they shouldn't wait to be combined with later ones
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = Connection(sock, len(self.connections))
+        self.connections.append(connection)
+        self.selector.register(sock, selectors.EVENT_READ, connection)
+
+    def read(self, connection: Connection):
+        try:
+            data = connection.sock.recv(65536)
+        except ConnectionError:
+            data = b''
+        if not data:
+            self.selector.unregister(connection.sock)
+            # A player that disconnects loses
+            self.eliminate(connection)
+            return
+        connection.bytes_received += len(data)
+        for message_type, body in connection.reader.feed(data):
+            self.handle(connection, message_type, body)
+
+    def handle(self, connection: Connection, message_type: int, body: bytes):
+        if message_type == protocol.HELLO:
+            connection.name = protocol.decode(message_type, body)[0]
+            connection.joined = True
+            if all(other.joined for other in self.connections) and len(self.connections) == self.players:
+                self.started = True
+                for other in self.connections:
+                    self.send(other, protocol.start(other.player, self.players, self.seed, self.randomizer))
+
+        elif message_type == protocol.PIECE and connection.alive:
+            sequence, delta = protocol.decode_delta(body)
+            connection.pieces += 1
+            self.send(connection, protocol.ack(sequence))
+            try:
+                alive = protocol.apply_delta(connection.rows, delta)
+            except ValueError:
+                # The piece doesn't fit the server's copy of the board, the player's game can't be trusted anymore
+                alive = False
+            if not alive:
+                self.eliminate(connection)
+                return
+            if self.relay_boards:
+                message = protocol.opponent(connection.player, body)
+                for other in self.connections:
+                    if other is not connection:
+                        self.send(other, message)
+            if delta.attack:
+                targets = [other for other in self.connections if other.alive and other is not connection]
+                if targets:
+                    self.send(self.random.choice(targets), protocol.garbage(connection.player, delta.attack, self.random.randrange(GRID_DIMS[0])))
+
+        elif message_type == protocol.GAME_OVER:
+            self.eliminate(connection)
+
+    # Removes a player from the match, the match ends when one player is left
+    def eliminate(self, connection: Connection):
+        if not connection.alive:
+            return
+        connection.alive = False
+        self.losers.append(connection.player)
+        place = self.players - len(self.losers) + 1
+        for other in self.connections:
+            self.send(other, protocol.player_out(connection.player, place))
+
+        alive = [other for other in self.connections if other.alive]
+        if len(alive) <= 1:
+            for other in self.connections:
+                self.send(other, protocol.end(self.winner()))
+            self.finished = True
+
+    def winner(self) -> int:
+        alive = [connection.player for connection in self.connections if connection.alive]
+        return alive[0] if len(alive) == 1 else None
+
+    def send(self, connection: Connection, message: bytes):
+        connection.output += message
+        self.flush(connection)
+
+    # Sends as much of the connection's output as the socket accepts, the rest is sent when the socket is writable
+    def flush(self, connection: Connection):
+        if connection.output:
+            try:
+                sent = connection.sock.send(connection.output)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                connection.output.clear()
+                return
+            connection.bytes_sent += sent
+            del connection.output[:sent]
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if connection.output else selectors.EVENT_READ
+        try:
+            if self.selector.get_key(connection.sock).events != events:
+                self.selector.modify(connection.sock, events, connection)
+        except (KeyError, ValueError, RuntimeError):
+            pass
+
+
+# A player's connection to the server, polled by the game loop (nothing blocks except join())
+class VersusClient:
+    def __init__(self, host: str = 'localhost', port: int = DEFAULT_PORT):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = protocol.MessageReader()
+        # Messages that haven't been sent yet
+        self.output = bytearray()
+        self.sequence = 0
+        # Send time of each PIECE that hasn't been acknowledged yet, by sequence number
+        self.sent_times = {}
+        # Round trip time (in seconds) of every acknowledged piece
+        self.latencies = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.pieces = 0
+        self.player = None
+        self.winner = None
+        self.ended = False
+
+    # Messages are queued and sent as the socket accepts them (the socket is non-blocking during the match), see flush()
+    def send(self, message: bytes):
+        self.output += message
+        self.flush()
+
+    # Sends as much of the output as the socket accepts, the rest is sent by the next poll()
+    # The match is over for this player if the server closed the connection (e.g. pieces sent after the server sent END)
+    def flush(self):
+        while self.output:
+            try:
+                sent = self.sock.send(self.output)
+            except BlockingIOError:
+                return
+            except OSError:
+                self.output.clear()
+                self.ended = True
+                return
+            self.bytes_sent += sent
+            del self.output[:sent]
+
+    # Sends the player's name and waits for the match to start, returns (player id, number of players, seed, randomizer)
+    # Raises ConnectionError if the server closes the connection before the match starts
+    def join(self, name: str) -> tuple[int, int, int, str]:
+        self.send(protocol.hello(name))
+        while not self.ended:
+            for message_type, values in self.poll():
+                if message_type == protocol.START:
+                    self.player = values[0]
+                    self.sock.setblocking(False)
+                    return values
+        raise ConnectionError('The server closed the connection before the match started')
+
+    # Used as GameEngine.placement_callback
+    # Pieces placed after the match ended (e.g. by the winner) aren't sent
+    def send_piece(self, delta):
+        if self.ended:
+            return
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        self.sent_times[self.sequence] = perf_counter()
+        self.pieces += 1
+        self.send(protocol.piece(self.sequence, delta))
+
+    def game_over(self, reason: str):
+        self.send(protocol.game_over(reason))
+
+    # Returns every message received since the last poll as (message type, decoded values), ACKs are handled here
+    # This only waits for messages before the match starts and after the player is out (when the socket is blocking)
+    def poll(self) -> list[tuple[int, tuple]]:
+        self.flush()
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            return []
+        except OSError:
+            data = b''
+        if not data:
+            self.ended = True
+            return []
+        self.bytes_received += len(data)
+        messages = []
+        for message_type, body in self.reader.feed(data):
+            values = protocol.decode(message_type, body)
+            if message_type == protocol.ACK:
+                sent = self.sent_times.pop(values[0], None)
+                if sent is not None:
+                    self.latencies.append(perf_counter() - sent)
+                continue
+            if message_type == protocol.END:
+                self.ended = True
+                self.winner = values[0]
+            messages.append((message_type, values))
+        return messages
+
+    def close(self):
+        self.sock.close()
+
+    # Pieces, bytes per piece and latency percentiles, for printing after a match
+    def summary(self) -> str:
+        latencies = sorted(self.latencies)
+        percentile = lambda p: latencies[min(len(latencies) - 1, round(p / 100 * (len(latencies) - 1)))] * 1000 if latencies else 0
+        pieces = max(1, self.pieces)
+        return (f'{self.pieces} pieces, {self.bytes_sent / pieces:.1f} bytes sent and {self.bytes_received / pieces:.1f} received per piece, '
+                f'latency p50 {percentile(50):.3f} ms, p99 {percentile(99):.3f} ms')
+
+
+# Plays a match with a policy (see policies.py) as fast as possible, returns (player id, winner, pieces per second, client summary)
+def play_bot(host: str, port: int, name: str, policy_name: str = 'heuristic', max_pieces: int = 10000) -> tuple:
+    client = VersusClient(host, port)
+    player, players, seed, randomizer = client.join(name)
+    policy = POLICIES[policy_name](seed + player) if policy_name == 'random' else POLICIES[policy_name]()
+    game = GameEngine(seed=seed, randomizer=randomizer)
+    game.placement_callback = client.send_piece
+    game.setup()
+
+    start = perf_counter()
+    pieces = 0
+    while not client.ended and not game.game_ended and pieces < max_pieces:
+        for message_type, values in client.poll():
+            if message_type == protocol.GARBAGE:
+                game.receive_garbage(values[1], values[2])
+        for action in policy(game):
+            game.press(action)
+            if action == 'move_down':
+                game.tick()
+            game.release(action)
+            if game.game_ended:
+                break
+        pieces += 1
+    elapsed = perf_counter() - start
+
+    if not client.ended:
+        client.game_over(game.game_over_reason or 'Piece Limit')
+        # Wait for the result (and the acknowledgements of the last pieces)
+        client.sock.setblocking(True)
+        while not client.ended:
+            client.poll()
+    client.close()
+    return player, client.winner, pieces / elapsed, client.summary()
+
+
+def run_server(port: int, players: int, seed: int, randomizer: str, ready):
+    server = VersusServer('localhost', port, players, seed, randomizer, relay_boards=True)
+    ready.put(server.port)
+    server.serve()
+
+
+def run_bot(job: tuple) -> tuple:
+    return play_bot(*job)
+
+
+def main():
+    import argparse
+    from multiprocessing import Pool, Process, Queue
+
+    parser = argparse.ArgumentParser(description='Pytris versus mode over TCP')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    server_parser = commands.add_parser('server', help='host a match')
+    server_parser.add_argument('--host', default='localhost')
+    server_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    server_parser.add_argument('-n', '--players', type=int, default=2)
+    server_parser.add_argument('--seed', type=int)
+    server_parser.add_argument('--randomizer', default=DEFAULT_RANDOMIZER)
+
+    bot_parser = commands.add_parser('bot', help='join a match with a bot')
+    bot_parser.add_argument('--host', default='localhost')
+    bot_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    bot_parser.add_argument('--name', default='bot')
+    bot_parser.add_argument('-p', '--policy', choices=POLICIES.keys(), default='heuristic')
+    bot_parser.add_argument('--max-pieces', type=int, default=10000)
+
+    local_parser = commands.add_parser('local', help='run a server and bots on localhost and print their throughput and latency')
+    local_parser.add_argument('-n', '--players', type=int, default=2)
+    local_parser.add_argument('-p', '--policy', choices=POLICIES.keys(), default='heuristic')
+    local_parser.add_argument('--seed', type=int, default=0)
+    local_parser.add_argument('--randomizer', default=DEFAULT_RANDOMIZER)
+    local_parser.add_argument('--max-pieces', type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.command == 'server':
+        server = VersusServer(args.host, args.port, args.players, args.seed, args.randomizer)
+        print(f'Waiting for {args.players} players on port {server.port} (seed {server.seed})')
+        winner = server.serve()
+        print(f'Winner: {winner}')
+
+    elif args.command == 'bot':
+        player, winner, rate, summary = play_bot(args.host, args.port, args.name, args.policy, args.max_pieces)
+        print(f'Player {player}, winner {winner}, {rate:.0f} pieces/s\n{summary}')
+
+    else:
+        ready = Queue()
+        server = Process(target=run_server, args=(0, args.players, args.seed, args.randomizer, ready))
+        server.start()
+        port = ready.get()
+        with Pool(args.players) as pool:
+            results = pool.map(run_bot, [('localhost', port, f'bot {i}', args.policy, args.max_pieces) for i in range(args.players)])
+        server.join()
+        for player, winner, rate, summary in sorted(results):
+            print(f'Player {player}{" (winner)" if player == winner else ""}: {rate:.0f} pieces/s, {summary}')
+
+
+if __name__ == '__main__':
+    main()